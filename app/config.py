@@ -33,7 +33,42 @@ GIGACHAT_MAX_TOKENS = int(os.getenv("GIGACHAT_MAX_TOKENS", "1024"))
 DB_PATH = os.getenv("DB_PATH", "db/chat_history.db")
 CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "db/chroma_db")
 # --- Переменная для подключения к базе данных ---
+# Например: postgresql+asyncpg://user:password@db:5432/nobugs. Если не задана — локальный SQLite.
 DATABASE_URL = os.getenv("DATABASE_URL")
+# --- Настройки SQLite и пула соединений (пул используется и для PostgreSQL) ---
+# Профиль PRAGMA: "performance" (WAL, synchronous=NORMAL) или "default" (без настроек)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Через сколько секунд пересоздавать соединение с PostgreSQL
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Отложенная запись истории диалога: раз в N миллисекунд или по M сообщений
+HISTORY_FLUSH_INTERVAL_MS = int(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "200"))
+HISTORY_FLUSH_MAX_ROWS = int(os.getenv("HISTORY_FLUSH_MAX_ROWS", "100"))
+# Кэш последних реплик диалога в памяти: сообщений на пользователя, TTL и общий лимит памяти
+HISTORY_CACHE_TURNS = int(os.getenv("HISTORY_CACHE_TURNS", "20"))
+HISTORY_CACHE_TTL_SECONDS = int(os.getenv("HISTORY_CACHE_TTL_SECONDS", "1800"))
+HISTORY_CACHE_MAX_MB = int(os.getenv("HISTORY_CACHE_MAX_MB", "16"))
+# Хранение истории: сообщения старше N дней сворачиваются в сводку (последние M реплик не трогаются)
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+HISTORY_RETENTION_KEEP_LAST = int(os.getenv("HISTORY_RETENTION_KEEP_LAST", "10"))
+HISTORY_RETENTION_CHUNK = int(os.getenv("HISTORY_RETENTION_CHUNK", "200"))
+HISTORY_RETENTION_INTERVAL_SECONDS = int(os.getenv("HISTORY_RETENTION_INTERVAL_SECONDS", "3600"))
+# Максимальная длина сводки диалога в символах
+HISTORY_SUMMARY_MAX_CHARS = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "1500"))
+# Сколько страниц SQLite возвращать системе за один проход очистки
+SQLITE_INCREMENTAL_VACUUM_PAGES = int(os.getenv("SQLITE_INCREMENTAL_VACUUM_PAGES", "2000"))
+# Кэш профиля пользователя и его активных уроков: время жизни записи и максимум записей
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# Как часто (в секундах) сверять счетчик зачисленных учеников с базой
+ENROLLMENT_RECONCILE_SECONDS = int(os.getenv("ENROLLMENT_RECONCILE_SECONDS", "300"))
+# Выгрузка для аналитики: не выгружать инкрементально строки моложе N секунд (см. app/db/export.py)
+EXPORT_SAFETY_LAG_SECONDS = int(os.getenv("EXPORT_SAFETY_LAG_SECONDS", "300"))
 
 # --- Окружение и логирование ---
 ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
@@ -42,6 +77,36 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 # --- CRM Bitrix24 (опционально) ---
 BITRIX24_WEBHOOK_URL = os.getenv("BITRIX24_WEBHOOK_URL")
 BITRIX24_RESPONSIBLE_ID = int(os.getenv("BITRIX24_RESPONSIBLE_ID", "1"))
+# Общий HTTP-клиент Битрикс24: размер пула, время жизни простаивающего соединения, HTTP/2
+B24_MAX_CONNECTIONS = int(os.getenv("B24_MAX_CONNECTIONS", "10"))
+B24_MAX_KEEPALIVE = int(os.getenv("B24_MAX_KEEPALIVE", "5"))
+B24_KEEPALIVE_EXPIRY = float(os.getenv("B24_KEEPALIVE_EXPIRY", "60"))
+B24_HTTP2 = os.getenv("B24_HTTP2", "false").lower() == "true"
+# Для коробочных версий с самоподписанным сертификатом проверка SSL выключена
+B24_VERIFY_SSL = os.getenv("B24_VERIFY_SSL", "false").lower() == "true"
+# Таймаут запроса по умолчанию, секунд (для отдельных методов задается в b24_client.METHOD_TIMEOUTS)
+B24_TIMEOUT_SECONDS = float(os.getenv("B24_TIMEOUT_SECONDS", "15"))
+# Ограничение частоты запросов к Битрикс24 (0 — без ограничения): запросов в секунду и запас подряд
+B24_RATE_LIMIT_RPS = float(os.getenv("B24_RATE_LIMIT_RPS", "2"))
+B24_RATE_LIMIT_BURST = int(os.getenv("B24_RATE_LIMIT_BURST", "4"))
+# Повторы при QUERY_LIMIT_EXCEEDED: число попыток, начальная и максимальная задержка, секунд
+B24_RATE_LIMIT_RETRIES = int(os.getenv("B24_RATE_LIMIT_RETRIES", "4"))
+B24_RATE_LIMIT_BACKOFF_BASE = float(os.getenv("B24_RATE_LIMIT_BACKOFF_BASE", "0.5"))
+B24_RATE_LIMIT_BACKOFF_MAX = float(os.getenv("B24_RATE_LIMIT_BACKOFF_MAX", "8"))
+# Сколько календарей преподавателей запрашивать одновременно
+B24_CALENDAR_CONCURRENCY = int(os.getenv("B24_CALENDAR_CONCURRENCY", "5"))
+# Кэш свободных слотов: сколько секунд запись свежая и сколько еще отдается, пока обновляется в фоне
+AVAILABILITY_TTL_SECONDS = float(os.getenv("AVAILABILITY_TTL_SECONDS", "30"))
+AVAILABILITY_STALE_SECONDS = float(os.getenv("AVAILABILITY_STALE_SECONDS", "120"))
+# Рабочее время для записи на уроки: часы, дни недели (0 — понедельник), шаг сетки слотов и перерыв между уроками
+AVAILABILITY_WORK_START = os.getenv("AVAILABILITY_WORK_START", "10:00")
+AVAILABILITY_WORK_END = os.getenv("AVAILABILITY_WORK_END", "18:00")
+AVAILABILITY_WORK_DAYS = [int(day) for day in os.getenv("AVAILABILITY_WORK_DAYS", "0,1,2,3,4").split(",") if day.strip().isdigit()]
+AVAILABILITY_SLOT_STEP_MINUTES = int(os.getenv("AVAILABILITY_SLOT_STEP_MINUTES", "60"))
+AVAILABILITY_BUFFER_MINUTES = int(os.getenv("AVAILABILITY_BUFFER_MINUTES", "0"))
+# Справочник преподавателей (имя, ID календаря): файл и период обновления из Битрикс24, секунд
+TEACHER_DIRECTORY_PATH = os.getenv("TEACHER_DIRECTORY_PATH", "db/teacher_directory.json")
+TEACHER_DIRECTORY_REFRESH_SECONDS = int(os.getenv("TEACHER_DIRECTORY_REFRESH_SECONDS", "21600"))
 #TEACHER_IDS = int(os.getenv("TEACHER_IDS"))
 teacher_ids_str = os.getenv("TEACHER_IDS", "")
 TEACHER_IDS = [int(teacher_id.strip()) for teacher_id in teacher_ids_str.split(',') if teacher_id.strip().isdigit()]
@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
 from typing import Dict, Any
-import pymorphy3 # Импортируем библиотеку для работы с морфологией
+from app.utils.morph import get_morph # Общий для всего процесса морфологический анализатор
 
 # --- Код движка правил (без изменений) ---
 RULES_PATH = Path(__file__).parent.parent / "knowledge_base" / "rules" / "business_rules.json"
@@ -11,9 +11,6 @@ try:
 except (FileNotFoundError, json.JSONDecodeError):
     BUSINESS_RULES = {"rules": [], "default_outcome": {}}
 
-# Инициализируем морфологический анализатор
-morph = pymorphy3.MorphAnalyzer()
-
 def _check_condition(condition: Dict, data: Dict) -> bool:
     """Универсальная функция для проверки одного условия."""
     key_to_check = condition.get("key")
@@ -64,9 +61,13 @@ def process_final_data(data: Dict[str, Any]) -> Dict[str, Any]:
     
     # Обрабатываем имя ребенка
     child_name = processed_data.get("child_name", "")
-    if child_name:
+    child_name_forms = processed_data.get("child_name_forms") or {}
+    if child_name and child_name_forms.get('datv'):
+        # Формы имени уже посчитаны при сохранении анкеты
+        processed_data['child_name_dative'] = child_name_forms['datv']
+    elif child_name:
         # Находим первую (наиболее вероятную) форму слова
-        parsed_name = morph.parse(child_name)[0]
+        parsed_name = get_morph().parse(child_name)[0]
         # Пытаемся получить дательный падеж ('кому?'), если его нет - именительный
         dative_name = parsed_name.inflect({'datv'}) or parsed_name.inflect({'nomn'})
         
@@ -9,6 +9,7 @@ from app.config import (
     KEYWORDS_PATH, DISTANCE_THRESHOLD
 )
 from app.knowledge_base.loader import vectorstore, SYSTEM_PROMPT
+from app.db.retention import extractive_summary
 
 
 CLASSIFIER_PROMPT = """
@@ -118,9 +119,12 @@ async def is_query_relevant_ai(question: str, history: List[Dict[str, str]]) ->
     
     
 # --- AI-ГЕНЕРАТОР ---
-def _build_prompt(context: str, history: List[Dict[str, str]], context_key: str = "default") -> List[BaseMessage]:
+def _build_prompt(
+    context: str, history: List[Dict[str, str]], context_key: str = "default", summary: str | None = None
+) -> List[BaseMessage]:
     """
-    Формирует промпт, добавляя в него указание на текущий контекст.
+    Формирует промпт, добавляя в него указание на текущий контекст
+    и сводку старой части диалога, если она есть.
     """
     full_system_prompt = f"{SYSTEM_PROMPT}\n\n"
 
@@ -136,6 +140,12 @@ def _build_prompt(context: str, history: List[Dict[str, str]], context_key: str
         f"{context}\n"
         f"--- КОНЕЦ КОНТЕКСТА ---"
     )
+    if summary:
+        full_system_prompt += (
+            f"\n\n--- КРАТКОЕ СОДЕРЖАНИЕ ПРЕДЫДУЩЕГО ДИАЛОГА ---\n"
+            f"{summary}\n"
+            f"--- КОНЕЦ КРАТКОГО СОДЕРЖАНИЯ ---"
+        )
     
     messages: List[BaseMessage] = [SystemMessage(content=full_system_prompt)]
     
@@ -147,7 +157,9 @@ def _build_prompt(context: str, history: List[Dict[str, str]], context_key: str
             
     return messages
 
-async def get_llm_response(question: str, history: List[Dict[str, str]], context_key: str = "default") -> str:
+async def get_llm_response(
+    question: str, history: List[Dict[str, str]], context_key: str = "default", summary: str | None = None
+) -> str:
     """
     Получает развернутый ответ от "умной" LLM, учитывая контекст диалога.
     """
@@ -160,7 +172,7 @@ async def get_llm_response(question: str, history: List[Dict[str, str]], context
         context = "\n---\n".join([doc.page_content for doc in docs]) if docs else "Информация по данному вопросу в базе знаний отсутствует."
 
         # Шаг 2: Формируем правильный промпт, передавая контекст
-        prompt_messages = _build_prompt(context, history, context_key)
+        prompt_messages = _build_prompt(context, history, context_key, summary)
         prompt_messages.append(HumanMessage(content=question))
         
         # Шаг 3: Делаем запрос к AI
@@ -184,3 +196,29 @@ async def get_llm_response(question: str, history: List[Dict[str, str]], context
         logging.error(f"Ошибка при обращении к GigaChat: {e}", exc_info=True)
         return "К сожалению, произошла техническая ошибка. Пожалуйста, попробуйте позже."
 
+
+# --- AI-СВОДКА ДИАЛОГА ---
+async def summarize_dialog(previous_summary: str | None, messages: List[Dict[str, str]]) -> str:
+    """
+    Сводчик для задачи очистки истории: дополняет предыдущую сводку старыми репликами.
+    Если GigaChat недоступен или вернул ошибку — сводка без LLM.
+    """
+    if not gigachat:
+        return await extractive_summary(previous_summary, messages)
+
+    dialog = "\n".join(
+        f"{'Клиент' if m['role'] == 'user' else 'Ассистент'}: {m['content']}" for m in messages
+    )
+    summary_prompt = (
+        "Ты ведешь краткое содержание переписки онлайн-школы программирования с клиентом. "
+        "Дополни текущее краткое содержание новыми сообщениями. Сохрани факты о ребенке (имя, возраст, опыт), "
+        "интересующие курсы, договоренности и нерешенные вопросы. Не более 10 предложений, без приветствий.\n"
+        f"Текущее краткое содержание: {previous_summary or 'нет'}\n"
+        f"Новые сообщения:\n{dialog}"
+    )
+    try:
+        response = await gigachat.ainvoke([SystemMessage(content=summary_prompt)], max_tokens=400)
+        return response.content.strip()
+    except Exception as e:
+        logging.error(f"Ошибка при составлении сводки диалога: {e}. Используется сводка без LLM.")
+        return await extractive_summary(previous_summary, messages)
@@ -1,12 +1,12 @@
 import random
 import yaml
-import re
 import logging
 from typing import List, Dict, Tuple
 from pathlib import Path
-# Импортируем функцию для подсчета учеников
-from app.db.database import get_enrolled_student_count
-from app.utils.text_tools import inflect_name
+# Счетчик учеников хранится в памяти, поэтому ответ по шаблону не ходит в БД
+from app.services.enrollment_counter import enrollment_counter
+from app.utils.normalization import NormalizedMessage, normalize_message, prepare_keywords, find_keyword_intent
+from app.utils.template_compiler import compile_template, precompile
 
 # Предполагается, что ваш файл templates.py находится здесь
 # и в нем есть переменная TEMPLATES
@@ -16,6 +16,13 @@ try:
 except ImportError:
     logging.error("Не удалось импортировать TEMPLATES из app.knowledge_base.documents.templates")
     TEMPLATES = {}
+
+# Разбираем все шаблоны на сегменты один раз при загрузке модуля
+logging.info(f"Скомпилировано строк шаблонов: {precompile(TEMPLATES)}.")
+
+# Значения по умолчанию для пустых переменных в шаблонах
+TEMPLATE_DEFAULTS = {"parent_name": "Уважаемый родитель"}
+
 INTENT_KEYWORDS = {}
 try:
     # Строим правильный путь к файлу в папке config
@@ -29,53 +36,56 @@ try:
 except Exception as e:
     logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить keywords.yaml. {e}")
 
-def find_template_by_keywords(query_text: str) -> Tuple[str, dict | None] | tuple[None, None]:
+# Ключевые слова нормализуются один раз при загрузке, а не на каждый запрос (леммы — при первом сравнении)
+INTENT_KEYWORD_PHRASES = {
+    intent: prepare_keywords(data.get('keywords', []))
+    for intent, data in (INTENT_KEYWORDS or {}).items()
+}
+
+def find_template_by_keywords(query: str | NormalizedMessage) -> Tuple[str, dict | None] | tuple[None, None]:
     """
     Ищет интент и соответствующий ему шаблон, используя единую базу keywords.yaml.
     Умеет искать как по ключевым словам (для текста), так и по точным ключам (для кнопок).
     """
+    message = query if isinstance(query, NormalizedMessage) else normalize_message(query)
+    query_text = message.original
     query_lower = query_text.lower()
     logging.info(f"--- НАЧАЛО ПОИСКА ШАБЛОНА для запроса: '{query_lower}' ---")
+    # Сначала проверяем точное совпадение по ключу от кнопки
     for intent, data in INTENT_KEYWORDS.items():
-        logging.debug(f"Проверяю интент: '{intent}'...")
-        # Сначала проверяем точное совпадение по ключу от кнопки
         if 'callback_keys' in data and query_lower in data.get('callback_keys', []):
             logging.info(f"✅ УСПЕХ: Найден интент '{intent}' по точному ключу кнопки '{query_lower}'.")
-            template = TEMPLATES.get(intent)
-            if template:
-                logging.info(f"Шаблон для интента '{intent}' успешно найден в TEMPLATES.")
-                return intent, template
-            else:
-                logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Интент '{intent}' есть в keywords.yaml, но для него нет шаблона в TEMPLATES!")
-                return None, None
-
-        # Затем проверяем по ключевым словам для текстовых запросов
-        for keyword in data.get('keywords', []):
-            if keyword in query_lower:
-                logging.info(f"✅ УСПЕХ: Найден интент '{intent}' по ключевому слову '{keyword}'.")
-                template = TEMPLATES.get(intent)
-                if template:
-                    logging.info(f"Шаблон для интента '{intent}' успешно найден в TEMPLATES.")
-                    return intent, template
-                else:
-                    logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Интент '{intent}' есть в keywords.yaml, но для него нет шаблона в TEMPLATES!")
-                    return None, None
+            return _template_for(intent)
+
+    # Затем по ключевым словам для текстовых запросов: точные совпадения всех интентов важнее совпадений по леммам
+    found = find_keyword_intent(message, INTENT_KEYWORD_PHRASES)
+    if found:
+        intent, phrase = found
+        logging.info(f"✅ УСПЕХ: Найден интент '{intent}' по ключевому слову '{phrase}'.")
+        return _template_for(intent)
 
     logging.warning(f"❌ ПРОВАЛ: Не удалось найти интент для запроса: '{query_text}' после проверки всех правил.")
     logging.info("--- КОНЕЦ ПОИСКА ШАБЛОНА ---")
     return None, None
 
+def _template_for(intent: str) -> Tuple[str, dict | None] | tuple[None, None]:
+    template = TEMPLATES.get(intent)
+    if template:
+        logging.info(f"Шаблон для интента '{intent}' успешно найден в TEMPLATES.")
+        return intent, template
+    logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Интент '{intent}' есть в keywords.yaml, но для него нет шаблона в TEMPLATES!")
+    return None, None
+
 async def build_template_response(template_data: dict | list, history: List[Dict], user_data: dict) -> str:
     """
     Собирает "умный" ответ из шаблона, анализируя историю, данные пользователя и счетчик учеников.
     """
-    print("!!! ЗАПУЩЕНА ПРАВИЛЬНАЯ ВЕРСИЯ build_template_response ИЗ TEMPLATE_SERVICE !!!")
     if isinstance(template_data, list):
         return random.choice(template_data)
 
     if isinstance(template_data, dict):
         response_parts = []
-        enrolled_count = await get_enrolled_student_count()
+        enrolled_count = await enrollment_counter.get()
 
         if greetings := template_data.get("greeting"):
             response_parts.append(random.choice(greetings))
@@ -91,31 +101,12 @@ async def build_template_response(template_data: dict | list, history: List[Dict
         if follow_ups := template_data.get("follow_up"):
             response_parts.append(random.choice(follow_ups))
 
-        full_response_template = "\n\n".join(filter(None, response_parts))
-
-        # --- ЛОГИКА ОБРАБОТКИ ПЛЕЙСХОЛДЕРОВ ---
-        def replace_placeholder(match):
-            placeholder = match.group(1)
-            parts = placeholder.split(':')
-            var_name = parts[0]  # например, 'child_name'
-            case = parts[1] if len(parts) > 1 else None  # например, 'datv' или None
-
-            # Подставляем имя родителя по умолчанию, если оно не найдено
-            if var_name == 'parent_name' and not user_data.get(var_name):
-                 value = "Уважаемый родитель"
-            else:
-                value = user_data.get(var_name, '')
-            
-            # Если указан падеж и есть значение, склоняем его
-            if case and value:
-                return inflect_name(value, case)
-            else:
-                return str(value)
-
-        # Находим все плейсхолдеры вида {variable:case} или {variable} и заменяем их
-        processed_response = re.sub(r'\{([^}]+)\}', replace_placeholder, full_response_template)
-        
-        return processed_response
+        # Шаблоны уже разобраны на сегменты: остается только склеить их с данными пользователя
+        data = user_data or {}
+        return "\n\n".join(
+            compile_template(part).render(data, defaults=TEMPLATE_DEFAULTS)
+            for part in response_parts if part
+        )
         
     return "Не удалось сформировать ответ по шаблону."
 
@@ -1,83 +1,202 @@
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Tuple
 
-from sqlalchemy.orm import selectinload
-from sqlalchemy import update, select, delete, func, desc, asc
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import event, update, select, delete, func, desc, asc, case
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 # Импортируем наши модели, включая Enum статусов
-from .models import Base, User, DialogHistory, TrialLesson, TrialLessonStatus
+from .models import Base, User, DialogHistory, DialogSummary, TrialLesson, TrialLessonStatus
+from .history_buffer import history_buffer
+from .history_cache import history_cache
+from .user_cache import user_cache
+from .queries import history_query, active_lessons_query
+from .engine import resolve_database_url, create_engine_for, insert_for
+from .migrate import run_migrations
+from .query_plans import check_query_plans
+from app.config import DATABASE_URL as CONFIGURED_DATABASE_URL
 
 
 # --- Инициализация ---
 
-DATABASE_URL = "sqlite+aiosqlite:///app/db/local_database.db"
-async_engine = create_async_engine(DATABASE_URL)
+# DATABASE_URL из .env (PostgreSQL для нескольких воркеров); без него — локальный SQLite
+DATABASE_URL = resolve_database_url(CONFIGURED_DATABASE_URL)
+async_engine = create_engine_for(DATABASE_URL)
 async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
 
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    Короткая единица работы: одна сессия на несколько чтений и записей и один коммит на выходе
+    (при исключении — откат). Внутри блока не должно быть сетевых вызовов (LLM, Telegram,
+    Битрикс24): пока блок открыт, он держит соединение из пула, а на SQLite — еще и блокировку записи.
+    """
+    async with async_session_factory() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        await session.commit()
+
+
+@asynccontextmanager
+async def _session_scope(session: AsyncSession | None) -> AsyncIterator[Tuple[AsyncSession, bool]]:
+    """
+    Возвращает (сессия, своя_ли_она). Если передана сессия вызывающего кода (unit_of_work),
+    функция работает в ней и не коммитит: коммит будет один — на выходе из unit_of_work.
+    Иначе открывается собственная короткая сессия, как раньше.
+    """
+    if session is not None:
+        yield session, False
+        return
+    async with async_session_factory() as own_session:
+        yield own_session, True
+
+
+def _invalidate_after_commit(session: AsyncSession, telegram_id: int | None = None, user_id: int | None = None):
+    """
+    Сбрасывает запись кэша пользователей после коммита сессии. Если сбросить раньше, параллельный
+    get_or_create_user успеет положить в кэш старую, еще не измененную строку.
+    """
+    session.info.setdefault("invalidate_users", []).append((telegram_id, user_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(sync_session: Session):
+    for telegram_id, user_id in sync_session.info.pop("invalidate_users", []):
+        user_cache.invalidate(telegram_id=telegram_id, user_id=user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _on_rollback(sync_session: Session, previous_transaction):
+    # Изменения откатились — кэш остается верным
+    sync_session.info.pop("invalidate_users", None)
+
 async def init_db():
-    """Инициализирует базу данных: создает файл и все необходимые таблицы."""
+    """Инициализирует базу данных: применяет миграции Alembic до последней версии."""
     try:
         async with async_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logging.info("Соединение с базой данных успешно установлено и таблицы проверены/созданы.")
+            await conn.run_sync(run_migrations)
+            await conn.run_sync(check_query_plans)
+        logging.info("Соединение с базой данных успешно установлено, схема обновлена до последней миграции.")
     except SQLAlchemyError as e:
         logging.error(f"Критическая ошибка SQLAlchemy при инициализации базы данных: {e}", exc_info=True)
         raise
 
 # --- Функции для работы с пользователем ---
 
-async def get_or_create_user(telegram_id: int, username: str | None) -> User:
-    """Находит пользователя по telegram_id или создает нового, если он не найден."""
-    async with async_session_factory() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
+async def get_or_create_user(telegram_id: int, username: str | None, session: AsyncSession | None = None) -> User:
+    """
+    Находит пользователя по telegram_id или создает нового, если он не найден.
+    Сначала смотрит в кэш пользователей, поэтому повторные вызовы в рамках апдейта не ходят в БД.
+    """
+    cached = user_cache.get_user(telegram_id)
+    if cached is not None:
+        return cached
+    # Номер берем до чтения: если строку успеют изменить, устаревшая копия в кэш не попадет
+    generation = user_cache.generation()
+    async with _session_scope(session) as (session, _owned):
+        query = select(User).where(User.telegram_id == telegram_id)
+        user = (await session.execute(query)).scalar_one_or_none()
         if not user:
-            user = User(telegram_id=telegram_id, username=username)
-            session.add(user)
+            # Несколько воркеров могут одновременно создавать одного пользователя: атомарный
+            # INSERT ... ON CONFLICT DO NOTHING RETURNING вернет строку только тому, кто ее вставил
+            stmt = (
+                insert_for(async_engine, User)
+                .values(telegram_id=telegram_id, username=username, onboarding_completed=False,
+                        is_enrolled=False, is_blocked=False, irrelevant_count=0)
+                .on_conflict_do_nothing(index_elements=["telegram_id"])
+                .returning(User)
+            )
+            user = (await session.execute(stmt)).scalar_one_or_none()
+            # Создание пользователя фиксируем сразу даже в общей сессии: это происходит один раз,
+            # а незакрытая запись в SQLite заблокировала бы записи из других сессий этого же апдейта
             await session.commit()
-            await session.refresh(user)
-            logging.info(f"Создан новый пользователь с telegram_id: {telegram_id}")
+            if user is not None:
+                logging.info(f"Создан новый пользователь с telegram_id: {telegram_id}")
+            else:
+                # Пользователя только что создал параллельный запрос
+                user = (await session.execute(query)).scalar_one()
+        user_cache.put_user(user, generation)
         return user
 
-async def save_user_details(telegram_id: int, data: dict):
+async def save_user_details(telegram_id: int, data: dict, session: AsyncSession | None = None):
     """Универсально сохраняет любые собранные данные пользователя в его JSON-поле."""
-    async with async_session_factory() as session:
+    async with _session_scope(session) as (session, owned):
         stmt = update(User).where(User.telegram_id == telegram_id).values(user_data=data)
         await session.execute(stmt)
-        await session.commit()
+        _invalidate_after_commit(session, telegram_id=telegram_id)
+        if owned:
+            await session.commit()
         logging.info(f"Данные для пользователя {telegram_id} успешно сохранены в БД.")
 
-async def set_onboarding_completed(telegram_id: int, status: bool = True):
+async def set_onboarding_completed(telegram_id: int, status: bool = True, session: AsyncSession | None = None):
     """Устанавливает флаг завершения онбординга для пользователя."""
-    async with async_session_factory() as session:
+    async with _session_scope(session) as (session, owned):
         stmt = update(User).where(User.telegram_id == telegram_id).values(onboarding_completed=status)
         await session.execute(stmt)
-        await session.commit()
+        _invalidate_after_commit(session, telegram_id=telegram_id)
+        if owned:
+            await session.commit()
         logging.info(f"Статус онбординга для пользователя {telegram_id} изменен на {status}.")
 
 # --- Функции для истории диалога ---
 
-async def save_history(user_id: int, role: str, content: str):
-    """Сохраняет одно сообщение в историю диалога."""
-    async with async_session_factory() as session:
+async def save_history(user_id: int, role: str, content: str, session: AsyncSession | None = None):
+    """
+    Сохраняет одно сообщение в историю диалога.
+    Если запущен буфер истории, сообщение уходит в него и записывается пакетом в фоне.
+    Иначе — напрямую; в общей сессии INSERT уйдет вместе с коммитом в конце апдейта.
+    """
+    history_cache.append(user_id, role, content)
+    if history_buffer.running:
+        history_buffer.add(user_id, role, content)
+        return
+    async with _session_scope(session) as (session, owned):
         history_entry = DialogHistory(user_id=user_id, role=role, message=content)
         session.add(history_entry)
-        await session.commit()
+        if owned:
+            await session.commit()
 
-async def load_history(user_id: int, limit: int = 10) -> List[Dict[str, str]]:
-    """Загружает последние сообщения из истории диалога в формате, понятном для LLM."""
-    async with async_session_factory() as session:
-        result = await session.execute(
-            select(DialogHistory)
-            .where(DialogHistory.user_id == user_id)
-            .order_by(desc(DialogHistory.created_at))
-            .limit(limit)
-        )
-        history = result.scalars().all()
-        return [{"role": msg.role, "content": msg.message} for msg in reversed(history)]
+async def load_history(user_id: int, limit: int = 10, session: AsyncSession | None = None) -> List[Dict[str, str]]:
+    """
+    Загружает последние сообщения из истории диалога в формате, понятном для LLM.
+    Сначала смотрит в кэш последних реплик; при промахе читает БД (сразу на весь размер кэша)
+    и добавляет в конец сообщения, которые еще лежат в буфере записи.
+    """
+    cached = history_cache.get(user_id, limit)
+    if cached is not None:
+        return cached
+
+    fetch_limit = max(limit, history_cache.max_turns)
+    # Буфер читаем до и после запроса: строки, записанные в БД во время запроса, есть в первом
+    # снимке, а сохраненные во время запроса — во втором. То, что уже вернула БД, ниже отбрасываем
+    pending = history_buffer.pending_for(user_id)
+    async with _session_scope(session) as (session, _owned):
+        result = await session.execute(history_query(user_id, fetch_limit))
+        rows = list(reversed(result.scalars().all()))
+    seen = {id(row) for row in pending}
+    pending.extend(row for row in history_buffer.pending_for(user_id) if id(row) not in seen)
+    stored = {(msg.role, msg.message, msg.created_at) for msg in rows}
+    history = [{"role": msg.role, "content": msg.message} for msg in rows]
+    history.extend(
+        {"role": row["role"], "content": row["message"]}
+        for row in pending if (row["role"], row["message"], row["created_at"]) not in stored
+    )
+    # Если БД вернула меньше, чем просили, в кэше вся история пользователя
+    history_cache.fill(user_id, history, complete=len(rows) < fetch_limit)
+    return history[-limit:]
+
+async def load_summary(user_id: int, session: AsyncSession | None = None) -> str | None:
+    """Возвращает сводку старой части диалога, если задача очистки истории ее уже составила."""
+    async with _session_scope(session) as (session, _owned):
+        result = await session.execute(select(DialogSummary.summary).where(DialogSummary.user_id == user_id))
+        return result.scalar_one_or_none()
 
 # --- Функции для пробных уроков ---
 
@@ -94,6 +213,7 @@ async def add_trial_lesson(user_id: int, task_id: int, event_id: int, teacher_id
         )
         session.add(new_lesson)
         await session.commit()
+        user_cache.invalidate(user_id=user_id)
         logging.info(f"В БД сохранена запись на урок для user_id={user_id} с task_id={task_id}")
 
 
@@ -105,45 +225,38 @@ async def update_trial_lesson_time(lesson_id: int, new_scheduled_at: datetime):
                 update(TrialLesson)
                 .where(TrialLesson.id == lesson_id)
                 .values(scheduled_at=new_scheduled_at)
+                .returning(TrialLesson.user_id)
             )
-            await session.execute(stmt)
+            user_id = (await session.execute(stmt)).scalar_one_or_none()
             await session.commit()
+            user_cache.invalidate(user_id=user_id)
             logging.info(f"Время урока с ID {lesson_id} успешно обновлено на {new_scheduled_at}.")
         except SQLAlchemyError as e:
             logging.error(f"Ошибка БД при обновлении времени урока {lesson_id}: {e}")
             await session.rollback()
 
-async def get_active_lesson(user_id: int) -> TrialLesson | None:
+async def get_active_lesson(user_id: int, session: AsyncSession | None = None) -> TrialLesson | None:
     """Находит ближайший будущий запланированный урок."""
-    async with async_session_factory() as session:
-        stmt = (
-            select(TrialLesson)
-            # --- ИЗМЕНЕНИЕ 1: Используем Enum вместо строк ---
-            .where(
-                TrialLesson.user_id == user_id,
-                TrialLesson.status.notin_([TrialLessonStatus.CANCELLED, TrialLessonStatus.COMPLETED])
-            )
-            .order_by(TrialLesson.scheduled_at.asc())
-            .limit(1)
-        )
+    cached = user_cache.get_lessons(user_id)
+    if cached is not None:
+        return cached[0] if cached else None
+    async with _session_scope(session) as (session, _owned):
+        stmt = active_lessons_query(user_id).limit(1)
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
 
-async def get_all_active_lessons(user_id: int) -> List[TrialLesson]:
+async def get_all_active_lessons(user_id: int, session: AsyncSession | None = None) -> List[TrialLesson]:
     """Возвращает список всех активных (не отмененных) уроков пользователя."""
-    async with async_session_factory() as session:
-        query = (
-            select(TrialLesson)
-            # --- ИЗМЕНЕНИЕ 2: Используем Enum вместо строк ---
-            .where(
-                TrialLesson.user_id == user_id,
-                TrialLesson.status.notin_([TrialLessonStatus.CANCELLED, TrialLessonStatus.COMPLETED])
-            )
-            .options(selectinload(TrialLesson.user))
-            .order_by(TrialLesson.scheduled_at.asc())
-        )
+    cached = user_cache.get_lessons(user_id)
+    if cached is not None:
+        return cached
+    generation = user_cache.generation()
+    async with _session_scope(session) as (session, _owned):
+        query = active_lessons_query(user_id).options(selectinload(TrialLesson.user))
         result = await session.execute(query)
-        return result.scalars().all()
+        lessons = result.scalars().all()
+    user_cache.put_lessons(user_id, lessons, generation)
+    return lessons
 
 async def get_lesson_by_id(lesson_id: int) -> TrialLesson | None:
     """Находит конкретный урок по его ID, сразу подгружая связанного пользователя."""
@@ -156,29 +269,56 @@ async def get_lesson_by_id(lesson_id: int) -> TrialLesson | None:
 async def cancel_lesson_db(lesson_id: int):
     """Меняет статус урока на 'CANCELLED' в базе данных."""
     async with async_session_factory() as session:
-        stmt = update(TrialLesson).where(TrialLesson.id == lesson_id).values(status=TrialLessonStatus.CANCELLED)
-        await session.execute(stmt)
+        stmt = (
+            update(TrialLesson)
+            .where(TrialLesson.id == lesson_id)
+            .values(status=TrialLessonStatus.CANCELLED)
+            .returning(TrialLesson.user_id)
+        )
+        user_id = (await session.execute(stmt)).scalar_one_or_none()
         await session.commit()
+        user_cache.invalidate(user_id=user_id)
         logging.info(f"Статус урока с ID {lesson_id} изменен на 'Отменен'.")
 
 # --- Функции для модерации и статистики ---
 
-async def increment_irrelevant_count(user_id: int) -> int:
-    """Увеличивает счетчик нерелевантных запросов пользователя на 1."""
-    async with async_session_factory() as session:
-        user = await session.get(User, user_id)
-        if not user: return 0
-        user.irrelevant_count = (user.irrelevant_count or 0) + 1
-        new_count = user.irrelevant_count
-        await session.commit()
-        return new_count
+async def increment_irrelevant_count(
+    user_id: int, block_limit: int | None = None, session: AsyncSession | None = None
+) -> Tuple[int, bool]:
+    """
+    Атомарно увеличивает счетчик нерелевантных запросов на 1 и, если задан block_limit,
+    блокирует пользователя при достижении лимита — все одним UPDATE ... RETURNING.
+    Возвращает (новое значение счетчика, заблокирован ли пользователь).
+    """
+    new_count = func.coalesce(User.irrelevant_count, 0) + 1
+    values = {"irrelevant_count": new_count}
+    if block_limit is not None:
+        values["is_blocked"] = case((new_count >= block_limit, True), else_=User.is_blocked)
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(User.irrelevant_count, User.is_blocked)
+        # Объекты в сессии не синхронизируем: запись кэша сбрасывается после коммита
+        .execution_options(synchronize_session=False)
+    )
+    async with _session_scope(session) as (session, owned):
+        row = (await session.execute(stmt)).one_or_none()
+        _invalidate_after_commit(session, user_id=user_id)
+        if owned:
+            await session.commit()
+    if row is None:
+        return 0, False
+    return row.irrelevant_count, bool(row.is_blocked)
 
-async def block_user(user_id: int):
+async def block_user(user_id: int, session: AsyncSession | None = None):
     """Устанавливает флаг is_blocked = True для пользователя."""
-    async with async_session_factory() as session:
+    async with _session_scope(session) as (session, owned):
         stmt = update(User).where(User.id == user_id).values(is_blocked=True)
         await session.execute(stmt)
-        await session.commit()
+        _invalidate_after_commit(session, user_id=user_id)
+        if owned:
+            await session.commit()
         logging.info(f"Пользователь с ID {user_id} был заблокирован.")
 
 async def unblock_and_reset_user(telegram_id: int) -> bool:
@@ -187,6 +327,7 @@ async def unblock_and_reset_user(telegram_id: int) -> bool:
         stmt = update(User).where(User.telegram_id == telegram_id).values(is_blocked=False, irrelevant_count=0)
         result = await session.execute(stmt)
         await session.commit()
+        user_cache.invalidate(telegram_id=telegram_id)
         return result.rowcount > 0
 
 async def get_enrolled_student_count() -> int:
@@ -195,3 +336,22 @@ async def get_enrolled_student_count() -> int:
         query = select(func.count(User.id)).where(User.is_enrolled == True)
         result = await session.execute(query)
         return result.scalar_one_or_none() or 0
+
+async def set_user_enrolled(telegram_id: int, status: bool = True) -> bool:
+    """
+    Меняет флаг зачисления на курс.
+    Возвращает True, только если значение действительно изменилось.
+    """
+    async with async_session_factory() as session:
+        stmt = (
+            update(User)
+            .where(User.telegram_id == telegram_id, User.is_enrolled != status)
+            .values(is_enrolled=status)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        user_cache.invalidate(telegram_id=telegram_id)
+        changed = result.rowcount > 0
+        if changed:
+            logging.info(f"Статус зачисления пользователя {telegram_id} изменен на {status}.")
+        return changed
@@ -0,0 +1,88 @@
+# app/db/engine.py
+
+import logging
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from .sqlite_tuning import build_pragmas, install_sqlite_pragmas
+from .stats import install_query_counter
+from app.config import (
+    SQLITE_PROFILE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+)
+
+# Локальная база по умолчанию: используется, если DATABASE_URL не задан (разработка, тесты)
+SQLITE_FALLBACK_URL = "sqlite+aiosqlite:///app/db/local_database.db"
+
+# Синхронные схемы подключения заменяем на асинхронные драйверы
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+# Диалекты, которые умеет бот: для них есть INSERT ... ON CONFLICT (см. insert_for)
+_UPSERT_INSERTS = {
+    "postgresql": pg_insert,
+    "sqlite": sqlite_insert,
+}
+
+
+def resolve_database_url(url: str | None) -> str:
+    """Возвращает строку подключения с асинхронным драйвером; без DATABASE_URL — локальный SQLite."""
+    if not url:
+        return SQLITE_FALLBACK_URL
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def create_engine_for(url: str) -> AsyncEngine:
+    """
+    Создает движок с настройками под диалект:
+    SQLite — PRAGMA из профиля и небольшой пул; PostgreSQL (asyncpg) — пул с проверкой
+    соединений и их периодическим пересозданием, чтобы не упираться в таймауты сервера.
+    Неподдерживаемая СУБД в DATABASE_URL — ошибка сразу при запуске, а не на первом запросе.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend not in _UPSERT_INSERTS:
+        raise ValueError(
+            f"СУБД '{backend}' из DATABASE_URL не поддерживается; допустимы: {', '.join(sorted(_UPSERT_INSERTS))}"
+        )
+    pool_options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if backend == "postgresql":
+        engine = create_async_engine(
+            url,
+            pool_pre_ping=True,
+            pool_recycle=DB_POOL_RECYCLE,
+            connect_args={"server_settings": {"application_name": "nobugs_bot"}},
+            **pool_options,
+        )
+    else:
+        engine = create_async_engine(url, **pool_options)
+        install_sqlite_pragmas(
+            engine,
+            build_pragmas(SQLITE_PROFILE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS),
+        )
+    install_query_counter(engine)
+    logging.info(f"База данных: {make_url(url).render_as_string(hide_password=True)}")
+    return engine
+
+
+def insert_for(engine: AsyncEngine, table):
+    """
+    INSERT с поддержкой ON CONFLICT для текущего диалекта (SQLite и PostgreSQL
+    поддерживают одинаковый синтаксис on_conflict_do_nothing / on_conflict_do_update).
+    Принимает таблицу или ORM-модель; для модели работает .returning(Model).
+    """
+    dialect_insert = _UPSERT_INSERTS.get(engine.dialect.name)
+    if dialect_insert is None:
+        # create_engine_for такой движок не создаст; сюда попадает только чужой движок
+        raise ValueError(f"Upsert не поддерживается для диалекта {engine.dialect.name}")
+    return dialect_insert(table)
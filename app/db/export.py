@@ -0,0 +1,231 @@
+# app/db/export.py
+#
+# Потоковая выгрузка dialog_history, users и trial_lessons для аналитики воронки
+# без копирования живого файла базы. Таблицы читаются порциями по первичному ключу
+# (keyset-пагинация, каждая порция — отдельная короткая транзакция чтения), поэтому
+# писатели не блокируются, а память не зависит от размера таблицы.
+#
+# Структура выгрузки:
+#     <out>/<таблица>/dt=YYYY-MM-DD/part-<первый id>.jsonl.gz (или .parquet)
+# dialog_history только дописывается: выгружается инкрементально и раскладывается по дню created_at.
+# users и trial_lessons изменяемые, поэтому каждый день выгружаются целиком снимком в dt=<день выгрузки>.
+# После каждого записанного файла обновляется водяной знак (<out>/_watermark.json),
+# и повторный запуск продолжает с места остановки.
+#
+# Водяной знак — последний выгруженный id. На PostgreSQL id из последовательности могут
+# фиксироваться не по порядку: строка с меньшим id, закоммиченная после выгрузки большего,
+# была бы пропущена навсегда. Поэтому инкрементальная выгрузка берет только строки старше
+# safety lag (EXPORT_SAFETY_LAG_SECONDS) и останавливается на первой более свежей строке:
+# водяной знак не перешагивает через нее. Предполагается, что транзакции записи в
+# dialog_history короче safety lag (в боте это одна короткая вставка).
+#
+# Запуск из корня проекта:
+#     python -m app.db.export --out exports [--format jsonl|parquet] [--chunk-size 5000] [--tables dialog_history users] [--safety-lag 300]
+
+import argparse
+import asyncio
+import enum
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import Table, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .models import DialogHistory, TrialLesson, User
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PARQUET_ENABLED = True
+except ImportError:
+    PARQUET_ENABLED = False
+
+WATERMARK_FILE = "_watermark.json"
+
+
+class ExportSpec:
+    """Как выгружать таблицу: колонка для разбиения по дням (None — день выгрузки) и режим."""
+    def __init__(self, table: Table, partition_column: str | None, snapshot: bool):
+        self.table = table
+        self.partition_column = partition_column
+        # True — таблица изменяемая, каждый день выгружается заново целиком
+        self.snapshot = snapshot
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+
+EXPORT_SPECS = {
+    spec.name: spec for spec in (
+        ExportSpec(DialogHistory.__table__, "created_at", snapshot=False),
+        ExportSpec(User.__table__, None, snapshot=True),
+        ExportSpec(TrialLesson.__table__, None, snapshot=True),
+    )
+}
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _partition_key(row: Dict[str, Any], spec: ExportSpec, export_day: str) -> str:
+    if spec.partition_column is None:
+        return export_day
+    value = row[spec.partition_column]
+    return value.date().isoformat() if value is not None else "unknown"
+
+
+class Watermark:
+    """Последний выгруженный id по каждой таблице; для снимков — еще и день снимка."""
+    def __init__(self, path: Path):
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            self.state = json.loads(path.read_text(encoding="utf-8"))
+
+    def last_id(self, spec: ExportSpec, export_day: str) -> int:
+        entry = self.state.get(spec.name, {})
+        if spec.snapshot and entry.get("snapshot_day") != export_day:
+            # Снимок за новый день начинается с начала таблицы
+            return 0
+        return entry.get("last_id", 0)
+
+    def save(self, spec: ExportSpec, last_id: int, export_day: str, rows: int):
+        entry = self.state.setdefault(spec.name, {})
+        if spec.snapshot and entry.get("snapshot_day") != export_day:
+            entry["rows"] = 0
+        entry["last_id"] = last_id
+        entry["rows"] = entry.get("rows", 0) + rows
+        entry["updated_at"] = datetime.now(timezone.utc).isoformat()
+        if spec.snapshot:
+            entry["snapshot_day"] = export_day
+        _atomic_write(self.path, json.dumps(self.state, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def _atomic_write(path: Path, payload: bytes):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+
+def write_part(directory: Path, rows: List[Dict[str, Any]], fmt: str) -> Path:
+    """
+    Пишет одну порцию строк в файл, названный по первому id. Файл сначала пишется во временный
+    и затем переименовывается, поэтому оборванная выгрузка не оставляет полузаписанных частей,
+    а повтор после сбоя (до обновления водяного знака) перезаписывает ту же часть, а не дублирует ее.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"part-{rows[0]['id']:012d}"
+    if fmt == "parquet":
+        path = directory / f"{stem}.parquet"
+        tmp_path = path.with_name(path.name + ".tmp")
+        table = pyarrow.Table.from_pylist([{k: _to_json_value(v) for k, v in row.items()} for row in rows])
+        pyarrow.parquet.write_table(table, tmp_path, compression="zstd")
+    else:
+        path = directory / f"{stem}.jsonl.gz"
+        tmp_path = path.with_name(path.name + ".tmp")
+        # mtime=0 — одинаковые данные дают побайтно одинаковый файл
+        with gzip.GzipFile(tmp_path, "wb", mtime=0) as raw:
+            for row in rows:
+                line = json.dumps({k: _to_json_value(v) for k, v in row.items()}, ensure_ascii=False)
+                raw.write(line.encode("utf-8") + b"\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def _group_by_partition(rows: Iterable[Dict[str, Any]], spec: ExportSpec, export_day: str) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(_partition_key(row, spec, export_day), []).append(row)
+    return groups
+
+
+def _settled_prefix(rows: List[Dict[str, Any]], column: str, cutoff: datetime) -> List[Dict[str, Any]]:
+    """Строки до первой, созданной позже cutoff: за ней могут быть еще не закоммиченные id."""
+    for index, row in enumerate(rows):
+        if row[column] is None or row[column] >= cutoff:
+            return rows[:index]
+    return rows
+
+
+async def export_table(engine: AsyncEngine, spec: ExportSpec, out_dir: Path, watermark: Watermark,
+                       fmt: str = "jsonl", chunk_size: int = 5000, safety_lag_seconds: float = 300) -> int:
+    """Выгружает одну таблицу, начиная с водяного знака. Возвращает число выгруженных строк."""
+    export_day = date.today().isoformat()
+    last_id = watermark.last_id(spec, export_day)
+    pk = spec.table.c.id
+    # Снимки каждый день выгружаются заново, им запас не нужен
+    cutoff = None
+    if not spec.snapshot:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=safety_lag_seconds)
+    exported = 0
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(spec.table).where(pk > last_id).order_by(pk).limit(chunk_size)
+            )
+            rows = [dict(row) for row in result.mappings()]
+        fresh_reached = False
+        if cutoff is not None:
+            settled = _settled_prefix(rows, spec.partition_column, cutoff)
+            fresh_reached = len(settled) < len(rows)
+            rows = settled
+        if not rows:
+            break
+        for day, part_rows in sorted(_group_by_partition(rows, spec, export_day).items()):
+            write_part(out_dir / spec.name / f"dt={day}", part_rows, fmt)
+        last_id = rows[-1]["id"]
+        exported += len(rows)
+        watermark.save(spec, last_id, export_day, len(rows))
+        if fresh_reached:
+            break
+    logging.info(f"Выгрузка {spec.name}: {exported} строк, водяной знак id={last_id}.")
+    return exported
+
+
+async def export_all(engine: AsyncEngine, out_dir: Path, tables: Iterable[str] | None = None,
+                     fmt: str = "jsonl", chunk_size: int = 5000, safety_lag_seconds: float = 300) -> Dict[str, int]:
+    if fmt == "parquet" and not PARQUET_ENABLED:
+        raise RuntimeError("Для формата parquet нужен пакет pyarrow (pip install pyarrow).")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    watermark = Watermark(out_dir / WATERMARK_FILE)
+    return {
+        name: await export_table(engine, EXPORT_SPECS[name], out_dir, watermark, fmt, chunk_size, safety_lag_seconds)
+        for name in (tables or EXPORT_SPECS)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка диалогов и записей на уроки")
+    parser.add_argument("--out", type=Path, default=Path("exports"))
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--tables", nargs="+", choices=sorted(EXPORT_SPECS))
+    parser.add_argument("--safety-lag", type=float, default=None,
+                        help="не выгружать инкрементально строки моложе N секунд (по умолчанию EXPORT_SAFETY_LAG_SECONDS)")
+    args = parser.parse_args()
+
+    # Импорт здесь: движок создается из конфигурации только при запуске выгрузки
+    from app.config import EXPORT_SAFETY_LAG_SECONDS
+    from .database import async_engine
+    safety_lag = EXPORT_SAFETY_LAG_SECONDS if args.safety_lag is None else args.safety_lag
+    try:
+        totals = await export_all(async_engine, args.out, args.tables, args.format, args.chunk_size, safety_lag)
+    finally:
+        await async_engine.dispose()
+    for name, rows in totals.items():
+        print(f"{name:16} {rows:>10} строк")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
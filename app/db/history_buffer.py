@@ -0,0 +1,110 @@
+# app/db/history_buffer.py
+
+import asyncio
+import logging
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import HISTORY_FLUSH_INTERVAL_MS, HISTORY_FLUSH_MAX_ROWS
+from .models import DialogHistory, utc_now
+
+
+class HistoryWriteBuffer:
+    """
+    Отложенная запись истории диалога. Сообщения копятся в памяти и уходят в БД
+    одним INSERT раз в flush_interval_ms миллисекунд или сразу по набору max_rows строк.
+    Пока строка не записана, load_history берет ее из буфера, поэтому чтение остается согласованным.
+    """
+    def __init__(self, flush_interval_ms: int = 200, max_rows: int = 100):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self._session_factory: async_sessionmaker | None = None
+        self._pending: List[Dict] = []
+        # Строки, которые сейчас записываются: до коммита они тоже должны быть видны при чтении
+        self._inflight: List[Dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.stats = {"rows": 0, "flushes": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, session_factory: async_sessionmaker):
+        """Запускает фоновую запись. До запуска save_history пишет в БД напрямую."""
+        self._session_factory = session_factory
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logging.info(
+            f"Буфер истории запущен: запись раз в {self.flush_interval * 1000:.0f} мс "
+            f"или по {self.max_rows} сообщений."
+        )
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает все, что осталось в буфере."""
+        # Задачу не отменяем: отмена посреди INSERT потеряла бы строки. Просим ее завершиться.
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logging.info(f"Буфер истории остановлен. Статистика: {self.stats}")
+
+    def add(self, user_id: int, role: str, content: str):
+        """Ставит сообщение в очередь на запись. Время фиксируется в момент получения, как и у прямой вставки (models.utc_now)."""
+        self._pending.append({
+            "user_id": user_id,
+            "role": role,
+            "message": content,
+            "created_at": utc_now(),
+        })
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: int) -> List[Dict]:
+        """Еще не записанные сообщения пользователя в порядке поступления."""
+        return [row for row in (*self._inflight, *self._pending) if row["user_id"] == user_id]
+
+    async def flush(self) -> int:
+        """Записывает накопленные строки одним INSERT. Возвращает число записанных строк."""
+        async with self._flush_lock:
+            if not self._pending or self._session_factory is None:
+                return 0
+            rows = self._inflight = self._pending
+            self._pending = []
+            try:
+                async with self._session_factory() as session:
+                    await session.execute(insert(DialogHistory), rows)
+                    await session.commit()
+            except Exception as e:
+                # Строки не теряем: возвращаем их в начало очереди до следующей попытки
+                self.stats["errors"] += 1
+                self._pending = rows + self._pending
+                self._inflight = []
+                logging.error(f"Не удалось записать {len(rows)} сообщений истории: {e}", exc_info=True)
+                return 0
+            self._inflight = []
+            self.stats["rows"] += len(rows)
+            self.stats["flushes"] += 1
+            return len(rows)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+# Единый буфер истории для всего приложения
+history_buffer = HistoryWriteBuffer(
+    flush_interval_ms=HISTORY_FLUSH_INTERVAL_MS,
+    max_rows=HISTORY_FLUSH_MAX_ROWS,
+)
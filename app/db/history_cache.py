@@ -0,0 +1,129 @@
+# app/db/history_cache.py
+
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List
+
+from app.config import HISTORY_CACHE_TURNS, HISTORY_CACHE_TTL_SECONDS, HISTORY_CACHE_MAX_MB
+
+# Накладные расходы на словарь {"role": ..., "content": ...} и ячейку deque
+_MESSAGE_OVERHEAD = sys.getsizeof({"role": "", "content": ""}) + 8
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    return _MESSAGE_OVERHEAD + sys.getsizeof(message["role"]) + sys.getsizeof(message["content"])
+
+
+class _Entry:
+    __slots__ = ("messages", "complete", "expires_at", "size")
+
+    def __init__(self, messages: Deque[Dict[str, str]], complete: bool, expires_at: float):
+        self.messages = messages
+        # True, если в БД у пользователя не больше сообщений, чем лежит в кольце
+        self.complete = complete
+        self.expires_at = expires_at
+        self.size = sum(_message_size(m) for m in messages)
+
+
+class HistoryCache:
+    """
+    Кэш последних реплик диалога для каждого пользователя (кольцевой буфер на max_turns сообщений).
+    Заполняется при первом чтении из БД, дополняется при каждом save_history,
+    вытесняется по LRU и TTL, а суммарный объем ограничен max_bytes.
+    Кэш живет в памяти одного процесса: TTL ограничивает расхождение, если историю
+    того же пользователя пишет другой воркер.
+    """
+    def __init__(self, max_turns: int = 20, ttl_seconds: int = 1800, max_bytes: int = 16 * 1024 * 1024):
+        self.max_turns = max_turns
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, limit: int) -> List[Dict[str, str]] | None:
+        """Последние limit сообщений или None, если в кэше их нет (нужно идти в БД)."""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._drop(user_id)
+            entry = None
+        if entry is None or (len(entry.messages) < limit and not entry.complete):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        entry.expires_at = time.monotonic() + self.ttl
+        return list(entry.messages)[-limit:]
+
+    def fill(self, user_id: int, messages: List[Dict[str, str]], complete: bool):
+        """Кладет в кэш историю, прочитанную из БД (в хронологическом порядке)."""
+        self._drop(user_id)
+        entry = _Entry(
+            deque((dict(m) for m in messages[-self.max_turns:]), maxlen=self.max_turns),
+            complete=complete,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries[user_id] = entry
+        self._bytes += entry.size
+        self._enforce_limit()
+
+    def append(self, user_id: int, role: str, content: str):
+        """Добавляет новое сообщение, если история пользователя уже в кэше."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        message = {"role": role, "content": content}
+        if len(entry.messages) == entry.messages.maxlen:
+            # Кольцо заполнено: самое старое сообщение уходит, а в БД раньше него есть еще
+            removed = _message_size(entry.messages[0])
+            entry.size -= removed
+            self._bytes -= removed
+            entry.complete = False
+        entry.messages.append(message)
+        added = _message_size(message)
+        entry.size += added
+        self._bytes += added
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(user_id)
+        self._enforce_limit()
+
+    def invalidate(self, user_id: int):
+        self._drop(user_id)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_kb": round(self._bytes / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _drop(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _enforce_limit(self):
+        # Каждое обращение продлевает TTL и переносит запись в конец, поэтому в начале
+        # словаря всегда самые старые: просроченные и давно неиспользуемые записи
+        now = time.monotonic()
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if entry.expires_at >= now and self._bytes <= self.max_bytes:
+                break
+            self._drop(user_id)
+            self.evictions += 1
+
+
+# Единый кэш истории для всего приложения
+history_cache = HistoryCache(
+    max_turns=HISTORY_CACHE_TURNS,
+    ttl_seconds=HISTORY_CACHE_TTL_SECONDS,
+    max_bytes=HISTORY_CACHE_MAX_MB * 1024 * 1024,
+)
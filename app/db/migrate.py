@@ -0,0 +1,36 @@
+# app/db/migrate.py
+
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Ревизия, которая описывает схему, созданную раньше через Base.metadata.create_all
+BASELINE_REVISION = "0001_initial"
+
+
+def alembic_config(connection: Connection | None = None) -> Config:
+    """Конфигурация Alembic без alembic.ini: Dockerfile копирует в образ только папку app."""
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def run_migrations(connection: Connection):
+    """
+    Обновляет схему до последней миграции на переданном соединении.
+    Базы, созданные до появления миграций, сначала помечаются базовой ревизией,
+    чтобы Alembic не пытался создать уже существующие таблицы.
+    """
+    config = alembic_config(connection)
+    tables = set(inspect(connection).get_table_names())
+    if "users" in tables and "alembic_version" not in tables:
+        logging.info(f"Найдена база без истории миграций, помечаем ревизией {BASELINE_REVISION}.")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
@@ -0,0 +1,61 @@
+# app/db/migrations/env.py
+
+import asyncio
+
+from alembic import context
+from sqlalchemy.engine import Connection
+
+from app.db.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def do_run_migrations(connection: Connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite не умеет большинство ALTER TABLE: изменения выполняются через копию таблицы
+        render_as_batch=connection.dialect.name == "sqlite",
+        compare_type=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    # Импорт здесь, а не в начале файла: при запуске из init_db движок уже создан и соединение передано
+    from app.db.database import async_engine
+
+    async with async_engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        # Вызов из приложения (init_db): работаем на уже открытом соединении
+        do_run_migrations(connection)
+    else:
+        # Вызов из командной строки: alembic upgrade head
+        asyncio.run(run_async_migrations())
+
+
+def run_migrations_offline():
+    from app.db.database import DATABASE_URL
+
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
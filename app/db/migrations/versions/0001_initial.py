@@ -0,0 +1,72 @@
+"""Начальная схема: пользователи, история диалога, пробные уроки, отзывы
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_initial"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Enum хранит имена членов TrialLessonStatus, как и Enum(TrialLessonStatus) в models.py
+trial_lesson_status = sa.Enum("PLANNED", "COMPLETED", "CANCELLED", name="triallessonstatus")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("username", sa.String(length=100), nullable=True),
+        sa.Column("user_data", sa.JSON(), nullable=True),
+        sa.Column("onboarding_completed", sa.Boolean(), nullable=False),
+        sa.Column("is_enrolled", sa.Boolean(), nullable=False),
+        sa.Column("is_blocked", sa.Boolean(), nullable=False),
+        sa.Column("irrelevant_count", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_users_telegram_id", "users", ["telegram_id"], unique=True)
+
+    op.create_table(
+        "dialog_history",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("role", sa.String(length=10), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_dialog_history_id", "dialog_history", ["id"])
+
+    op.create_table(
+        "trial_lessons",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("task_id", sa.BigInteger(), nullable=True),
+        sa.Column("event_id", sa.BigInteger(), nullable=True),
+        sa.Column("teacher_id", sa.BigInteger(), nullable=True),
+        sa.Column("scheduled_at", sa.DateTime(), nullable=True),
+        sa.Column("status", trial_lesson_status, nullable=False),
+    )
+
+    op.create_table(
+        "feedback",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("lesson_id", sa.Integer(), sa.ForeignKey("trial_lessons.id"), nullable=False),
+        sa.Column("rating", sa.Integer(), nullable=True),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("feedback")
+    op.drop_table("trial_lessons")
+    op.drop_index("ix_dialog_history_id", table_name="dialog_history")
+    op.drop_table("dialog_history")
+    op.drop_index("ix_users_telegram_id", table_name="users")
+    op.drop_table("users")
+    trial_lesson_status.drop(op.get_bind(), checkfirst=True)
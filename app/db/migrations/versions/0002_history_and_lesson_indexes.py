@@ -0,0 +1,33 @@
+"""Составные индексы для истории диалога и активных уроков
+
+Revision ID: 0002_history_lesson_indexes
+Revises: 0001_initial
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_history_lesson_indexes"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # load_history: WHERE user_id = ? ORDER BY created_at DESC LIMIT n
+    op.create_index(
+        "ix_dialog_history_user_id_created_at",
+        "dialog_history",
+        ["user_id", sa.text("created_at DESC")],
+    )
+    # get_all_active_lessons / get_active_lesson: WHERE user_id = ? AND status ... ORDER BY scheduled_at
+    op.create_index(
+        "ix_trial_lessons_user_id_status_scheduled_at",
+        "trial_lessons",
+        ["user_id", "status", "scheduled_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_trial_lessons_user_id_status_scheduled_at", table_name="trial_lessons")
+    op.drop_index("ix_dialog_history_user_id_created_at", table_name="dialog_history")
@@ -0,0 +1,28 @@
+"""Таблица скользящих сводок диалога для политики хранения истории
+
+Revision ID: 0003_dialog_summaries
+Revises: 0002_history_lesson_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_dialog_summaries"
+down_revision = "0002_history_lesson_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dialog_summaries",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("covered_until", sa.DateTime(), nullable=False),
+        sa.Column("messages_compacted", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("dialog_summaries")
@@ -0,0 +1,32 @@
+"""id в индексе истории диалога: порядок сообщений с одинаковым created_at
+
+Revision ID: 0004_history_index_id
+Revises: 0003_dialog_summaries
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_history_index_id"
+down_revision = "0003_dialog_summaries"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # load_history: WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT n
+    op.drop_index("ix_dialog_history_user_id_created_at", table_name="dialog_history")
+    op.create_index(
+        "ix_dialog_history_user_id_created_at",
+        "dialog_history",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_dialog_history_user_id_created_at", table_name="dialog_history")
+    op.create_index(
+        "ix_dialog_history_user_id_created_at",
+        "dialog_history",
+        ["user_id", sa.text("created_at DESC")],
+    )
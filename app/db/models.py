@@ -1,15 +1,21 @@
 # app/db/models.py
 
 import enum
-from datetime import datetime
+from datetime import datetime, timezone
 from sqlalchemy import (
-    BigInteger, String, ForeignKey, DateTime, func, JSON, Enum, Boolean, Integer, Text
+    BigInteger, String, ForeignKey, DateTime, func, JSON, Enum, Boolean, Integer, Text, Index
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship, declarative_base
 from typing import List
 
 Base = declarative_base()
 
+
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса, с микросекундами: так хранится created_at истории диалога."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     __tablename__ = 'users'
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -30,9 +36,21 @@ class DialogHistory(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
     role: Mapped[str] = mapped_column(String(10))
     message: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    # Время ставит приложение, а не БД: у func.now() в SQLite точность секунда, и прямые
+    # вставки сортировались бы иначе, чем строки из буфера записи (см. history_buffer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
     user: Mapped["User"] = relationship(back_populates="dialog_history")
 
+class DialogSummary(Base):
+    """Скользящее краткое содержание старой части диалога (заменяет удаленные сообщения в промпте)."""
+    __tablename__ = 'dialog_summaries'
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text)
+    # Время самого нового сообщения, вошедшего в сводку
+    covered_until: Mapped[datetime] = mapped_column(DateTime)
+    messages_compacted: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
 class TrialLessonStatus(enum.Enum):
     PLANNED = "запланирован"
     COMPLETED = "проведен"
@@ -52,6 +70,10 @@ class TrialLesson(Base):
     # Поле lesson_data убрано для простоты и надежности
     user: Mapped["User"] = relationship(back_populates="trial_lessons")
 
+# Составные индексы под основные запросы (см. app/db/queries.py); создаются миграциями 0002 и 0004
+Index("ix_dialog_history_user_id_created_at", DialogHistory.user_id, DialogHistory.created_at.desc(), DialogHistory.id.desc())
+Index("ix_trial_lessons_user_id_status_scheduled_at", TrialLesson.user_id, TrialLesson.status, TrialLesson.scheduled_at)
+
 class Feedback(Base):
     __tablename__ = 'feedback'
     id: Mapped[int] = mapped_column(primary_key=True)
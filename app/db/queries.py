@@ -0,0 +1,33 @@
+# app/db/queries.py
+
+from sqlalchemy import Select, desc, select
+
+from .models import DialogHistory, TrialLesson, TrialLessonStatus
+
+# Статусы, при которых урок больше не считается активным
+INACTIVE_LESSON_STATUSES = (TrialLessonStatus.CANCELLED, TrialLessonStatus.COMPLETED)
+
+
+def history_query(user_id: int, limit: int) -> Select:
+    """
+    Последние сообщения пользователя. Обслуживается индексом (user_id, created_at DESC, id DESC);
+    id различает сообщения с одинаковым временем.
+    """
+    return (
+        select(DialogHistory)
+        .where(DialogHistory.user_id == user_id)
+        .order_by(desc(DialogHistory.created_at), desc(DialogHistory.id))
+        .limit(limit)
+    )
+
+
+def active_lessons_query(user_id: int) -> Select:
+    """Активные уроки пользователя по времени. Обслуживается индексом (user_id, status, scheduled_at)."""
+    return (
+        select(TrialLesson)
+        .where(
+            TrialLesson.user_id == user_id,
+            TrialLesson.status.notin_(INACTIVE_LESSON_STATUSES),
+        )
+        .order_by(TrialLesson.scheduled_at.asc())
+    )
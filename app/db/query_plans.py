@@ -0,0 +1,49 @@
+# app/db/query_plans.py
+
+import logging
+from typing import Dict
+
+from sqlalchemy import Select, text
+from sqlalchemy.engine import Connection
+
+from .queries import history_query, active_lessons_query
+
+# Какой индекс должен обслуживать каждый из основных запросов
+EXPECTED_INDEXES = {
+    "load_history": "ix_dialog_history_user_id_created_at",
+    "get_all_active_lessons": "ix_trial_lessons_user_id_status_scheduled_at",
+}
+
+
+def explain(connection: Connection, stmt: Select) -> str:
+    """Возвращает план запроса текстом (EXPLAIN QUERY PLAN для SQLite, EXPLAIN для PostgreSQL)."""
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN" if connection.dialect.name == "sqlite" else "EXPLAIN"
+    rows = connection.execute(text(f"{prefix} {compiled}")).fetchall()
+    # В SQLite описание шага — последняя колонка, в PostgreSQL колонка одна
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def query_plans(connection: Connection) -> Dict[str, str]:
+    """Планы основных запросов на примере произвольного пользователя."""
+    return {
+        "load_history": explain(connection, history_query(user_id=1, limit=10)),
+        "get_all_active_lessons": explain(connection, active_lessons_query(user_id=1)),
+    }
+
+
+def check_query_plans(connection: Connection) -> bool:
+    """
+    Проверяет, что основные запросы используют составные индексы.
+    PostgreSQL на маленьких таблицах законно выбирает Seq Scan, поэтому несовпадение
+    только логируется предупреждением, а не прерывает запуск.
+    """
+    all_ok = True
+    for name, plan in query_plans(connection).items():
+        index_name = EXPECTED_INDEXES[name]
+        if index_name in plan:
+            logging.debug(f"План запроса {name} использует индекс {index_name}.")
+        else:
+            all_ok = False
+            logging.warning(f"Запрос {name} не использует индекс {index_name}. План:\n{plan}")
+    return all_ok
@@ -0,0 +1,225 @@
+# app/db/retention.py
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import delete, func, select, text
+
+from app.config import (
+    HISTORY_RETENTION_DAYS, HISTORY_RETENTION_KEEP_LAST, HISTORY_RETENTION_INTERVAL_SECONDS,
+    HISTORY_RETENTION_CHUNK, HISTORY_SUMMARY_MAX_CHARS, SQLITE_INCREMENTAL_VACUUM_PAGES,
+)
+from .database import async_engine, async_session_factory
+from .engine import insert_for
+from .history_cache import history_cache
+from .models import DialogHistory, DialogSummary
+
+# Сводчик: (предыдущая сводка, сообщения в хронологическом порядке) -> новая сводка
+Summarizer = Callable[[str | None, List[Dict[str, str]]], Awaitable[str]]
+
+
+async def extractive_summary(previous: str | None, messages: List[Dict[str, str]]) -> str:
+    """
+    Сводка без LLM: к предыдущей сводке добавляются реплики пользователя (в них вопросы и факты
+    о ребенке), ответы ассистента опускаются. Из текста остается конец длиной до HISTORY_SUMMARY_MAX_CHARS.
+    """
+    lines = [previous] if previous else []
+    lines.extend(f"Клиент: {m['content'].strip()}" for m in messages if m["role"] == "user" and m["content"].strip())
+    summary = "\n".join(lines)
+    if len(summary) > HISTORY_SUMMARY_MAX_CHARS:
+        summary = "…" + summary[-HISTORY_SUMMARY_MAX_CHARS:]
+    return summary
+
+
+class HistoryRetentionJob:
+    """
+    Фоновая политика хранения истории диалога. Сообщения старше max_age_days (кроме последних
+    keep_last у каждого пользователя) сворачиваются в скользящую сводку DialogSummary и удаляются.
+    Сводку затем подставляет в промпт _build_prompt вместо старых реплик.
+    На SQLite освободившиеся страницы возвращаются системе через incremental_vacuum.
+    """
+    def __init__(self, max_age_days: int = 30, keep_last: int = 10, chunk_size: int = 200,
+                 interval_seconds: int = 3600, summarizer: Summarizer = extractive_summary):
+        self.max_age = timedelta(days=max_age_days)
+        self.keep_last = keep_last
+        self.chunk_size = chunk_size
+        self.interval = interval_seconds
+        self.summarizer = summarizer
+        self._task: asyncio.Task | None = None
+
+    def start(self, summarizer: Summarizer | None = None):
+        """Запускает периодическую очистку; summarizer позволяет подключить сводку через LLM."""
+        if summarizer is not None:
+            self.summarizer = summarizer
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run_once(self) -> dict:
+        """Один проход по всем пользователям со старыми сообщениями. Возвращает статистику."""
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - self.max_age
+        stats = {"users": 0, "messages": 0}
+        last_user_id = 0
+        while True:
+            # Пользователей перебираем по возрастанию id, чтобы проход гарантированно завершился
+            async with async_session_factory() as session:
+                user_ids = (await session.execute(
+                    select(DialogHistory.user_id)
+                    .where(DialogHistory.created_at < cutoff, DialogHistory.user_id > last_user_id)
+                    .group_by(DialogHistory.user_id)
+                    .order_by(DialogHistory.user_id)
+                    .limit(100)
+                )).scalars().all()
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                compacted = await self._compact_user(user_id, cutoff)
+                if compacted:
+                    stats["users"] += 1
+                    stats["messages"] += compacted
+            last_user_id = user_ids[-1]
+        if stats["messages"]:
+            await self._incremental_vacuum()
+        logging.info(f"Очистка истории диалога: свернуто {stats['messages']} сообщений у {stats['users']} пользователей.")
+        return stats
+
+    async def _compact_user(self, user_id: int, cutoff: datetime) -> int:
+        total = 0
+        while True:
+            # Чтение — в короткой сессии: сводчик может ходить в LLM, и держать на это время
+            # соединение из пула и открытую транзакцию нельзя
+            async with async_session_factory() as session:
+                # Последние keep_last сообщений не трогаем, даже если они старые
+                recent_ids = (
+                    select(DialogHistory.id)
+                    .where(DialogHistory.user_id == user_id)
+                    .order_by(DialogHistory.created_at.desc(), DialogHistory.id.desc())
+                    .limit(self.keep_last)
+                )
+                rows = (await session.execute(
+                    select(DialogHistory.id, DialogHistory.role, DialogHistory.message, DialogHistory.created_at)
+                    .where(
+                        DialogHistory.user_id == user_id,
+                        DialogHistory.created_at < cutoff,
+                        DialogHistory.id.notin_(recent_ids),
+                    )
+                    .order_by(DialogHistory.created_at, DialogHistory.id)
+                    .limit(self.chunk_size)
+                )).all()
+                if not rows:
+                    return total
+                current = (await session.execute(
+                    select(DialogSummary.summary, DialogSummary.messages_compacted)
+                    .where(DialogSummary.user_id == user_id)
+                )).first()
+
+            messages = [{"role": row.role, "content": row.message} for row in rows]
+            summary = await self.summarizer(current.summary if current else None, messages)
+
+            compacted = (current.messages_compacted if current else 0) + len(rows)
+            stmt = insert_for(async_engine, DialogSummary.__table__).values(
+                user_id=user_id, summary=summary, covered_until=rows[-1].created_at,
+                messages_compacted=compacted, updated_at=func.now(),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "summary": stmt.excluded.summary,
+                    "covered_until": stmt.excluded.covered_until,
+                    "messages_compacted": stmt.excluded.messages_compacted,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+            # Запись сводки и удаление свернутых реплик — отдельной короткой транзакцией
+            async with async_session_factory() as session:
+                await session.execute(stmt)
+                await session.execute(delete(DialogHistory).where(DialogHistory.id.in_([row.id for row in rows])))
+                await session.commit()
+            # В кэше могли остаться удаленные реплики: следующее чтение пойдет в БД
+            history_cache.invalidate(user_id)
+            total += len(rows)
+
+    async def _incremental_vacuum(self):
+        """
+        Возвращает освободившиеся страницы SQLite. Для PostgreSQL это делает autovacuum.
+        Работает только если база уже в режиме auto_vacuum=INCREMENTAL: перевод существующей
+        базы требует полного VACUUM и выполняется отдельной командой (enable_incremental_vacuum).
+        """
+        if async_engine.dialect.name != "sqlite":
+            return
+        async with async_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            mode = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+            if mode != 2:
+                logging.info(
+                    "SQLite: auto_vacuum не INCREMENTAL, место после очистки истории не возвращается. "
+                    "Остановите бота и выполните: python -m app.db.retention --enable-incremental-vacuum"
+                )
+                return
+            freelist = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            await conn.execute(text(f"PRAGMA incremental_vacuum({SQLITE_INCREMENTAL_VACUUM_PAGES})"))
+            logging.info(f"SQLite incremental_vacuum: свободных страниц было {freelist}, освобождено до {SQLITE_INCREMENTAL_VACUUM_PAGES}.")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Ошибка при очистке истории диалога: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+# Единая задача очистки истории для всего приложения
+history_retention = HistoryRetentionJob(
+    max_age_days=HISTORY_RETENTION_DAYS,
+    keep_last=HISTORY_RETENTION_KEEP_LAST,
+    chunk_size=HISTORY_RETENTION_CHUNK,
+    interval_seconds=HISTORY_RETENTION_INTERVAL_SECONDS,
+)
+
+
+async def enable_incremental_vacuum(engine) -> int:
+    """
+    Однократно переводит существующую базу SQLite в режим auto_vacuum=INCREMENTAL.
+    Требует полного VACUUM: файл базы переписывается целиком под монопольной блокировкой,
+    поэтому запускать только при остановленном боте. Возвращает итоговый режим auto_vacuum.
+    """
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("auto_vacuum есть только у SQLite")
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        mode = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+        if mode != 2:
+            await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            await conn.execute(text("VACUUM"))
+            mode = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+    return mode
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Обслуживание истории диалога")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="однократно перевести базу SQLite в auto_vacuum=INCREMENTAL (бот должен быть остановлен)")
+    parser.add_argument("--run-once", action="store_true", help="выполнить один проход очистки истории")
+    args = parser.parse_args()
+    if not (args.enable_incremental_vacuum or args.run_once):
+        parser.error("укажите --enable-incremental-vacuum и/или --run-once")
+
+    try:
+        if args.enable_incremental_vacuum:
+            mode = await enable_incremental_vacuum(async_engine)
+            print(f"auto_vacuum = {mode}" + ("" if mode == 2 else " (режим не изменился)"))
+        if args.run_once:
+            print(await history_retention.run_once())
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
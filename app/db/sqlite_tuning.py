@@ -0,0 +1,55 @@
+# app/db/sqlite_tuning.py
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Профили PRAGMA для SQLite. "default" — поведение SQLite без настроек (для сравнения в бенчмарке),
+# "performance" — WAL: читатели не блокируют писателя, fsync только на чекпоинтах.
+SQLITE_PROFILES = {
+    "default": {},
+    "performance": {
+        # Порядок важен: auto_vacuum должен идти до journal_mode=WAL — в режиме WAL он уже
+        # не применяется. Действует только для новой базы; существующую переводит разовая
+        # команда обслуживания: python -m app.db.retention --enable-incremental-vacuum
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def build_pragmas(profile: str, mmap_size: int, cache_size_kb: int, busy_timeout_ms: int) -> dict:
+    """
+    Собирает итоговый набор PRAGMA для профиля. Размеры кэша, mmap и ожидания блокировки
+    задаются отдельно из конфигурации и применяются для любого профиля, кроме "default".
+    """
+    if profile not in SQLITE_PROFILES:
+        logging.warning(f"Неизвестный профиль SQLite '{profile}', используется 'performance'.")
+        profile = "performance"
+    pragmas = dict(SQLITE_PROFILES[profile])
+    if profile != "default":
+        pragmas["mmap_size"] = mmap_size
+        # Отрицательное значение cache_size задается в килобайтах, а не в страницах
+        pragmas["cache_size"] = -abs(cache_size_kb)
+        pragmas["busy_timeout"] = busy_timeout_ms
+    return pragmas
+
+
+def install_sqlite_pragmas(engine: AsyncEngine, pragmas: dict):
+    """Выполняет PRAGMA на каждом новом соединении пула."""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logging.info(f"SQLite: для новых соединений будут применены PRAGMA {pragmas}.")
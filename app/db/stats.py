@@ -0,0 +1,63 @@
+# app/db/stats.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@dataclass
+class QueryStats:
+    """Количество SQL-запросов и коммитов, выполненных в рамках одного апдейта."""
+    queries: int = 0
+    commits: int = 0
+
+
+# Счетчики текущего апдейта; вне track_queries() события движка ничего не считают
+_current_stats: ContextVar[QueryStats | None] = ContextVar("db_query_stats", default=None)
+# Суммарные счетчики за время жизни процесса
+totals = {"updates": 0, "queries": 0, "commits": 0}
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+def _on_commit(conn):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.commits += 1
+
+
+def install_query_counter(engine: AsyncEngine):
+    """Подписывает счетчики на события движка. Вызывается один раз при создании движка."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _on_execute)
+    event.listen(engine.sync_engine, "commit", _on_commit)
+
+
+@contextmanager
+def track_queries():
+    """Считает запросы и коммиты внутри блока и добавляет их к суммарной статистике."""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        totals["updates"] += 1
+        totals["queries"] += stats.queries
+        totals["commits"] += stats.commits
+
+
+def average_per_update() -> dict:
+    """Среднее число запросов и коммитов на один апдейт."""
+    updates = totals["updates"] or 1
+    return {
+        "updates": totals["updates"],
+        "queries": totals["queries"] / updates,
+        "commits": totals["commits"] / updates,
+    }
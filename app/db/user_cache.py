@@ -0,0 +1,158 @@
+# app/db/user_cache.py
+
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, List, Tuple
+
+from sqlalchemy import inspect
+
+from app.config import USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES
+from .models import User, TrialLesson
+
+
+class _Entry:
+    __slots__ = ("user", "lessons", "expires_at")
+
+    def __init__(self, user: User, expires_at: float):
+        self.user = user
+        # None — активные уроки еще не загружались
+        self.lessons: List[TrialLesson] | None = None
+        self.expires_at = expires_at
+
+
+def _snapshot(obj):
+    """
+    Отдельная копия ORM-объекта: колонки (JSON — глубокой копией) и уже загруженные связи «к одному».
+    Кэш хранит и выдает только такие копии, поэтому изменение объекта в обработчике
+    не меняет состояние кэша, пока запись не прошла через БД.
+    """
+    state = inspect(obj)
+    copy = state.mapper.class_()
+    for attr in state.mapper.column_attrs:
+        setattr(copy, attr.key, deepcopy(getattr(obj, attr.key)))
+    for relationship in state.mapper.relationships:
+        if not relationship.uselist and relationship.key not in state.unloaded:
+            related = getattr(obj, relationship.key)
+            setattr(copy, relationship.key, _snapshot(related) if related is not None else None)
+    return copy
+
+
+class UserCache:
+    """
+    Кэш профиля пользователя и его активных уроков по telegram_id с TTL и лимитом записей (LRU).
+    Хранит и выдает копии объектов (_snapshot), не связанные ни с сессией, ни друг с другом.
+    Любая запись в database.py, меняющая пользователя или его уроки, явно сбрасывает запись кэша.
+
+    Чтение из БД могло начаться до сбрасывающего коммита и закончиться после него. Чтобы такой
+    читатель не вернул в кэш устаревшую строку, сбросы нумеруются: читатель берет generation()
+    до запроса, а put_user/put_lessons с этим номером ничего не кладут, если ключ с тех пор сбрасывался.
+    """
+    def __init__(self, ttl_seconds: int = 60, max_entries: int = 10000):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Внутренний id -> telegram_id: уроки и модерация адресуют пользователя по внутреннему id
+        self._telegram_ids: Dict[int, int] = {}
+        # Номер последнего сброса по ключу ('tg', telegram_id) или ('id', user_id)
+        self._generation = 0
+        self._invalidated_at: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        # Старше этого номера сведения о сбросах вытеснены: такие put отклоняются целиком
+        self._forgotten_before = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        """Номер, который читатель берет до запроса в БД и передает в put_user/put_lessons."""
+        return self._generation
+
+    def get_user(self, telegram_id: int) -> User | None:
+        entry = self._get_entry(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _snapshot(entry.user)
+
+    def put_user(self, user: User, generation: int | None = None):
+        if generation is not None and self._is_stale(generation, ("tg", user.telegram_id), ("id", user.id)):
+            return
+        self._drop(user.telegram_id)
+        self._entries[user.telegram_id] = _Entry(_snapshot(user), time.monotonic() + self.ttl)
+        self._telegram_ids[user.id] = user.telegram_id
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._telegram_ids.pop(evicted.user.id, None)
+
+    def get_lessons(self, user_id: int) -> List[TrialLesson] | None:
+        telegram_id = self._telegram_ids.get(user_id)
+        entry = self._get_entry(telegram_id) if telegram_id is not None else None
+        if entry is None or entry.lessons is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [_snapshot(lesson) for lesson in entry.lessons]
+
+    def put_lessons(self, user_id: int, lessons: List[TrialLesson], generation: int | None = None):
+        """Запоминает активные уроки, если профиль пользователя уже в кэше."""
+        telegram_id = self._telegram_ids.get(user_id)
+        entry = self._entries.get(telegram_id) if telegram_id is not None else None
+        if entry is None:
+            return
+        if generation is not None and self._is_stale(generation, ("tg", telegram_id), ("id", user_id)):
+            return
+        entry.lessons = [_snapshot(lesson) for lesson in lessons]
+
+    def is_blocked(self, telegram_id: int) -> bool:
+        """Проверка без обращения к БД: True, только если пользователь в кэше и заблокирован."""
+        entry = self._get_entry(telegram_id)
+        return entry is not None and bool(entry.user.is_blocked)
+
+    def invalidate(self, telegram_id: int | None = None, user_id: int | None = None):
+        """Сбрасывает запись по telegram_id или по внутреннему id пользователя."""
+        if telegram_id is None and user_id is not None:
+            telegram_id = self._telegram_ids.get(user_id)
+        self._generation += 1
+        for key in (("tg", telegram_id), ("id", user_id)):
+            if key[1] is not None:
+                self._invalidated_at[key] = self._generation
+                self._invalidated_at.move_to_end(key)
+        while len(self._invalidated_at) > self.max_entries:
+            _, forgotten = self._invalidated_at.popitem(last=False)
+            self._forgotten_before = max(self._forgotten_before, forgotten)
+        if telegram_id is not None:
+            self._drop(telegram_id)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+        }
+
+    def _drop(self, telegram_id: int):
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._telegram_ids.pop(entry.user.id, None)
+
+    def _is_stale(self, generation: int, *keys: Tuple[str, int]) -> bool:
+        if generation < self._forgotten_before:
+            return True
+        return any(self._invalidated_at.get(key, 0) > generation for key in keys)
+
+    def _get_entry(self, telegram_id: int) -> _Entry | None:
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            # Истечение TTL — не изменение данных, номер сброса не увеличиваем
+            self._drop(telegram_id)
+            return None
+        self._entries.move_to_end(telegram_id)
+        return entry
+
+
+# Единый кэш пользователей для всего приложения
+user_cache = UserCache(ttl_seconds=USER_CACHE_TTL_SECONDS, max_entries=USER_CACHE_MAX_ENTRIES)
@@ -6,6 +6,7 @@ from aiogram.filters import Command
 
 from app.filters.admin_filter import IsAdmin 
 from app.db.database import unblock_and_reset_user
+from app.services.enrollment_counter import enrollment_counter
 
 # Создаем новый роутер специально для админских команд
 router = Router()
@@ -51,6 +52,32 @@ async def unblock_user_command(callback: types.CallbackQuery):
     
     # Отвечаем на колбэк, чтобы убрать "часики" на кнопке
     await callback.answer()
+
+
+@router.message(Command(commands=["enroll", "unenroll"]))
+async def enroll_user_command(message: types.Message):
+    """
+    Отмечает пользователя зачисленным на курс (или снимает отметку).
+    Через эту команду счетчик учеников в памяти обновляется сразу, без ожидания сверки с БД.
+    Пример использования: /enroll 123456789, /unenroll 123456789
+    """
+    command, *args = message.text.split()
+    status = command.lstrip("/").split("@")[0] == "enroll"
+    try:
+        telegram_id = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer("Неверный формат команды. Используйте: `/enroll ID_пользователя` или `/unenroll ID_пользователя`")
+        return
+
+    if await enrollment_counter.set_enrolled(telegram_id, status):
+        logging.info(f"Администратор {message.from_user.id} изменил статус зачисления пользователя {telegram_id} на {status}")
+        count = await enrollment_counter.get()
+        action = "зачислен на курс" if status else "больше не числится зачисленным"
+        await message.answer(f"✅ Пользователь `{telegram_id}` {action}. Зачислено учеников: {count}.")
+    else:
+        await message.answer(f"ℹ️ Статус пользователя `{telegram_id}` не изменился: его нет в базе или статус уже такой.")
+
+
 # @router.message(Command(commands=["unblock"]))
 # async def unblock_user_command(message: types.Message):
     # """
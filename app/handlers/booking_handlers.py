@@ -10,11 +10,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from app.config import TEACHER_IDS
 from app.db.database import get_or_create_user, add_trial_lesson, get_all_active_lessons
 from app.states.fsm_states import BookingFSM
 from app.services.bitrix_service import book_lesson
 from app.utils.formatters import format_date_russian, get_user_data_summary
-from app.handlers.utils.booking_utils import show_available_dates, get_time_keyboard
+from app.handlers.utils.booking_utils import show_available_dates, get_time_keyboard, get_slot_teachers
 from app.handlers import reschedule_handlers, onboarding_handlers
 from app.core.admin_notifications import notify_admin_of_request
 
@@ -135,16 +136,21 @@ async def handle_time_selection(callback: types.CallbackQuery, state: FSMContext
     
     selected_time_str = callback.data.split(":", 1)[1]
     start_time = datetime.fromisoformat(selected_time_str).replace(tzinfo=ZoneInfo("Europe/Moscow"))
-    teacher_id = int(fsm_data.get("selected_teacher_id", "1"))
-
-    logging.info(f"Вызов сервиса book_lesson для пользователя {user_db.id}. Преподаватель: {teacher_id}, Время: {start_time}")
-    
-    task_id, event_id, teacher_name = await book_lesson(
-        user_id=teacher_id,
-        start_time=start_time,
-        duration_minutes=60,
-        client_data=client_data
-    )
+    selected_date, selected_time = selected_time_str.split("T", 1)
+    # Преподаватели, свободные в этот слот; если слот успели занять, пробуем следующего
+    candidates = get_slot_teachers(fsm_data, selected_date, selected_time) or TEACHER_IDS[:1]
+
+    task_id = event_id = teacher_name = None
+    for teacher_id in candidates:
+        logging.info(f"Вызов сервиса book_lesson для пользователя {user_db.id}. Преподаватель: {teacher_id}, Время: {start_time}")
+        task_id, event_id, teacher_name = await book_lesson(
+            user_id=teacher_id,
+            start_time=start_time,
+            duration_minutes=60,
+            client_data=client_data
+        )
+        if task_id and event_id:
+            break
 
     if task_id and event_id:
         await add_trial_lesson(user_db.id, task_id, event_id, teacher_id, start_time)
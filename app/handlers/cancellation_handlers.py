@@ -18,6 +18,7 @@ from app.db.database import (
     get_lesson_by_id,
     get_or_create_user,
     load_history)
+from app.db.models import User
 
 # Сервис для работы с API Битрикс24 (отмена бронирования)
 from app.services.bitrix_service import cancel_booking
@@ -170,9 +171,10 @@ async def confirm_cancellation_and_ask_reason(callback: types.CallbackQuery, cal
 
 # --- НОВЫЙ ХЕНДЛЕР ДЛЯ ОБРАБОТКИ ПРИЧИНЫ ---
 @router.message(CancellationStates.awaiting_reason, F.text)
-async def process_cancellation_reason(message: types.Message, state: FSMContext):
+async def process_cancellation_reason(message: types.Message, state: FSMContext, db_user: User | None = None):
     """
     Шаг 2: Пользователь прислал причину. Выполняем отмену и завершаем процесс.
+    Пользователя (для истории диалога в уведомлении админу) передает DbSessionMiddleware.
     """
     cancellation_reason = message.text
     user_data = await state.get_data()
@@ -194,7 +196,8 @@ async def process_cancellation_reason(message: types.Message, state: FSMContext)
         logging.error(f"Критическая ошибка для пользователя {message.from_user.id}: {error_description}")
         
         # Вызываем администратора, чтобы он вручную проверил и удалил запись
-        history = await load_history(str(message.from_user.id))
+        user = db_user or await get_or_create_user(message.from_user.id, message.from_user.username)
+        history = await load_history(user.id)
         await notify_admin_on_error(
             bot=message.bot,
             user_id=message.from_user.id,
@@ -228,7 +231,8 @@ async def process_cancellation_reason(message: types.Message, state: FSMContext)
         logging.error(f"Ошибка для пользователя {message.from_user.id}: {error_description}")
         
         # Вызываем администратора, чтобы он вручную проверил и удалил запись
-        history = await load_history(str(message.from_user.id))
+        user = db_user or await get_or_create_user(message.from_user.id, message.from_user.username)
+        history = await load_history(user.id)
         await notify_admin_on_error(
             bot=message.bot,
             user_id=message.from_user.id,
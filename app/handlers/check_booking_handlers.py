@@ -8,7 +8,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 # Используем get_all_active_lessons вместо get_active_lesson
 from app.db.database import get_or_create_user, get_all_active_lessons
 from app.utils.formatters import format_date_russian
-from app.utils.text_tools import inflect_name
+from app.utils.text_tools import get_name_form
 
 router = Router()
 
@@ -47,8 +47,8 @@ async def start_check_booking_flow(message: types.Message, state: FSMContext, us
             reply_markup=get_no_lessons_keyboard()
         )
         return
-    child_name_raw = user.user_data.get('child_name', 'вашего ребенка')
-    child_name = inflect_name(child_name_raw, case='gent')
+    user_data = user.user_data or {}
+    child_name = get_name_form(user_data, 'child_name', 'gent') if user_data.get('child_name') else 'вашего ребенка'
     keyboard = get_check_booking_keyboard()
 
     if len(active_lessons) == 1:
@@ -11,9 +11,11 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from app.states.fsm_states import GenericFSM
 from app.utils.formatters import format_response_with_inflection
+from app.utils.template_compiler import precompile
 from app.core.business_logic import process_final_data
 from app.core.admin_notifications import notify_admin_on_error
-from app.db.database import save_user_details, set_onboarding_completed, load_history
+from app.db.database import save_user_details, set_onboarding_completed, load_history, get_or_create_user
+from app.db.models import User
 from app.handlers import booking_handlers
 
 # --- 1. ИНИЦИАЛИЗАЦИЯ И ЗАГРУЗКА СЦЕНАРИЯ ---
@@ -27,15 +29,22 @@ except (FileNotFoundError, json.JSONDecodeError) as e:
     logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить FSM-сценарий. {e}")
     FSM_CONFIG = {}
 
+# Тексты вопросов сценария разбираем на сегменты один раз, при загрузке
+precompile(
+    [step.get("question") for step in FSM_CONFIG.get("states", {}).values()]
+    + [FSM_CONFIG.get("final_message_template")]
+)
+
 # Опциональный импорт для расширенных функций
 try:
-    from app.utils.text_tools import correct_keyboard_layout, is_plausible_name
+    from app.utils.text_tools import correct_keyboard_layout, is_plausible_name, add_name_forms
     MORPHOLOGY_ENABLED = True
 except ImportError:
     logging.warning("Утилиты (text_tools.py) не найдены. Расширенные функции будут отключены.")
     MORPHOLOGY_ENABLED = False
     def correct_keyboard_layout(_: str) -> None: return None
     def is_plausible_name(_: str) -> bool: return True
+    def add_name_forms(data: dict) -> dict: return data
 
 
 # --- 2. ФУНКЦИЯ ДЛЯ СОЗДАНИЯ КНОПОК ИЗ СЦЕНАРИЯ ---
@@ -73,7 +82,8 @@ async def _ask_next_question(message: types.Message, state: FSMContext, step_nam
 async def _finish_fsm(message: types.Message, state: FSMContext):
     """Завершает FSM, обрабатывает данные, сохраняет их и предлагает записаться на урок."""
     fsm_data = await state.get_data()
-    user_answers = fsm_data.get("user_answers", {})
+    # Сразу считаем все падежные формы имен: дальше сообщения будут брать их из анкеты
+    user_answers = add_name_forms(fsm_data.get("user_answers", {}))
 
     await save_user_details(telegram_id=message.from_user.id, data=user_answers)
     await set_onboarding_completed(message.from_user.id)
@@ -137,8 +147,8 @@ async def handle_fsm_navigation(callback: types.CallbackQuery, state: FSMContext
 
 # --- 7. ЕДИНЫЙ ОБРАБОТЧИК ДЛЯ ВСЕХ ТЕКСТОВЫХ ОТВЕТОВ ВНУТРИ FSM ---
 @router.message(GenericFSM.InProgress)
-async def handle_fsm_step(message: types.Message, state: FSMContext):
-    """Обрабатывает ответ пользователя на любом шаге сценария."""
+async def handle_fsm_step(message: types.Message, state: FSMContext, db_user: User | None = None):
+    """Обрабатывает ответ пользователя на любом шаге сценария. Пользователя передает DbSessionMiddleware."""
     user_text = message.text.strip()
     fsm_data = await state.get_data()
     current_step_name = fsm_data.get("current_step")
@@ -150,7 +160,8 @@ async def handle_fsm_step(message: types.Message, state: FSMContext):
     current_step_config = FSM_CONFIG.get("states", {}).get(current_step_name)
     if not current_step_config:
         error_text = f"Ошибка в конфигурации сценария. Не найден шаг: {current_step_name}"
-        history = await load_history(str(message.from_user.id), limit=10)
+        user = db_user or await get_or_create_user(message.from_user.id, message.from_user.username)
+        history = await load_history(user.id, limit=10)
         await notify_admin_on_error(bot=message.bot, user_id=message.from_user.id, username=message.from_user.username, error_description=error_text, history=history)
         await message.answer("Ой, у меня техническая заминка. Уже позвал администратора, он скоро подключится!")
         await state.clear()
@@ -175,7 +175,10 @@ async def confirm_reschedule(callback: types.CallbackQuery, state: FSMContext):
     """Подтверждает перенос и запускает показ свободных дат."""
     await callback.message.edit_text("Отлично! Давайте подберем новое время.")
     await state.set_state(BookingFSM.rescheduling_in_progress)
-    await show_available_dates(callback, state) # Используем общую утилиту для показа дат
+    # Урок переносится у того же преподавателя, поэтому показываем только его свободное время
+    lesson = await get_lesson_by_id((await state.get_data()).get("lesson_to_reschedule_id"))
+    teacher_ids = [lesson.teacher_id] if lesson and lesson.teacher_id else None
+    await show_available_dates(callback, state, teacher_ids=teacher_ids) # Используем общую утилиту для показа дат
     await callback.answer()
 
 
@@ -8,12 +8,13 @@ from app.handlers.onboarding_handlers import start_fsm_scenario
 from app.handlers.cancellation_handlers import start_cancellation_flow
 from app.handlers import reschedule_handlers, check_booking_handlers, booking_handlers
 from app.handlers.cancellation_handlers import CancelCallbackFactory
-from app.db.database import get_or_create_user, save_history, load_history, get_all_active_lessons, increment_irrelevant_count, block_user
+from app.db.database import get_or_create_user, save_history, load_history, load_summary, get_all_active_lessons, increment_irrelevant_count, unit_of_work
+from app.db.models import User
 from app.core.template_service import find_template_by_keywords, build_template_response, TEMPLATES
 from app.core.llm_service import get_llm_response, is_query_relevant_ai
 from app.services.intent_recognizer import intent_recognizer_service
 from app.core.admin_notifications import notify_admin_of_request, notify_admin_on_error, notify_admin_of_block
-from app.utils.text_tools import correct_keyboard_layout
+from app.utils.normalization import NormalizedMessage, normalize_message
 from app.utils.formatters import format_date_russian
 
 from app.handlers.utils.keyboards import get_existing_user_menu, get_faq_menu
@@ -294,37 +295,45 @@ async def cq_faq_answer(callback: types.CallbackQuery):
 # =============================================================================
 
 @router.message(F.text, ~CommandStart())
-async def handle_any_text(message: types.Message, state: FSMContext):
-    """Главный диспетчер текстовых сообщений с полной логикой."""
+async def handle_any_text(
+    message: types.Message,
+    state: FSMContext,
+    normalized: NormalizedMessage | None = None,
+    db_user: User | None = None,
+):
+    """
+    Главный диспетчер текстовых сообщений с полной логикой.
+    Пользователя передает DbSessionMiddleware. История, сводка и новое сообщение читаются и
+    пишутся одной короткой единицей работы, которая фиксируется до любых сетевых вызовов.
+    """
     ## LOG ##
     logging.info(f"Обработка текстового сообщения от пользователя {message.from_user.id}. Текст: '{message.text}'")
-    original_text = message.text.strip()
-    corrected_text = correct_keyboard_layout(original_text)
-    
-    # Используем исправленный текст, если он был исправлен, иначе - оригинальный
-    user_text = corrected_text if corrected_text else original_text
+    # Текст нормализуется один раз в NormalizationMiddleware; здесь — запасной вариант без нее
+    if normalized is None:
+        normalized = normalize_message(message.text)
+    original_text = normalized.original
+
+    # Используем исправленный текст, если раскладка была исправлена, иначе - оригинальный
+    user_text = normalized.text
     logging.info(f"Обработка сообщения от {message.from_user.id}. Оригинал: '{original_text}', Исправлено: '{user_text}'")
-    history = await load_history(str(message.from_user.id))
+    history = []
     try:
-        user = await get_or_create_user(message.from_user.id, message.from_user.username)
-        if user.is_blocked:
-            ## LOG ##
-            logging.warning(f"Заблокированный пользователь {user.id} пытался отправить сообщение.")
-            await message.answer(
-                "Ваш аккаунт был временно ограничен из-за превышения лимита запросов не по теме. \n\n"
-                "Но не волнуйтесь, я уже передал всю информацию менеджеру, и он скоро с вами свяжется, чтобы во всем разобраться."
-            )
-            return
+        # Заблокированных пользователей до обработчика не пропускает DbSessionMiddleware
+        user = db_user or await get_or_create_user(message.from_user.id, message.from_user.username)
         # Проверяем, если пользователь еще не прошел онбординг,
         # то любое его текстовое сообщение будет запускать сценарий знакомства.
         if not user.onboarding_completed:
             logging.info(f"Новый пользователь {user.id} Отправили первое сообщение. Начинаем адаптацию")
             await show_greeting_screen(message, user, state)
             return
-        await save_history(str(user.id), "user", message.text.strip())
-        user_text = message.text.strip()
+        # История хранится по внутреннему id пользователя — тому же, что и при сохранении
+        async with unit_of_work() as session:
+            history = await load_history(user.id, session=session)
+            # Сводку читаем здесь же: к моменту запроса к LLM соединение уже должно быть свободно
+            summary = await load_summary(user.id, session=session)
+            await save_history(user.id, "user", original_text, session=session)
         
-        detected_intent = intent_recognizer_service.get_intent(user_text.lower())
+        detected_intent = intent_recognizer_service.get_intent(normalized)
         
         # Если интент распознан, логируем и обрабатываем
         if detected_intent:
@@ -379,7 +388,6 @@ async def handle_any_text(message: types.Message, state: FSMContext):
                         # (интент есть, а шаблона для него нет)
                         logging.error(f"КРИТИЧЕСКАЯ ОШИБКА: Интент '{detected_intent}' есть, но шаблон для него в templates.py отсутствует!")
                 case "greeting":
-                    user = await get_or_create_user(message.from_user.id, message.from_user.username)
                     parent_name = user.user_data.get('parent_name', message.from_user.first_name)
                     await show_greeting_screen(message, user, state)
                     return
@@ -392,10 +400,12 @@ async def handle_any_text(message: types.Message, state: FSMContext):
         if not await is_query_relevant_ai(user_text, history):
             ## LOG ##
             logging.warning(f"Запрос от пользователя {user.id} отмечен как нерелевантный.")
-            user.irrelevant_count += 1
-            remaining_attempts = IRRELEVANT_QUERY_LIMIT - user.irrelevant_count
-            if remaining_attempts > 0:
-                await increment_irrelevant_count(user.id)
+            # Счетчик и блокировка при достижении лимита меняются одним атомарным UPDATE
+            # Своя короткая сессия: запись фиксируется до уведомлений и ответа пользователю
+            _irrelevant_count, is_blocked = await increment_irrelevant_count(
+                user.id, block_limit=IRRELEVANT_QUERY_LIMIT
+            )
+            if not is_blocked:
                 await message.answer(
                     "Простите, не совсем вас понял. Похоже, в вашем сообщении опечатка или оно не связано с работой нашей школы. \n\n"
                     "Пожалуйста, попробуйте переформулировать ваш вопрос. Я здесь, чтобы помочь с курсами по программированию."
@@ -403,7 +413,6 @@ async def handle_any_text(message: types.Message, state: FSMContext):
             else:
                 ## LOG ##
                 logging.warning(f"Блокировка пользователя {user.id} из-за повторяющихся нерелевантных запросов")
-                await block_user(user.id)
                 await notify_admin_of_block(
                     bot=message.bot, 
                     user=message.from_user, 
@@ -416,7 +425,7 @@ async def handle_any_text(message: types.Message, state: FSMContext):
         ## LOG ##
         logging.info(f"Query from {user.id} is relevant. Sending to LLM.")
         await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        llm_response = await get_llm_response(user_text, history)
+        llm_response = await get_llm_response(user_text, history, summary=summary)
         await message.answer(llm_response)
 
     except Exception as e:
@@ -1,5 +1,5 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Union
 from zoneinfo import ZoneInfo
 
@@ -9,14 +9,15 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, CallbackQuery
 
 from app.config import TEACHER_IDS
-from app.services.bitrix_service import get_free_slots
+from app.services.bitrix_service import get_available_slots
 from app.states.fsm_states import BookingFSM
 # Убедитесь, что ваш форматтер поддерживает режим 'date_only'
 from app.utils.formatters import format_date_russian
 
-async def show_available_dates(event: Union[Message, CallbackQuery], state: FSMContext):
+async def show_available_dates(event: Union[Message, CallbackQuery], state: FSMContext, teacher_ids: list[int] | None = None):
     """
     Получает слоты и отображает пользователю кнопки с выбором даты.
+    teacher_ids ограничивает расписание конкретными преподавателями (например, при переносе урока).
     """
     is_callback = isinstance(event, CallbackQuery)
     message_to_edit: Message
@@ -34,8 +35,8 @@ async def show_available_dates(event: Union[Message, CallbackQuery], state: FSMC
 
     try:
         portal_tz = ZoneInfo("Europe/Moscow")
-        now = datetime.now(portal_tz)
-        free_slots_by_date = await get_free_slots(from_date=now, to_date=now + timedelta(days=7), user_ids=TEACHER_IDS)
+        # Слоты общие для всех пользователей и отдаются из кэша
+        free_slots_by_date = await get_available_slots(teacher_ids or TEACHER_IDS, portal_tz, days=7)
 
         if not free_slots_by_date:
             await message_to_edit.edit_text("К сожалению, на ближайшую неделю свободных окон нет.")
@@ -88,3 +89,11 @@ async def get_time_keyboard(state: FSMContext, selected_date: str) -> InlineKeyb
     grouped_buttons.append([InlineKeyboardButton(text="⬅️ Назад к выбору дня", callback_data="back_to_dates")])
     
     return InlineKeyboardMarkup(inline_keyboard=grouped_buttons)
+
+
+def get_slot_teachers(fsm_data: dict, selected_date: str, selected_time: str) -> list[int]:
+    """Преподаватели, свободные в выбранный слот, по расписанию, сохраненному в FSM."""
+    for slot in fsm_data.get('free_slots', {}).get(selected_date, []):
+        if slot['time'] == selected_time:
+            return list(slot['user_ids'])
+    return []
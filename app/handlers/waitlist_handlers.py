@@ -23,7 +23,8 @@ async def process_waitlist_contact(message: types.Message, state: FSMContext):
     contact_info = message.text
     user = await get_or_create_user(message.from_user.id, message.from_user.username)
     
-    current_data = user.user_data or {}
+    # Меняем копию: в БД уходит новый словарь, а объект пользователя остается как был
+    current_data = dict(user.user_data or {})
     current_data['waitlist_contact'] = contact_info
     current_data['waitlist_for_age'] = '<9' # или другой идентификатор
     
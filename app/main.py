@@ -9,9 +9,21 @@ from aiogram.client.bot import DefaultBotProperties
 from aiogram.types import BotCommand
 
 # --- 1. Импорт конфигурации и сервисов ---
-from app.config import TELEGRAM_BOT_TOKEN, LOG_LEVEL
-from app.db.database import init_db
-from app.services.bitrix_service import check_b24_connection
+from app.config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, TEACHER_IDS
+from app.db.database import init_db, async_session_factory
+from app.db.history_buffer import history_buffer
+from app.db.history_cache import history_cache
+from app.db.retention import history_retention
+from app.db.user_cache import user_cache
+from app.services.bitrix_service import check_b24_connection, fetch_teacher_directory
+from app.services.b24_client import b24_client
+from app.services.availability_cache import availability_cache
+from app.services.teacher_directory import teacher_directory
+from app.core.llm_service import summarize_dialog
+from app.services.enrollment_counter import enrollment_counter
+from app.utils.morph import get_morph, morph_stats
+from app.middlewares.normalization import NormalizationMiddleware
+from app.middlewares.db_session import DbSessionMiddleware
 
 # --- 2. Корректный импорт всех роутеров ---
 from app.handlers import (
@@ -51,13 +63,33 @@ async def main():
     
     await init_db()
     logging.info("База данных успешно инициализирована.")
+
+    enrolled_count = await enrollment_counter.reconcile()
+    logging.info(f"Счетчик зачисленных учеников загружен: {enrolled_count}.")
+    reconcile_task = asyncio.create_task(enrollment_counter.run_reconcile_loop())
+    # История диалога пишется пакетами в фоне; остаток дописывается при остановке
+    history_buffer.start(async_session_factory)
+    # Старые реплики диалога периодически сворачиваются в сводку и удаляются
+    history_retention.start(summarizer=summarize_dialog)
     
+    # Загружаем словари морфологии заранее, чтобы первый пользователь не ждал
+    get_morph()
+    stats = morph_stats()
+    logging.info(f"Морфология: загрузка {stats['load_seconds']:.2f} с, память ~{stats['memory_mb']:.1f} МБ.")
+
+    # Один пул соединений с Битрикс24 на все время работы бота
+    b24_client.start()
     logging.info("Проверка соединения с Битрикс24...")
     await check_b24_connection()
+    # Имена и календари преподавателей: из файла и обновление из Битрикс24
+    await teacher_directory.start(fetch_teacher_directory, TEACHER_IDS)
     
     storage = MemoryStorage()
     bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
     dp = Dispatcher(storage=storage)
+    # Пользователь апдейта находится в короткой сессии и передается обработчикам как 'db_user'
+    dp.message.middleware(DbSessionMiddleware())
+    dp.callback_query.middleware(DbSessionMiddleware())
 
     # ---РЕГИСТРАЦИЯ РОУТЕРОВ В ПРАВИЛЬНОМ ПОРЯДКЕ ---
     # Порядок регистрации критически важен для корректной работы!    
@@ -73,6 +105,10 @@ async def main():
     dp.include_router(onboarding_handlers.router)
     dp.include_router(callback_handlers.router)    
     # В последнюю очередь регистрируем "catch-all" диспетчер для всех остальных текстовых сообщений.
+    # Нормализация (раскладка, леммы) нужна только ему: ответы в FSM-сценариях (имена, возраст,
+    # телефоны) до распознавания интентов не доходят. Внутренний middleware роутера вызывается,
+    # только когда сообщение досталось его обработчику.
+    sales_funnel.router.message.middleware(NormalizationMiddleware())
     dp.include_router(sales_funnel.router)      
     logging.info("Все роутеры успешно зарегистрированы.")
     await set_main_menu(bot)
@@ -86,6 +122,15 @@ async def main():
     try:
         await dp.start_polling(bot, allowed_updates=allowed_updates)
     finally:
+        reconcile_task.cancel()
+        history_retention.stop()
+        teacher_directory.stop()
+        await history_buffer.stop()
+        await b24_client.close()
+        logging.info(f"Кэш истории диалога: {history_cache.stats()}")
+        logging.info(f"Кэш пользователей: {user_cache.stats()}")
+        logging.info(f"Кэш свободных слотов: {availability_cache.stats}")
+        logging.info(f"Справочник преподавателей: {teacher_directory.stats}")
         await bot.session.close()
         logging.info("Сессия бота закрыта.")
 
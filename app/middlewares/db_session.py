@@ -0,0 +1,56 @@
+# app/middlewares/db_session.py
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, User as TelegramUser
+
+from app.db.database import get_or_create_user, unit_of_work
+from app.db.stats import track_queries
+from app.db.user_cache import user_cache
+
+BLOCKED_MESSAGE = (
+    "Ваш аккаунт был временно ограничен из-за превышения лимита запросов не по теме. \n\n"
+    "Но не волнуйтесь, я уже передал всю информацию менеджеру, и он скоро с вами свяжется, чтобы во всем разобраться."
+)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Находит (или создает) пользователя апдейта в короткой сессии и передает его обработчикам
+    как 'db_user'. Сессия закрывается до вызова обработчика: обработчики ждут LLM, Telegram и
+    Битрикс24, и открытая на все это время сессия держала бы соединение из пула (а на SQLite —
+    блокировку записи). Свои чтения и записи обработчики группируют в database.unit_of_work().
+    Заблокированные пользователи, известные кэшу, отсекаются без обращения к БД.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        if from_user is not None and user_cache.is_blocked(from_user.id):
+            return await self._reject_blocked(event, from_user)
+        with track_queries() as stats:
+            if from_user is not None:
+                async with unit_of_work() as session:
+                    db_user = await get_or_create_user(from_user.id, from_user.username, session=session)
+                if db_user.is_blocked:
+                    return await self._reject_blocked(event, from_user)
+                data["db_user"] = db_user
+            result = await handler(event, data)
+        logging.debug(
+            f"Апдейт от {from_user.id if from_user else '-'}: "
+            f"SQL-запросов {stats.queries}, коммитов {stats.commits}."
+        )
+        return result
+
+    @staticmethod
+    async def _reject_blocked(event: TelegramObject, from_user: TelegramUser):
+        logging.warning(f"Заблокированный пользователь {from_user.id} пытался обратиться к боту.")
+        if isinstance(event, Message):
+            await event.answer(BLOCKED_MESSAGE)
+        elif isinstance(event, CallbackQuery):
+            await event.answer("Доступ временно ограничен. Менеджер скоро свяжется с вами.", show_alert=True)
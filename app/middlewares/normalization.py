@@ -0,0 +1,26 @@
+# app/middlewares/normalization.py
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from app.utils.normalization import normalize_message
+
+
+class NormalizationMiddleware(BaseMiddleware):
+    """
+    Нормализует текст входящего сообщения один раз на апдейт и кладет результат
+    в данные обработчика под ключом 'normalized' (объект NormalizedMessage).
+    Подключается к роутеру свободного текста (sales_funnel), а не ко всему диспетчеру,
+    чтобы не лемматизировать ответы в FSM-сценариях, которым результат не нужен.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Message) and event.text:
+            data["normalized"] = normalize_message(event.text)
+        return await handler(event, data)
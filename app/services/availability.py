@@ -0,0 +1,132 @@
+# app/services/availability.py
+
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from app.config import (
+    AVAILABILITY_WORK_START, AVAILABILITY_WORK_END, AVAILABILITY_WORK_DAYS,
+    AVAILABILITY_SLOT_STEP_MINUTES, AVAILABILITY_BUFFER_MINUTES,
+)
+
+Interval = Tuple[datetime, datetime]
+
+
+class WorkingHours:
+    """Рабочее время преподавателей: часы начала и конца дня, рабочие дни недели (0 — понедельник)."""
+    def __init__(self, start: time, end: time, weekdays: Iterable[int] = (0, 1, 2, 3, 4)):
+        self.start = start
+        self.end = end
+        self.weekdays = frozenset(weekdays)
+
+    def windows(self, from_date: datetime, to_date: datetime) -> List[Interval]:
+        """Рабочие окна всех дней диапазона в часовом поясе from_date."""
+        windows = []
+        day = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day <= to_date:
+            if day.weekday() in self.weekdays:
+                windows.append((
+                    day.replace(hour=self.start.hour, minute=self.start.minute),
+                    day.replace(hour=self.end.hour, minute=self.end.minute),
+                ))
+            day += timedelta(days=1)
+        return windows
+
+
+def merge_intervals(intervals: Iterable[Interval], padding: timedelta = timedelta(0)) -> List[Interval]:
+    """
+    Сортирует интервалы и склеивает пересекающиеся и соприкасающиеся.
+    padding расширяет каждый интервал в обе стороны (перерыв между уроками).
+    """
+    merged: List[Interval] = []
+    for start, end in sorted((start - padding, end + padding) for start, end in intervals if end > start):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slot_starts(busy: List[Interval], windows: List[Interval], duration: timedelta,
+                     step: timedelta, not_before: datetime | None = None) -> List[datetime]:
+    """
+    Начала слотов длительностью duration, которые целиком помещаются в рабочие окна и не
+    пересекаются с занятостью. busy — результат merge_intervals, windows — по возрастанию.
+    Один проход по окнам и занятым интервалам: O(окна + интервалы + слоты).
+    Слоты выровнены по сетке step от начала каждого рабочего окна.
+    """
+    starts: List[datetime] = []
+    i = 0
+    for window_start, window_end in windows:
+        # Занятость, закончившаяся до окна, не влияет ни на это, ни на следующие окна
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        cursor = window_start
+        j = i
+        while cursor < window_end:
+            gap_end = window_end
+            if j < len(busy) and busy[j][0] < window_end:
+                gap_end = min(window_end, busy[j][0])
+            # Свободный промежуток [cursor, gap_end): раскладываем по сетке от начала окна
+            slot = window_start + step * _ceil_steps(max(cursor, not_before or cursor) - window_start, step)
+            while slot + duration <= gap_end:
+                starts.append(slot)
+                slot += step
+            if gap_end >= window_end:
+                break
+            cursor = max(cursor, busy[j][1])
+            j += 1
+    return starts
+
+
+def _ceil_steps(offset: timedelta, step: timedelta) -> int:
+    if offset <= timedelta(0):
+        return 0
+    return -(-offset // step)
+
+
+class AvailabilityEngine:
+    """
+    Считает свободные слоты по занятости каждого преподавателя отдельно: интервалы
+    сортируются и склеиваются один раз, затем один проход по рабочим окнам.
+    В результате у каждого слота список именно тех преподавателей, кто в это время свободен.
+    """
+    def __init__(self, working_hours: WorkingHours, step_minutes: int = 60, buffer_minutes: int = 0):
+        self.working_hours = working_hours
+        self.step = timedelta(minutes=step_minutes)
+        self.buffer = timedelta(minutes=buffer_minutes)
+
+    def teacher_slots(self, busy: Iterable[Interval], from_date: datetime, to_date: datetime,
+                      duration_minutes: int, now: datetime | None = None) -> List[datetime]:
+        windows = self.working_hours.windows(from_date, to_date)
+        merged = merge_intervals(busy, padding=self.buffer)
+        return free_slot_starts(merged, windows, timedelta(minutes=duration_minutes), self.step, not_before=now)
+
+    def slots_by_date(self, calendars: Dict[int, List[Interval]], from_date: datetime, to_date: datetime,
+                      duration_minutes: int, now: datetime | None = None) -> Dict[str, List[dict]]:
+        """
+        Свободные слоты в формате бота: {'YYYY-MM-DD': [{'time': 'HH:MM', 'user_ids': [...]}, ...]},
+        время по возрастанию, в user_ids — только свободные в этот слот преподаватели.
+        """
+        teachers_by_start: Dict[datetime, List[int]] = {}
+        for teacher_id, busy in calendars.items():
+            for start in self.teacher_slots(busy, from_date, to_date, duration_minutes, now):
+                teachers_by_start.setdefault(start, []).append(teacher_id)
+        slots: Dict[str, List[dict]] = {}
+        for start in sorted(teachers_by_start):
+            slots.setdefault(start.strftime('%Y-%m-%d'), []).append(
+                {'time': start.strftime('%H:%M'), 'user_ids': teachers_by_start[start]}
+            )
+        return slots
+
+
+# Единый движок расписания для всего приложения
+availability_engine = AvailabilityEngine(
+    WorkingHours(
+        time.fromisoformat(AVAILABILITY_WORK_START),
+        time.fromisoformat(AVAILABILITY_WORK_END),
+        AVAILABILITY_WORK_DAYS,
+    ),
+    step_minutes=AVAILABILITY_SLOT_STEP_MINUTES,
+    buffer_minutes=AVAILABILITY_BUFFER_MINUTES,
+)
@@ -0,0 +1,99 @@
+# app/services/availability_cache.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.config import AVAILABILITY_TTL_SECONDS, AVAILABILITY_STALE_SECONDS
+from app.services.b24_client import PRIORITY_HIGH, SharedPriority, background_priority, current_priority
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value: Any, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class AvailabilityCache:
+    """
+    Общий для всех пользователей кэш свободных слотов (ключ — набор преподавателей и горизонт).
+    - Свежая запись (моложе ttl) отдается из памяти.
+    - Устаревшая, но не старше ttl + stale, тоже отдается сразу, а обновление идет в фоне.
+    - Одновременные промахи по одному ключу ждут один общий запрос к Битрикс24 (single-flight).
+    Бронирование, отмена и перенос через бота сбрасывают кэш; запрос, начатый до сброса,
+    свой результат в кэш уже не кладет. Функцию загрузки передает вызывающий код.
+    """
+    def __init__(self, ttl_seconds: float = 30, stale_seconds: float = 120):
+        self.ttl = ttl_seconds
+        self.stale = stale_seconds
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Приоритет фоновых обновлений: повышается, если к обновлению присоединился пользователь
+        self._priorities: Dict[asyncio.Task, SharedPriority] = {}
+        # Номер поколения растет при каждом сбросе
+        self._generation = 0
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "fetches": 0, "invalidations": 0}
+
+    async def get(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        age = time.monotonic() - entry.fetched_at if entry is not None else None
+        if age is not None and age < self.ttl:
+            self.stats["hits"] += 1
+            return entry.value
+        if age is not None and age < self.ttl + self.stale:
+            self.stats["stale_hits"] += 1
+            # Фоновое обновление никто не ждет, поэтому его запросы идут с низким приоритетом
+            self._fetch(key, fetcher, background=True)
+            return entry.value
+        self.stats["misses"] += 1
+        # shield: отмена одного ожидающего не должна отменять общий запрос для остальных
+        return await asyncio.shield(self._fetch(key, fetcher))
+
+    def invalidate(self):
+        """Сбрасывает все записи: бронирование меняет занятость преподавателя в любом наборе."""
+        self._generation += 1
+        self._entries.clear()
+        # Начатые до сброса запросы дорабатывают, но новые вызовы к ним уже не присоединяются
+        self._inflight.clear()
+        self.stats["invalidations"] += 1
+
+    def _fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]], background: bool = False) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            if background:
+                shared = SharedPriority()
+                with background_priority(shared):
+                    task = asyncio.create_task(self._load(key, fetcher, self._generation))
+                self._priorities[task] = shared
+            else:
+                task = asyncio.create_task(self._load(key, fetcher, self._generation))
+            # Ошибку фонового обновления уже записали в лог; помечаем ее как полученную
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            task.add_done_callback(lambda t: self._priorities.pop(t, None))
+            self._inflight[key] = task
+        elif not background and current_priority() == PRIORITY_HIGH and task in self._priorities:
+            # Пользователь ждет результат фонового обновления: дальше оно идет с его приоритетом
+            self._priorities.pop(task).promote()
+        return task
+
+    async def _load(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            self.stats["fetches"] += 1
+            value = await fetcher()
+            # Пустой результат не кэшируем: это может быть ошибка Битрикс24, следующий запрос повторит попытку
+            if value and generation == self._generation:
+                self._entries[key] = _Entry(value, time.monotonic())
+            return value
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении кэша свободных слотов {key}: {e}", exc_info=True)
+            raise
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+
+# Единый кэш свободных слотов для всего приложения
+availability_cache = AvailabilityCache(ttl_seconds=AVAILABILITY_TTL_SECONDS, stale_seconds=AVAILABILITY_STALE_SECONDS)
@@ -0,0 +1,326 @@
+# app/services/b24_client.py
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+from app.config import (
+    BITRIX24_WEBHOOK_URL, B24_MAX_CONNECTIONS, B24_MAX_KEEPALIVE, B24_KEEPALIVE_EXPIRY,
+    B24_HTTP2, B24_VERIFY_SSL, B24_TIMEOUT_SECONDS,
+    B24_RATE_LIMIT_RPS, B24_RATE_LIMIT_BURST, B24_RATE_LIMIT_RETRIES,
+    B24_RATE_LIMIT_BACKOFF_BASE, B24_RATE_LIMIT_BACKOFF_MAX,
+)
+
+try:
+    import h2  # noqa: F401 — нужен httpx для HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Таймауты (секунд) для методов, которым нужно больше или меньше времени, чем по умолчанию
+METHOD_TIMEOUTS = {
+    "app.info": 5,
+    "user.get": 5,
+    "calendar.section.get": 5,
+    "calendar.event.get": 10,
+}
+# На установку соединения даем не больше 5 секунд при любом таймауте метода
+CONNECT_TIMEOUT = 5
+
+# Ошибки, которыми Битрикс24 сообщает о превышении лимита запросов
+RATE_LIMIT_ERRORS = {"QUERY_LIMIT_EXCEEDED"}
+
+# Приоритет вызовов: меньшее значение обслуживается раньше
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+
+class SharedPriority:
+    """
+    Приоритет общей задачи, результат которой может понадобиться пользователю (single-flight
+    кэша слотов). Начинается с LOW; promote() поднимает его до HIGH, в том числе для вызовов,
+    которые уже ждут в очереди ограничителя.
+    """
+    def __init__(self, value: int = PRIORITY_LOW):
+        self.value = value
+        self._limiters: set = set()
+
+    def promote(self):
+        if self.value == PRIORITY_HIGH:
+            return
+        self.value = PRIORITY_HIGH
+        for limiter in self._limiters:
+            limiter.reorder()
+
+
+_priority: ContextVar[int | SharedPriority] = ContextVar("b24_priority", default=PRIORITY_HIGH)
+
+
+def _level(priority: int | SharedPriority) -> int:
+    return priority.value if isinstance(priority, SharedPriority) else priority
+
+
+def current_priority() -> int:
+    """Приоритет, с которым сейчас уйдут вызовы Битрикс24 из текущего контекста."""
+    return _level(_priority.get())
+
+
+@contextmanager
+def background_priority(shared: SharedPriority | None = None):
+    """
+    Вызовы Битрикс24 внутри блока (и в созданных в нем задачах) уступают очередь пользовательским.
+    С shared приоритет можно позже поднять через shared.promote().
+    """
+    token = _priority.set(shared if shared is not None else PRIORITY_LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+    """
+    Token bucket на все вызовы Битрикс24: rate запросов в секунду, запас до burst подряд.
+    Когда токенов нет, вызовы ждут в очереди по приоритету (HIGH раньше LOW), внутри
+    приоритета — по порядку прихода. rate <= 0 отключает ограничение.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self.stats = {
+            "acquired": 0, "throttled": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            "throttled_high": 0, "throttled_low": 0,
+        }
+
+    async def acquire(self, priority: int | SharedPriority = PRIORITY_HIGH) -> float:
+        """Ждет токен и возвращает время ожидания в секундах."""
+        self.stats["acquired"] += 1
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        if isinstance(priority, SharedPriority):
+            priority._limiters.add(self)
+        # Запись — список: при повышении приоритета reorder() меняет первый элемент на месте
+        heapq.heappush(self._waiters, [_level(priority), next(self._seq), future, priority])
+        self._schedule()
+        await future
+        waited = time.monotonic() - started_at
+        self.stats["throttled"] += 1
+        self.stats["throttled_high" if _level(priority) == PRIORITY_HIGH else "throttled_low"] += 1
+        self.stats["wait_seconds"] += waited
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        return waited
+
+    def reorder(self):
+        """Пересчитывает очередь после SharedPriority.promote()."""
+        for waiter in self._waiters:
+            waiter[0] = _level(waiter[3])
+        heapq.heapify(self._waiters)
+
+    def drain(self):
+        """Битрикс24 ответил, что лимит исчерпан: сбрасываем запас, чтобы не добивать его подряд."""
+        self._refill()
+        self._tokens = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future, _ = heapq.heappop(self._waiters)
+            # Ожидание могли отменить — токен достанется следующему
+            if not future.done():
+                future.set_result(None)
+                self._tokens -= 1
+        self._schedule()
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "wait_seconds": round(self.stats["wait_seconds"], 3),
+                "max_wait_seconds": round(self.stats["max_wait_seconds"], 3), "queued": len(self._waiters)}
+
+
+class Bitrix24Client:
+    """
+    Один долгоживущий httpx.AsyncClient на все вызовы REST API Битрикс24.
+    Соединения держатся в пуле (keep-alive), поэтому TCP- и TLS-рукопожатия платятся
+    один раз, а не на каждый вызов. Жизненным циклом управляет main.py: start() при запуске
+    и close() при остановке. Через trace-расширение httpx считается, сколько запросов
+    ушло по уже открытому соединению.
+    Все вызовы проходят через общий RateLimiter, а ответы о превышении лимита повторяются
+    с экспоненциальной задержкой со случайной составляющей.
+    """
+    def __init__(self, webhook_url: str | None, max_connections: int = 10, max_keepalive: int = 5,
+                 keepalive_expiry: float = 60, http2: bool = False, verify: bool = False,
+                 default_timeout: float = 15, rate_limit: float = 2, burst: int = 4,
+                 limit_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 8):
+        self.webhook_url = (webhook_url or "").rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.verify = verify
+        self.default_timeout = default_timeout
+        self.limiter = RateLimiter(rate_limit, burst)
+        self.limit_retries = limit_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client: httpx.AsyncClient | None = None
+        self.stats = {"requests": 0, "new_connections": 0, "network_errors": 0, "api_errors": 0,
+                      "limit_retries": 0, "limit_failures": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Клиент пула; если start() не вызывался (отдельные скрипты), создается при первом обращении."""
+        if self._client is None or self._client.is_closed:
+            self.start()
+        return self._client
+
+    def start(self, transport: httpx.AsyncBaseTransport | None = None):
+        """Создает клиент. transport позволяет подменить сеть (тесты, бенчмарки)."""
+        http2 = self.http2
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning("B24_HTTP2 включен, но пакет h2 не установлен (pip install httpx[http2]). Используется HTTP/1.1.")
+            http2 = False
+        self._client = httpx.AsyncClient(
+            verify=self.verify,
+            http2=http2,
+            limits=self.limits,
+            timeout=httpx.Timeout(self.default_timeout, connect=CONNECT_TIMEOUT),
+            transport=transport,
+        )
+        logging.info(
+            f"HTTP-клиент Битрикс24 создан: до {self.limits.max_connections} соединений, "
+            f"keep-alive {self.limits.max_keepalive_connections}, HTTP/2 {'вкл' if http2 else 'выкл'}."
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logging.info(f"HTTP-клиент Битрикс24 закрыт. Статистика соединений: {self.connection_stats()}")
+            logging.info(f"Ограничитель запросов Битрикс24: {self.limiter.snapshot()}")
+
+    def timeout_for(self, method: str) -> httpx.Timeout:
+        return httpx.Timeout(METHOD_TIMEOUTS.get(method, self.default_timeout), connect=CONNECT_TIMEOUT)
+
+    async def call(self, method: str, params: dict | None = None) -> dict:
+        """
+        Вызывает метод REST API и возвращает словарь ответа в любом случае:
+        сетевые ошибки и невалидный JSON превращаются в {"error": ..., "error_description": ...}.
+        Ответ о превышении лимита повторяется до limit_retries раз, затем возвращается как есть.
+        """
+        # SharedPriority передаем как есть: если его повысят, повторы тоже пойдут с HIGH
+        priority = _priority.get()
+        for attempt in range(self.limit_retries + 1):
+            await self.limiter.acquire(priority)
+            response_data = await self._send(method, params or {})
+            if not (isinstance(response_data, dict) and response_data.get("error") in RATE_LIMIT_ERRORS):
+                return response_data
+            self.limiter.drain()
+            if attempt == self.limit_retries:
+                break
+            delay = self.backoff_delay(attempt)
+            self.stats["limit_retries"] += 1
+            logging.warning(f"Битрикс24 ограничил частоту запросов ({method}), повтор {attempt + 1} через {delay:.2f} с.")
+            await asyncio.sleep(delay)
+        self.stats["limit_failures"] += 1
+        logging.error(f"Битрикс24 ограничил частоту запросов ({method}), попытки исчерпаны: {response_data.get('error_description')}")
+        return response_data
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Экспоненциальная задержка: половина фиксированная, половина случайная, чтобы повторы не шли залпом."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _send(self, method: str, params: dict) -> dict:
+        url = f"{self.webhook_url}/{method}"
+        # Логируем ПОЛНЫЙ запрос, включая URL и параметры
+        logging.info(f"Отправка запроса в Bitrix24. URL: {url}, Параметры: {json.dumps(params, ensure_ascii=False, default=str)}")
+        self.stats["requests"] += 1
+        try:
+            response = await self.client.post(
+                url, json=params, timeout=self.timeout_for(method), extensions={"trace": self._trace},
+            )
+        except httpx.RequestError as e:
+            self.stats["network_errors"] += 1
+            logging.error(f"Ошибка сети при вызове {method}: {e}", exc_info=True)
+            return {"error": "NETWORK_ERROR", "error_description": str(e)}
+
+        # Логируем код ответа и сырой текст — это критически важно для отладки 400-х ошибок
+        logging.info(f"Получен ответ от Bitrix24. Статус: {response.status_code}, Тело ответа: {response.text}")
+        try:
+            # Пытаемся декодировать JSON, даже если статус - ошибка
+            response_data = response.json()
+        except json.JSONDecodeError:
+            self.stats["api_errors"] += 1
+            logging.error(f"Ошибка декодирования JSON ответа от {method}. Сырой ответ: {response.text}")
+            return {"error": "JSON_DECODE_ERROR", "error_description": f"Invalid JSON received: {response.text}"}
+
+        # Проверяем на ошибки уровня приложения (не-HTTP); о превышении лимита сообщит call()
+        if isinstance(response_data, dict) and response_data.get("error") and response_data["error"] not in RATE_LIMIT_ERRORS:
+            self.stats["api_errors"] += 1
+            logging.error(
+                f"API Битрикс24 вернул ошибку для метода {method}. "
+                f"Код: {response_data.get('error')}, Описание: {response_data.get('error_description')}"
+            )
+        return response_data
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpcore сообщает об открытии нового TCP-соединения; остальные запросы шли по пулу
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["new_connections"] += 1
+
+    def connection_stats(self) -> dict:
+        requests = self.stats["requests"]
+        reused = max(0, requests - self.stats["new_connections"] - self.stats["network_errors"])
+        return {
+            **self.stats,
+            "reused": reused,
+            "reuse_rate": round(reused / requests, 3) if requests else 0.0,
+        }
+
+
+# Единый клиент Битрикс24 для всего приложения
+b24_client = Bitrix24Client(
+    BITRIX24_WEBHOOK_URL,
+    max_connections=B24_MAX_CONNECTIONS,
+    max_keepalive=B24_MAX_KEEPALIVE,
+    keepalive_expiry=B24_KEEPALIVE_EXPIRY,
+    http2=B24_HTTP2,
+    verify=B24_VERIFY_SSL,
+    default_timeout=B24_TIMEOUT_SECONDS,
+    rate_limit=B24_RATE_LIMIT_RPS,
+    burst=B24_RATE_LIMIT_BURST,
+    limit_retries=B24_RATE_LIMIT_RETRIES,
+    backoff_base=B24_RATE_LIMIT_BACKOFF_BASE,
+    backoff_max=B24_RATE_LIMIT_BACKOFF_MAX,
+)
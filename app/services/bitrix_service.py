@@ -1,12 +1,14 @@
-import httpx
 import logging
-import json
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 from zoneinfo import ZoneInfo
 import asyncio
 
-from app.config import BITRIX24_WEBHOOK_URL, GROUP_ID
+from app.config import BITRIX24_WEBHOOK_URL, GROUP_ID, B24_CALENDAR_CONCURRENCY
+from app.services.b24_client import b24_client
+from app.services.availability_cache import availability_cache
+from app.services.availability import availability_engine
+from app.services.teacher_directory import teacher_directory
 
 try:
     from app.utils.text_tools import inflect_name
@@ -24,28 +26,14 @@ async def check_b24_connection():
         logging.error("URL вебхука Битрикс24 (BITRIX24_WEBHOOK_URL) не настроен в .env файле.")
         return None
 
-    api_method = "app.info"
-    url = f"{BITRIX24_WEBHOOK_URL.rstrip('/')}/{api_method}"
-
-    try:
-        # Для коробочных версий оставляем verify=False
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'result' in data:
-                logging.info("Соединение с Битрикс24 успешно установлено!")
-                api_version = data['result'].get('VERSION', 'недоступна (стандартно для вебхука)')
-                logging.info(f"Версия REST API: {api_version}")
-                return data['result']
-            else:
-                logging.error(f"Ошибка при запросе к Битрикс24: {data.get('error_description') or data}")
-                return None
-
-    except httpx.RequestError as e:
-        logging.error(f"Ошибка HTTP-запроса к Битрикс24: {e}")
-        return None
+    data = await make_b24_request('app.info', {})
+    if 'result' in data:
+        logging.info("Соединение с Битрикс24 успешно установлено!")
+        api_version = data['result'].get('VERSION', 'недоступна (стандартно для вебхука)')
+        logging.info(f"Версия REST API: {api_version}")
+        return data['result']
+    logging.error(f"Ошибка при запросе к Битрикс24: {data.get('error_description') or data}")
+    return None
 
 # Этот блок для самостоятельного тестирования файла оставляем, он полезен
 if __name__ == "__main__":
@@ -71,153 +59,285 @@ def _parse_b24_date(date_str: str, tz: ZoneInfo):
             return None
         
 # --- УНИВЕРСАЛЬНАЯ ФУНКЦИЯ-УТИЛИТА ---
-async def make_b24_request(client: httpx.AsyncClient, method: str, params: dict) -> dict:
+async def make_b24_request(method: str, params: dict) -> dict:
     """
     Универсальная функция для отправки запросов к API Битрикс24 с расширенным логированием.
+    Запрос идет через общий пул соединений b24_client.
     Возвращает словарь ответа от API в любом случае, чтобы обеспечить детальное логирование.
     """
-    url = f"{BITRIX24_WEBHOOK_URL.rstrip('/')}/{method}"
-    
-    # Логируем ПОЛНЫЙ запрос, включая URL и параметры
-    logging.info(f"Отправка запроса в Bitrix24. URL: {url}, Параметры: {json.dumps(params, ensure_ascii=False)}")
-    
-    try:
-        response = await client.post(url, json=params, timeout=15)
-        
-        # Логируем код ответа и сырой текст — это критически важно для отладки 400-х ошибок
-        logging.info(f"Получен ответ от Bitrix24. Статус: {response.status_code}, Тело ответа: {response.text}")
-        
-        # Пытаемся декодировать JSON, даже если статус - ошибка
-        response_data = response.json()
-        
-        # Проверяем на ошибки уровня приложения (не-HTTP)
-        if 'error' in response_data and response_data.get('error'):
-            logging.error(
-                f"API Битрикс24 вернул ошибку для метода {method}. "
-                f"Код: {response_data.get('error')}, Описание: {response_data.get('error_description')}"
-            )
-            
-        return response_data
+    return await b24_client.call(method, params)
+
+# --- ПАКЕТНЫЕ ЗАПРОСЫ (метод batch) ---
+# Битрикс24 выполняет до 50 команд за один HTTP-запрос. Команда передается строкой
+# "метод?параметры" в формате PHP http_build_query, а в параметрах можно сослаться
+# на результат предыдущей команды: $result[имя_команды][ключ]...
+B24_BATCH_MAX_COMMANDS = 50
+
+
+def _build_query(params: dict, prefix: str | None = None) -> list[str]:
+    """Кодирует вложенные параметры как PHP http_build_query: fields[TITLE]=..., ID[0]=..."""
+    pairs = []
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    for key, value in items:
+        name = f"{prefix}[{key}]" if prefix is not None else str(key)
+        if value is None:
+            continue
+        if isinstance(value, (dict, list, tuple)):
+            pairs.extend(_build_query(value, name))
+        elif isinstance(value, bool):
+            pairs.append(f"{quote(name, safe='[]')}={int(value)}")
+        else:
+            # Ссылки $result[...] оставляем читаемыми; портал раскрывает их после разбора строки
+            pairs.append(f"{quote(name, safe='[]')}={quote(str(value), safe='$[]')}")
+    return pairs
+
+
+class B24BatchResult:
+    """Результаты и ошибки пакета по именам команд."""
+    def __init__(self, response: dict, names: list[str]):
+        self.response = response
+        self.names = names
+        payload = response.get('result') if isinstance(response.get('result'), dict) else {}
+        # Пустые словари PHP приходят как списки
+        self.results = payload.get('result') or {}
+        self.errors = payload.get('result_error') or {}
+        if isinstance(self.results, list):
+            self.results = dict(enumerate(self.results))
+        if isinstance(self.errors, list):
+            self.errors = dict(enumerate(self.errors))
+        # Ошибка самого вызова batch (сеть, лимиты, доступ) — неудачны все команды
+        self.transport_error = None if 'result' in response else response
+
+    def ok(self, name: str) -> bool:
+        return name in self.results and name not in self.errors
+
+    def get(self, name: str, default=None):
+        return self.results.get(name, default)
+
+    def error(self, name: str) -> dict | None:
+        """Ошибка команды; для невыполненной команды (остановка пакета по halt) — NOT_EXECUTED."""
+        if self.transport_error is not None:
+            return self.transport_error
+        if name in self.errors:
+            return self.errors[name]
+        if name not in self.results:
+            return {'error': 'NOT_EXECUTED', 'error_description': 'Команда не выполнена: пакет остановлен на предыдущей ошибке'}
+        return None
 
-    except httpx.RequestError as e:
-        logging.error(f"Ошибка сети при вызове {method}: {e}", exc_info=True)
-        return {"error": "NETWORK_ERROR", "error_description": str(e)}
-    except json.JSONDecodeError:
-        logging.error(f"Ошибка декодирования JSON ответа от {method}. Сырой ответ: {response.text}")
-        return {"error": "JSON_DECODE_ERROR", "error_description": f"Invalid JSON received: {response.text}"}
 
-async def get_free_slots(from_date: datetime, to_date: datetime, user_ids: list[int], lesson_duration: int = 60):
+class B24Batch:
+    """
+    Построитель пакетного запроса:
+        batch = B24Batch(halt=True)
+        batch.add('task', 'tasks.task.add', {...})
+        batch.add('event', 'calendar.event.add', {'description': f"Задача {B24Batch.ref('task', 'task', 'id')}"})
+        result = await batch.execute()
+    С halt=True портал останавливается на первой ошибке, и следующие команды не выполняются.
+    """
+    def __init__(self, halt: bool = False):
+        self.halt = halt
+        self.commands: dict[str, tuple[str, dict]] = {}
+
+    def add(self, name: str, method: str, params: dict | None = None) -> "B24Batch":
+        if len(self.commands) >= B24_BATCH_MAX_COMMANDS:
+            raise ValueError(f"В пакете Битрикс24 не больше {B24_BATCH_MAX_COMMANDS} команд")
+        self.commands[name] = (method, params or {})
+        return self
+
+    @staticmethod
+    def ref(name: str, *path) -> str:
+        """Ссылка на результат команды name: $result[name][path0][path1]..."""
+        return f"$result[{name}]" + "".join(f"[{key}]" for key in path)
+
+    def build(self) -> dict:
+        return {
+            'halt': int(self.halt),
+            'cmd': {name: f"{method}?{'&'.join(_build_query(params))}" for name, (method, params) in self.commands.items()},
+        }
+
+    async def execute(self) -> B24BatchResult:
+        result = B24BatchResult(await make_b24_request('batch', self.build()), list(self.commands))
+        for name in self.commands:
+            error = result.error(name)
+            if error is not None:
+                logging.error(
+                    f"Команда пакета '{name}' ({self.commands[name][0]}) не выполнена. "
+                    f"Код: {error.get('error')}, Описание: {error.get('error_description')}"
+                )
+        return result
+
+def _teacher_name(users: list | None, teacher_id: int) -> str:
+    """Имя и фамилия из ответа user.get или заглушка с ID."""
+    fallback = f"Преподаватель (ID: {teacher_id})"
+    if not users:
+        return fallback
+    user = users[0]
+    return f"{user.get('NAME', '')} {user.get('LAST_NAME', '')}".strip() or fallback
+
+
+def _section_id(sections: list | None) -> int:
+    """ID первого календаря из ответа calendar.section.get (1, если календарей нет)."""
+    if sections and sections[0].get('ID'):
+        return int(sections[0]['ID'])
+    return 1
+
+
+async def fetch_teacher_directory(teacher_ids: list[int]) -> dict[int, dict]:
     """
-    Получает свободные слоты, корректно проверяя пересечение с занятыми интервалами и
-    надежно распознавая разные форматы дат от Битрикс24.
+    Загрузчик для teacher_directory: имена и календари всех преподавателей пакетными запросами
+    (по две команды на преподавателя). Преподаватели, по которым Битрикс24 ответил ошибкой, пропускаются.
     """
-    api_method = "calendar.event.get"
-    url = f"{BITRIX24_WEBHOOK_URL.rstrip('/')}/{api_method}"
-    work_hours = {'start': 10, 'end': 18}
-    final_slots = {}
-    portal_tz = from_date.tzinfo
+    directory = {}
+    per_batch = B24_BATCH_MAX_COMMANDS // 2
+    for offset in range(0, len(teacher_ids), per_batch):
+        chunk = teacher_ids[offset:offset + per_batch]
+        batch = B24Batch(halt=False)
+        for teacher_id in chunk:
+            batch.add(f'user_{teacher_id}', 'user.get', {'ID': teacher_id})
+            batch.add(f'sections_{teacher_id}', 'calendar.section.get', {'type': 'user', 'ownerId': teacher_id})
+        result = await batch.execute()
+        for teacher_id in chunk:
+            if result.ok(f'user_{teacher_id}') and result.ok(f'sections_{teacher_id}'):
+                directory[teacher_id] = {
+                    'name': _teacher_name(result.get(f'user_{teacher_id}'), teacher_id),
+                    'section_id': _section_id(result.get(f'sections_{teacher_id}')),
+                }
+    return directory
+
+
+async def _fetch_busy_intervals(teacher_id: int, from_date: datetime, to_date: datetime, semaphore: asyncio.Semaphore) -> list | None:
+    """Занятые интервалы одного преподавателя или None, если его календарь получить не удалось."""
+    params = {
+        'type': 'user', 
+        'ownerId': str(teacher_id),
+        'from': from_date.isoformat(), 
+        'to': to_date.isoformat()
+    }
+    async with semaphore:
+        data = await make_b24_request('calendar.event.get', params)
+    if 'result' not in data:
+        logging.error(f"Ошибка API при получении событий для user_id {teacher_id}: {data.get('error_description') or data}")
+        return None
+    intervals = []
+    for event in data.get('result') or []:
+        start_busy = _parse_b24_date(event.get('DATE_FROM'), from_date.tzinfo)
+        end_busy = _parse_b24_date(event.get('DATE_TO'), from_date.tzinfo)
+        if start_busy and end_busy:
+            intervals.append((start_busy, end_busy))
+    return intervals
 
-    try:
-        async with httpx.AsyncClient(verify=False) as client:
-            all_users_busy_intervals = []
-            
-            # Сначала соберем все занятые интервалы по всем преподавателям
-            for user_id in user_ids:
-                params = {
-                    'type': 'user', 
-                    'ownerId': str(user_id),
-                    'from': from_date.isoformat(), 
-                    'to': to_date.isoformat()
-                } # <--- ИСПРАВЛЕНО
-                
-                response = await client.post(url, json=params)
-                response.raise_for_status()
-                data = response.json()
-
-                if 'result' not in data:
-                    logging.error(f"Ошибка API при получении событий для user_id {user_id}: {data.get('error_description') or data}")
-                    continue
-                
-                for event in data.get('result', []):
-                    start_busy = _parse_b24_date(event.get('DATE_FROM'), portal_tz)
-                    end_busy = _parse_b24_date(event.get('DATE_TO'), portal_tz)
-                    if start_busy and end_busy:
-                        all_users_busy_intervals.append((start_busy, end_busy))
-
-            # Теперь ищем свободные слоты, зная все занятые интервалы
-            for day_offset in range((to_date - from_date).days + 1):
-                check_day = (from_date + timedelta(days=day_offset)).replace(hour=0, minute=0, second=0, microsecond=0)
-                if check_day.weekday() >= 5: continue
-
-                for hour in range(work_hours['start'], work_hours['end']):
-                    slot_start = check_day.replace(hour=hour, minute=0)
-                    slot_end = slot_start + timedelta(minutes=lesson_duration)
-
-                    if slot_end.hour > work_hours['end'] or slot_start < datetime.now(portal_tz):
-                        continue
-
-                    is_free_globally = True
-                    for busy_start, busy_end in all_users_busy_intervals:
-                        if slot_start < busy_end and busy_start < slot_end:
-                            is_free_globally = False
-                            break
-                    
-                    if is_free_globally:
-                        # Если слот свободен глобально, нужно найти, кто из преподавателей свободен
-                        available_teachers = []
-                        for user_id in user_ids:
-                            is_teacher_busy = False
-                            # Проверяем занятость конкретного преподавателя
-                            # (логика ниже предполагает, что вы хотите знать, кто именно свободен)
-                            # Для упрощения пока считаем, что если слот свободен - свободны все
-                            available_teachers.append(user_id)
-
-                        if available_teachers:
-                            date_key = slot_start.strftime('%Y-%m-%d')
-                            if date_key not in final_slots:
-                                final_slots[date_key] = []
-                            
-                            # Проверяем, нет ли уже такого времени в списке
-                            time_str = slot_start.strftime('%H:%M')
-                            if not any(slot['time'] == time_str for slot in final_slots[date_key]):
-                                final_slots[date_key].append({'time': time_str, 'user_ids': available_teachers})
-
-        # Сортируем
-        for date_key in final_slots:
-            final_slots[date_key] = sorted(final_slots[date_key], key=lambda x: x['time'])
-        
-        return final_slots
 
-    except httpx.RequestError as e:
-        logging.error(f"Критическая HTTP ошибка при запросе событий: {e}")
-        return {}
+async def fetch_teacher_calendars(from_date: datetime, to_date: datetime, teacher_ids: list[int]) -> dict[int, list]:
+    """
+    Параллельно (не больше B24_CALENDAR_CONCURRENCY запросов одновременно) получает
+    занятые интервалы всех преподавателей. Преподаватели, чей календарь не ответил,
+    в результат не попадают: остальных можно показывать и без них.
+    """
+    semaphore = asyncio.Semaphore(B24_CALENDAR_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_fetch_busy_intervals(teacher_id, from_date, to_date, semaphore) for teacher_id in teacher_ids),
+        return_exceptions=True,
+    )
+    calendars = {}
+    for teacher_id, result in zip(teacher_ids, results):
+        if isinstance(result, BaseException):
+            logging.error(f"Не удалось получить календарь преподавателя {teacher_id}: {result}")
+        elif result is not None:
+            calendars[teacher_id] = result
+    if len(calendars) < len(teacher_ids):
+        missing = [teacher_id for teacher_id in teacher_ids if teacher_id not in calendars]
+        logging.warning(f"Календари преподавателей {missing} недоступны, слоты показаны по остальным.")
+    return calendars
+
+
+async def get_free_slots(from_date: datetime, to_date: datetime, user_ids: list[int], lesson_duration: int = 60):
+    """
+    Получает свободные слоты по календарям преподавателей, надежно распознавая разные форматы дат от Битрикс24.
+    Календари запрашиваются параллельно; если часть из них не ответила, слоты считаются
+    только по ответившим преподавателям. Сами слоты считает availability_engine: у каждого
+    слота в 'user_ids' только те преподаватели, кто в это время действительно свободен.
+    """
+    try:
+        calendars = await fetch_teacher_calendars(from_date, to_date, user_ids)
+        if not calendars:
+            logging.error("Ни один календарь преподавателей не получен, свободные слоты не посчитать.")
+            return {}
+        return availability_engine.slots_by_date(
+            calendars, from_date, to_date, lesson_duration, now=datetime.now(from_date.tzinfo)
+        )
     except Exception as e:
         logging.error(f"Непредвиденная ошибка в get_free_slots: {e}", exc_info=True)
         return {}
 
 
+def _drop_past_slots(slots: dict, now: datetime) -> dict:
+    """Убирает из закэшированного расписания слоты, время которых уже наступило."""
+    actual = {}
+    for date_key, day_slots in slots.items():
+        upcoming = [
+            slot for slot in day_slots
+            if datetime.strptime(f"{date_key} {slot['time']}", '%Y-%m-%d %H:%M').replace(tzinfo=now.tzinfo) > now
+        ]
+        if upcoming:
+            actual[date_key] = upcoming
+    return actual
+
+
+async def get_available_slots(teacher_ids: list[int], tz: ZoneInfo, days: int = 7, lesson_duration: int = 60) -> dict:
+    """
+    Свободные слоты на days дней вперед из общего кэша (см. availability_cache).
+    Расписание одинаково для всех пользователей, поэтому Битрикс24 опрашивается
+    не чаще раза в AVAILABILITY_TTL_SECONDS, а не на каждое открытие записи.
+    """
+    async def fetch():
+        now = datetime.now(tz)
+        return await get_free_slots(from_date=now, to_date=now + timedelta(days=days), user_ids=teacher_ids,
+                                    lesson_duration=lesson_duration)
+
+    key = (tuple(sorted(teacher_ids)), days, lesson_duration)
+    slots = await availability_cache.get(key, fetch)
+    return _drop_past_slots(slots or {}, datetime.now(tz))
+
+
 try:
     from app.utils.text_tools import inflect_name
 except ImportError:
     def inflect_name(name, case): return name # Заглушка, если утилиты нет
 
-async def book_lesson(user_id: int, start_time: datetime, duration_minutes: int, client_data: dict) -> tuple:    
+# Блокировки бронирования по преподавателю: проверка слота и создание события идут по очереди
+_booking_locks: dict[int, asyncio.Lock] = {}
+
+
+def _booking_lock(teacher_id: int) -> asyncio.Lock:
+    lock = _booking_locks.get(teacher_id)
+    if lock is None:
+        lock = _booking_locks[teacher_id] = asyncio.Lock()
+    return lock
+
+
+async def book_lesson(user_id: int, start_time: datetime, duration_minutes: int, client_data: dict) -> tuple:
     """
     Бронирует урок: ПРОВЕРЯЕТ доступность слота, СОЗДАЕТ задачу и связанное СОБЫТИЕ.
-    Это атомарно защищает от двойного бронирования.
-    - Добавлено детальное логирование.
-    - Исправлена структура запроса для calendar.event.add (добавлено поле 'fields').
-    - Всегда возвращает кортеж (task_id, teacher_name) или (None, None).
+    Битрикс24 не умеет «проверить и создать» одним действием, поэтому бронирования одного
+    преподавателя выполняются по очереди (блокировка по user_id на проверку и создание).
+    Защита действует в пределах одного процесса бота: при нескольких процессах или ручных
+    правках в календаре между проверкой и созданием двойное бронирование остается возможным.
+    """
+    async with _booking_lock(user_id):
+        return await _book_lesson(user_id, start_time, duration_minutes, client_data)
+
+
+async def _book_lesson(user_id: int, start_time: datetime, duration_minutes: int, client_data: dict) -> tuple:
+    """
+    - Два пакетных запроса вместо пяти вызовов: (события дня, а преподаватель и календарь —
+      только если их нет в teacher_directory) и (задача, событие со ссылкой на задачу через $result).
+    - Всегда возвращает кортеж (task_id, event_id, teacher_name) или (None, None, None).
     - Использует ВЕРХНИЙ РЕГИСТР для полей и формат дат 'dd.mm.YYYY HH:MM:SS' для calendar.event.add, как того требует API.
-    - Динамически получает и преобразует в int ID календаря.
+    - Берет ID календаря из справочника преподавателей или получает его динамически.
     - Содержит полную обработку ошибок.
     """
     logging.info(f"Начало процесса бронирования. Преподаватель ID: {user_id}, Время: {start_time}")
-    parent_name = client_data.get('parent_name', 'Клиент')
-    child_name = client_data.get('child_name', 'Ребенок')
-    child_age = client_data.get('child_age', 'не указан')
-    child_interests = client_data.get('child_interests', 'не указаны')
-    username = client_data.get('username', 'неизвестен')
+    child_name = client_data.get('child_name', 'Клиент')
 
     # Склоняем имя для красивого заголовка
     child_name_gent = inflect_name(child_name, 'gent') if MORPHOLOGY_ENABLED else child_name
@@ -227,125 +347,128 @@ async def book_lesson(user_id: int, start_time: datetime, duration_minutes: int,
     portal_tz = start_time.tzinfo
 
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-             # Шаг 1: Проверка слота с ручной фильтрацией.
-            # Мы больше не доверяем API фильтрацию по времени. Запрашиваем все события 
-            # на весь день и проверяем пересечения в коде Python.
-            
-            day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-
-            check_params = {
-                'type': 'user',
-                'ownerId': str(user_id),
-                # Используем формат ISO, который гарантированно вернет события за весь день
-                'from': day_start.isoformat(),
-                'to': day_end.isoformat()
-            }
-            
-            check_data = await make_b24_request(client, 'calendar.event.get', check_params)
-
-            # Теперь ищем реальные пересечения вручную
-            true_conflicts = []
-            if check_data and check_data.get('result'):
-                all_day_events = check_data.get('result')
-                for event in all_day_events:
-                    # Используем существующий в файле парсер дат _parse_b24_date
-                    event_start = _parse_b24_date(event.get('DATE_FROM'), portal_tz)
-                    event_end = _parse_b24_date(event.get('DATE_TO'), portal_tz)
-
-                    # Пропускаем события, у которых не удалось распознать дату
-                    if not event_start or not event_end:
-                        continue
-
-                    # Ключевая логика: проверка наложения интервалов.
-                    # Пересечение есть, если начало одного раньше конца другого И 
-                    # конец одного позже начала другого.
-                    if event_start < end_time and event_end > start_time:
-                        true_conflicts.append(event)
-            
-            # Если после ручной проверки найдены реальные конфликты:
-            if true_conflicts:
-                event_names = [f"'{event.get('NAME')}' (ID: {event.get('ID')})" for event in true_conflicts]
-                logging.warning(
-                    f"Попытка двойного бронирования на {start_time} для user_id={user_id}. Слот уже занят. "
-                    f"РЕАЛЬНО МЕШАЮЩИЕ события: {', '.join(event_names)}")
-                return None, None, None
-
-            # Шаг 2: Создание задачи
-            user_info = await make_b24_request(client, 'user.get', {'ID': user_id})
-            teacher_name = f"Преподаватель (ID: {user_id})"
-            if user_info and user_info.get('result'):
-                user = user_info['result'][0]
-                teacher_name = f"{user.get('NAME', '')} {user.get('LAST_NAME', '')}".strip() or teacher_name
-            
-            child_name_gent = inflect_name(client_data.get('child_name', 'Клиент'), 'gent') if MORPHOLOGY_ENABLED else client_data.get('child_name', 'Клиент')
-            task_description = (
-                f"Новая заявка на пробный урок от @{client_data.get('username', 'N/A')}.\n\n"
-                f"[B]Родитель:[/B] {client_data.get('parent_name', 'Не указано')}\n"
-                f"[B]Ученик:[/B] {client_data.get('child_name', 'Не указано')}\n"
-                f"[B]Возраст ученика:[/B] {client_data.get('child_age', 'Не указан')}\n"
-                f"[B]Увлечения:[/B] {client_data.get('hobbies', 'Не указаны')}\n\n"
-                f"[B]Как связаться:[/B] через Telegram (@{client_data.get('username', 'N/A')})"
-            )
-            task_params = {'fields': {
-                'TITLE': f"Пробный урок для {child_name_gent} ({teacher_name})",
-                'DESCRIPTION': task_description,
-                'RESPONSIBLE_ID': user_id,
-                'DEADLINE': start_time.isoformat(),
-                'GROUP_ID': GROUP_ID
-            }}
-            
-            task_data = await make_b24_request(client, 'tasks.task.add', task_params)
-            if not (task_data and task_data.get('result') and task_data['result'].get('task')):
-                logging.error(f"Не удалось создать задачу: {task_data}")
-                return None, None, None
-            task_id = task_data['result']['task']['id']
-            logging.info(f"Задача (ID: {task_id}) успешно создана.")
-
-            # Шаг 3: Динамическое получение ID календаря
-            section_id = 1
-            sections_data = await make_b24_request(client, 'calendar.section.get', {'type': 'user', 'ownerId': user_id})
-            if sections_data and sections_data.get('result') and len(sections_data['result']) > 0:
-                calendar_id_str = sections_data['result'][0].get('ID')
-                if calendar_id_str:
-                    section_id = int(calendar_id_str)
-            
-            # Шаг 4: Создание события
-            event_description = (
-                f"Запись из Telegram-бота.\n"
-                f"Ученик: {client_data.get('child_name', 'не указано')}, {client_data.get('child_age', 'не указано')} лет.\n"
-                f"Родитель: {client_data.get('parent_name', 'не указано')}.\n"
-                f"Контакт: @{client_data.get('username', 'нет')}"
-            )
-            parsed_url = urlparse(webhook_base_url)
-            portal_base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            task_url_bbcode = f"\n\nСвязанная задача: [URL={portal_base_url}/company/personal/user/{user_id}/tasks/task/view/{task_id}/]Задача №{task_id}[/URL]"
-            final_event_description = event_description + task_url_bbcode
-            event_params = {
-                'type': 'user',
-                'ownerId': str(user_id),
-                'name': f"Пробный урок: {client_data.get('child_name', 'Клиент')}",
-                # Это ссылка на привязанную к событию задачу
-                'description': final_event_description,
-                'from': start_time.strftime('%d.%m.%Y %H:%M:%S'),
-                'to': end_time.strftime('%d.%m.%Y %H:%M:%S'),
-                'section': section_id,
-                'accessibility': 'busy'
-            }
-            
-            event_creation_response = await make_b24_request(client, 'calendar.event.add', event_params)
-            if not event_creation_response or not event_creation_response.get('result'):
-                logging.error(f"Не удалось создать событие в календаре. Ответ API: {event_creation_response}")
-                # ВАЖНО: Если событие не создалось, нужно удалить уже созданную задачу,
-                # чтобы избежать "висячих" задач.
-                logging.warning(f"Откатываем создание задачи (ID: {task_id}) из-за ошибки с созданием события.")
-                await make_b24_request(client, 'tasks.task.delete', {'taskId': task_id})
-                return None, None, None
-
-            event_id = event_creation_response.get('result')
-            logging.info(f"Событие в календаре (ID: {event_id}) успешно создано.")
-            return task_id, event_id, teacher_name 
+        # Шаг 1: Одним пакетом — события преподавателя за день, его имя и ID календаря.
+        # Мы не доверяем API фильтрацию по времени: запрашиваем все события
+        # на весь день и проверяем пересечения в коде Python.
+        day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_end = day_start + timedelta(days=1)
+
+        lookup_batch = B24Batch(halt=False).add('events', 'calendar.event.get', {
+            'type': 'user',
+            'ownerId': str(user_id),
+            # Используем формат ISO, который гарантированно вернет события за весь день
+            'from': day_start.isoformat(),
+            'to': day_end.isoformat()
+        })
+        # Имя и календарь берем из справочника; в Битрикс24 идем, только если преподавателя там нет
+        teacher = teacher_directory.get(user_id)
+        if teacher is None:
+            lookup_batch.add('teacher', 'user.get', {'ID': user_id})
+            lookup_batch.add('sections', 'calendar.section.get', {'type': 'user', 'ownerId': user_id})
+        lookup = await lookup_batch.execute()
+        if not lookup.ok('events'):
+            # Без списка событий занятость слота проверить нельзя
+            logging.error(f"Не удалось проверить слот {start_time} для user_id={user_id}: {lookup.error('events')}")
+            return None, None, None
+
+        # Теперь ищем реальные пересечения вручную
+        true_conflicts = []
+        for event in lookup.get('events') or []:
+            # Используем существующий в файле парсер дат _parse_b24_date
+            event_start = _parse_b24_date(event.get('DATE_FROM'), portal_tz)
+            event_end = _parse_b24_date(event.get('DATE_TO'), portal_tz)
+
+            # Пропускаем события, у которых не удалось распознать дату
+            if not event_start or not event_end:
+                continue
+
+            # Ключевая логика: проверка наложения интервалов.
+            # Пересечение есть, если начало одного раньше конца другого И 
+            # конец одного позже начала другого.
+            if event_start < end_time and event_end > start_time:
+                true_conflicts.append(event)
+        
+        # Если после ручной проверки найдены реальные конфликты:
+        if true_conflicts:
+            event_names = [f"'{event.get('NAME')}' (ID: {event.get('ID')})" for event in true_conflicts]
+            logging.warning(
+                f"Попытка двойного бронирования на {start_time} для user_id={user_id}. Слот уже занят. "
+                f"РЕАЛЬНО МЕШАЮЩИЕ события: {', '.join(event_names)}")
+            return None, None, None
+
+        if teacher is not None:
+            teacher_name, section_id = teacher['name'], teacher['section_id']
+        else:
+            teacher_name = _teacher_name(lookup.get('teacher'), user_id)
+            section_id = _section_id(lookup.get('sections'))
+            if lookup.ok('teacher') and lookup.ok('sections'):
+                teacher_directory.update(user_id, teacher_name, section_id)
+
+        # Шаг 2: Одним пакетом — задача и событие. Событие ссылается на ID созданной задачи
+        # через $result[task][task][id]; halt=1: если задача не создалась, событие не создается
+        task_description = (
+            f"Новая заявка на пробный урок от @{client_data.get('username', 'N/A')}.\n\n"
+            f"[B]Родитель:[/B] {client_data.get('parent_name', 'Не указано')}\n"
+            f"[B]Ученик:[/B] {client_data.get('child_name', 'Не указано')}\n"
+            f"[B]Возраст ученика:[/B] {client_data.get('child_age', 'Не указан')}\n"
+            f"[B]Увлечения:[/B] {client_data.get('hobbies', 'Не указаны')}\n\n"
+            f"[B]Как связаться:[/B] через Telegram (@{client_data.get('username', 'N/A')})"
+        )
+        task_params = {'fields': {
+            'TITLE': f"Пробный урок для {child_name_gent} ({teacher_name})",
+            'DESCRIPTION': task_description,
+            'RESPONSIBLE_ID': user_id,
+            'DEADLINE': start_time.isoformat(),
+            'GROUP_ID': GROUP_ID
+        }}
+
+        event_description = (
+            f"Запись из Telegram-бота.\n"
+            f"Ученик: {client_data.get('child_name', 'не указано')}, {client_data.get('child_age', 'не указано')} лет.\n"
+            f"Родитель: {client_data.get('parent_name', 'не указано')}.\n"
+            f"Контакт: @{client_data.get('username', 'нет')}"
+        )
+        parsed_url = urlparse(webhook_base_url)
+        portal_base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        task_ref = B24Batch.ref('task', 'task', 'id')
+        task_url_bbcode = f"\n\nСвязанная задача: [URL={portal_base_url}/company/personal/user/{user_id}/tasks/task/view/{task_ref}/]Задача №{task_ref}[/URL]"
+        event_params = {
+            'type': 'user',
+            'ownerId': str(user_id),
+            'name': f"Пробный урок: {client_data.get('child_name', 'Клиент')}",
+            # Это ссылка на привязанную к событию задачу
+            'description': event_description + task_url_bbcode,
+            'from': start_time.strftime('%d.%m.%Y %H:%M:%S'),
+            'to': end_time.strftime('%d.%m.%Y %H:%M:%S'),
+            'section': section_id,
+            'accessibility': 'busy'
+        }
+
+        created = await (
+            B24Batch(halt=True)
+            .add('task', 'tasks.task.add', task_params)
+            .add('event', 'calendar.event.add', event_params)
+            .execute()
+        )
+        task_result = created.get('task') or {}
+        if not (created.ok('task') and task_result.get('task')):
+            logging.error(f"Не удалось создать задачу: {created.error('task') or task_result}")
+            return None, None, None
+        task_id = task_result['task']['id']
+        logging.info(f"Задача (ID: {task_id}) успешно создана.")
+
+        if not (created.ok('event') and created.get('event')):
+            logging.error(f"Не удалось создать событие в календаре. Ответ API: {created.error('event') or created.get('event')}")
+            # ВАЖНО: Если событие не создалось, нужно удалить уже созданную задачу,
+            # чтобы избежать "висячих" задач.
+            logging.warning(f"Откатываем создание задачи (ID: {task_id}) из-за ошибки с созданием события.")
+            await make_b24_request('tasks.task.delete', {'taskId': task_id})
+            return None, None, None
+
+        event_id = created.get('event')
+        logging.info(f"Событие в календаре (ID: {event_id}) успешно создано.")
+        availability_cache.invalidate()
+        return task_id, event_id, teacher_name 
 
     except Exception as e:
         logging.error(f"Непредвиденная критическая ошибка в функции book_lesson: {e}", exc_info=True)
@@ -354,8 +477,9 @@ async def book_lesson(user_id: int, start_time: datetime, duration_minutes: int,
 
 async def cancel_booking(task_id: int, event_id: int, owner_id: int, reason: str) -> bool:
     """
-    Отменяет бронирование: удаляет событие, добавляет комментарий с причиной
-    отмены и завершает задачу.
+    Отменяет бронирование одним пакетным запросом: удаляет событие, добавляет комментарий
+    с причиной отмены и завершает задачу. Команды независимы (halt=0), результат каждой
+    проверяется отдельно.
 
     Args:
         task_id (int): ID задачи.
@@ -368,39 +492,38 @@ async def cancel_booking(task_id: int, event_id: int, owner_id: int, reason: str
     """
     logging.info(f"Начало отмены с сбором ОС. Задача: {task_id}, Событие: {event_id}")
 
-    async with httpx.AsyncClient(verify=False) as client:
-        
+    cancellation_time = datetime.now().strftime('%d.%m.%Y в %H:%M')
+    comment_text = (
+        f"[B]Запись отменена пользователем через бота.[/B]\n"
+        f"Дата отмены: {cancellation_time}\n\n"
+        f"[B]Причина, указанная родителем:[/B]\n"
+        f"{reason}"
+    )
+    result = await (
+        B24Batch(halt=False)
         # Шаг 1: Удаление события из календаря
-        event_params = {'id': event_id, 'type': 'user', 'ownerId': owner_id}
-        event_res = await make_b24_request(client, 'calendar.event.delete', event_params)
-        if event_res.get('result'):
-            logging.info(f"Событие (ID: {event_id}) успешно удалено.")
-        else:
-            logging.warning(f"Не удалось удалить событие (ID: {event_id}). Ответ: {event_res}")
-
+        .add('event', 'calendar.event.delete', {'id': event_id, 'type': 'user', 'ownerId': owner_id})
         # Шаг 2: Добавление комментария с причиной отмены
-        cancellation_time = datetime.now().strftime('%d.%m.%Y в %H:%M')
-        comment_text = (
-            f"[B]Запись отменена пользователем через бота.[/B]\n"
-            f"Дата отмены: {cancellation_time}\n\n"
-            f"[B]Причина, указанная родителем:[/B]\n"
-            f"{reason}"
-        )
-        comment_params = {'TASKID': task_id, 'FIELDS': {'POST_MESSAGE': comment_text}}
-        comment_res = await make_b24_request(client, 'task.commentitem.add', comment_params)
-        if not (comment_res and comment_res.get('result')):
-            logging.error(f"Не удалось добавить комментарий к задаче {task_id}. Ответ: {comment_res}")
-
+        .add('comment', 'task.commentitem.add', {'TASKID': task_id, 'FIELDS': {'POST_MESSAGE': comment_text}})
         # Шаг 3: Завершение задачи
-        task_params = {'taskId': task_id}
-        task_res = await make_b24_request(client, 'tasks.task.complete', task_params)
+        .add('complete', 'tasks.task.complete', {'taskId': task_id})
+        .execute()
+    )
 
-        if task_res and task_res.get('result'):
-            logging.info(f"Задача (ID: {task_id}) успешно ЗАВЕРШЕНА с комментарием.")
-            return True
-        else:
-            logging.error(f"Не удалось ЗАВЕРШИТЬ задачу (ID: {task_id}). Ответ: {task_res}")
-            return False
+    if result.ok('event') and result.get('event'):
+        logging.info(f"Событие (ID: {event_id}) успешно удалено.")
+        availability_cache.invalidate()
+    else:
+        logging.warning(f"Не удалось удалить событие (ID: {event_id}). Ответ: {result.error('event') or result.get('event')}")
+
+    if not (result.ok('comment') and result.get('comment')):
+        logging.error(f"Не удалось добавить комментарий к задаче {task_id}. Ответ: {result.error('comment') or result.get('comment')}")
+
+    if result.ok('complete') and result.get('complete'):
+        logging.info(f"Задача (ID: {task_id}) успешно ЗАВЕРШЕНА с комментарием.")
+        return True
+    logging.error(f"Не удалось ЗАВЕРШИТЬ задачу (ID: {task_id}). Ответ: {result.error('complete') or result.get('complete')}")
+    return False
 
 
 # функция для переноса
@@ -445,59 +568,62 @@ async def reschedule_booking(
         f"---------------------------------"
     )
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            # Шаг 1: Обновление события в календаре
-            event_fields = {
+        # Одним пакетом: шаг 1 — обновление события, шаг 2 — обновление задачи.
+        # halt=1: если событие не обновилось, задача тоже не трогается
+        event_fields = {
+            'id': event_id,
+            'type': 'user', 
+            'ownerId': teacher_id,
+            'from': new_start_time.strftime('%d.%m.%Y %H:%M:%S'),
+            'to': new_end_time.strftime('%d.%m.%Y %H:%M:%S'),
+            'description': description
+        }
+        task_fields = {
+            'taskId': task_id,
+            'fields': {
+                'DEADLINE': new_start_time.isoformat(),
+            }
+        }
+        result = await (
+            B24Batch(halt=True)
+            .add('event', 'calendar.event.update', event_fields)
+            .add('task', 'tasks.task.update', task_fields)
+            .execute()
+        )
+        if not result.ok('event'):
+            logging.error(f"Не удалось обновить событие {event_id}. Перенос отменен. Ответ: {result.error('event')}")
+            return False
+        logging.info(f"Событие {event_id} успешно перенесено на {new_start_time}.")
+        # Занятость изменилась и при успешном переносе, и при откате ниже
+        availability_cache.invalidate()
+
+        if not result.ok('task'):
+            # --- НАЧАЛО БЛОКА ОТКАТА ---
+            logging.critical(f"КРИТИЧЕСКАЯ ОШИБКА: Событие {event_id} перенесено, но не удалось обновить задачу {task_id}!")
+            logging.info(f"ИНИЦИИРОВАН АВТОМАТИЧЕСКИЙ ОТКАТ. Возвращаем событие {event_id} на старое время: {old_start_time}")
+            
+            old_end_time = old_start_time + timedelta(minutes=60)
+            rollback_fields = {
                 'id': event_id,
-                'type': 'user', 
+                'type': 'user',
                 'ownerId': teacher_id,
-                'from': new_start_time.strftime('%d.%m.%Y %H:%M:%S'),
-                'to': new_end_time.strftime('%d.%m.%Y %H:%M:%S'),
-                'description': description
+                'from': old_start_time.strftime('%d.%m.%Y %H:%M:%S'),
+                'to': old_end_time.strftime('%d.%m.%Y %H:%M:%S'),
+                'description': f"!!! АВТОМАТИЧЕСКИЙ ОТКАТ ПЕРЕНОСА !!!\n" + \
+                               f"Запись возвращена на исходное время из-за технической ошибки."
             }
-            event_update_res = await make_b24_request(client, 'calendar.event.update', event_fields)
-            if not event_update_res:
-                logging.error(f"Не удалось обновить событие {event_id}. Перенос отменен.")
-                return False
-            logging.info(f"Событие {event_id} успешно перенесено на {new_start_time}.")
-
-            # Шаг 2: Обновление задачи
-            task_fields = {
-                'taskId': task_id,
-                'fields': {
-                    'DEADLINE': new_start_time.isoformat(),
-                }
-            }
-            task_update_res = await make_b24_request(client, 'tasks.task.update', task_fields)
-
-            if not task_update_res:
-                logging.critical(f"КРИТИЧЕСКАЯ ОШИБКА: Событие {event_id} перенесено, но не удалось обновить задачу {task_id}!")
-                # --- НАЧАЛО БЛОКА ОТКАТА ---
-                logging.critical(f"КРИТИЧЕСКАЯ ОШИБКА: Событие {event_id} перенесено, но не удалось обновить задачу {task_id}!")
-                logging.info(f"ИНИЦИИРОВАН АВТОМАТИЧЕСКИЙ ОТКАТ. Возвращаем событие {event_id} на старое время: {old_start_time}")
-                
-                old_end_time = old_start_time + timedelta(minutes=60)
-                rollback_fields = {
-                    'id': event_id,
-                    'type': 'user',
-                    'ownerId': teacher_id,
-                    'from': old_start_time.strftime('%d.%m.%Y %H:%M:%S'),
-                    'to': old_end_time.strftime('%d.%m.%Y %H:%M:%S'),
-                    'description': f"!!! АВТОМАТИЧЕСКИЙ ОТКАТ ПЕРЕНОСА !!!\n" + \
-                                   f"Запись возвращена на исходное время из-за технической ошибки."
-                }
-                
-                rollback_res = await make_b24_request(client, 'calendar.event.update', rollback_fields)
-                if rollback_res:
-                    logging.info(f"ОТКАТ УСПЕШЕН: Событие {event_id} возвращено на {old_start_time}.")
-                else:
-                    logging.error(f"ОТКАТ НЕ УДАЛСЯ! Требуется ручное вмешательство для события {event_id} и задачи {task_id}.")
-                
-                return False # Возвращаем False, так как основная операция не удалась
-                # --- КОНЕЦ БЛОКА ОТКАТА ---
             
-            logging.info(f"Задача {task_id} успешно обновлена с новым дедлайном.")
-            return True
+            rollback_res = await make_b24_request('calendar.event.update', rollback_fields)
+            if rollback_res.get('result'):
+                logging.info(f"ОТКАТ УСПЕШЕН: Событие {event_id} возвращено на {old_start_time}.")
+            else:
+                logging.error(f"ОТКАТ НЕ УДАЛСЯ! Требуется ручное вмешательство для события {event_id} и задачи {task_id}.")
+            
+            return False # Возвращаем False, так как основная операция не удалась
+            # --- КОНЕЦ БЛОКА ОТКАТА ---
+        
+        logging.info(f"Задача {task_id} успешно обновлена с новым дедлайном.")
+        return True
 
     except Exception as e:
         logging.error(f"Непредвиденная ошибка в reschedule_booking: {e}", exc_info=True)
@@ -0,0 +1,68 @@
+# app/services/enrollment_counter.py
+
+import asyncio
+import logging
+
+from app.config import ENROLLMENT_RECONCILE_SECONDS
+from app.db.database import get_enrolled_student_count, set_user_enrolled
+
+
+class EnrollmentCounter:
+    """
+    Счетчик зачисленных учеников, который живет в памяти процесса.
+    Загружается из БД один раз, обновляется при изменении статуса зачисления
+    и периодически сверяется с базой (на случай правок в обход бота).
+    """
+    def __init__(self, reconcile_interval: int = 300):
+        self.reconcile_interval = reconcile_interval
+        self._count: int | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._count is not None
+
+    async def get(self) -> int:
+        """Возвращает текущее значение. К базе обращается только при самом первом вызове."""
+        if self._count is None:
+            await self.reconcile()
+        return self._count
+
+    async def reconcile(self) -> int:
+        """Перечитывает точное значение из базы данных."""
+        async with self._lock:
+            actual = await get_enrolled_student_count()
+            if self._count is not None and self._count != actual:
+                logging.warning(f"Счетчик учеников расходился с БД: в памяти {self._count}, в базе {actual}. Исправлено.")
+            self._count = actual
+            return actual
+
+    def adjust(self, delta: int):
+        """Корректирует значение после изменения, сделанного самим ботом."""
+        if self._count is not None:
+            self._count = max(0, self._count + delta)
+
+    async def set_enrolled(self, telegram_id: int, status: bool = True) -> bool:
+        """
+        Меняет статус зачисления пользователя и сразу обновляет счетчик.
+        Под той же блокировкой, что и reconcile: иначе зачисление, попавшее между чтением
+        количества из БД и его записью в память, было бы учтено дважды.
+        """
+        async with self._lock:
+            changed = await set_user_enrolled(telegram_id, status)
+            if changed:
+                self.adjust(1 if status else -1)
+        return changed
+
+    async def run_reconcile_loop(self):
+        """Фоновая задача: периодически сверяет счетчик с базой."""
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logging.error(f"Ошибка при сверке счетчика учеников с БД: {e}", exc_info=True)
+
+
+# Единый экземпляр счетчика для всего приложения
+enrollment_counter = EnrollmentCounter(reconcile_interval=ENROLLMENT_RECONCILE_SECONDS)
@@ -6,6 +6,8 @@ import numpy as np
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from app.utils.normalization import NormalizedMessage, normalize_message, prepare_keywords, find_keyword_intent
+
 # Вспомогательная функция для загрузки, вы можете использовать свою, если она есть
 def load_keywords_from_yaml(path: str) -> dict:
     try:
@@ -29,6 +31,9 @@ class IntentRecognizer:
         
         # Создаем эмбеддинги только на основе текстовых ключевых слов
         self.intents_embeddings = self._create_embeddings(self.intents_data)
+
+        # Ключевые фразы нормализуем один раз; по леммам ("отменили" -> "отменить") сравниваются при поиске
+        self.intents_keywords = self._prepare_keywords(self.intents_data)
         
         logging.info("Сервис IntentRecognizer успешно инициализирован с гибридной моделью.")
 
@@ -50,17 +55,25 @@ class IntentRecognizer:
                     logging.error(f"Ошибка при создании эмбеддингов для интента '{intent}': {e}")
         return embedded_intents
 
-    def _get_intent_by_rule(self, query: str) -> Optional[str]:
+    def _prepare_keywords(self, intents_data: Dict[str, Dict]) -> Dict[str, List]:
+        """
+        Приводит ключевые фразы каждого интента к нормализованному виду
+        (выполняется один раз при загрузке; леммы считаются при первом сравнении).
+        """
+        return {
+            intent: prepare_keywords(data.get('keywords', []))
+            for intent, data in intents_data.items()
+        }
+
+    def _get_intent_by_rule(self, message: NormalizedMessage) -> Optional[str]:
         """
-        Первый слой: ищет точное вхождение ключевых фраз.
+        Первый слой: ищет вхождение ключевых фраз — сначала точное по всем интентам, затем по леммам.
         """
-        query_lower = query.lower()
-        for intent, data in self.intents_data.items():
-            # Ищем в списке 'keywords'
-            for phrase in data.get('keywords', []):
-                if phrase.lower() in query_lower:
-                    logging.info(f"Интент '{intent}' определен по строгому правилу (фраза: '{phrase}').")
-                    return intent
+        found = find_keyword_intent(message, self.intents_keywords)
+        if found:
+            intent, phrase = found
+            logging.info(f"Интент '{intent}' определен по строгому правилу (фраза: '{phrase}').")
+            return intent
         return None
 
     def _get_intent_by_semantic(self, query: str) -> Optional[str]:
@@ -87,15 +100,17 @@ class IntentRecognizer:
             
         return None
 
-    def get_intent(self, query: str) -> Optional[str]:
+    def get_intent(self, query: str | NormalizedMessage) -> Optional[str]:
         """
         Главная функция: сначала правила, потом семантика.
+        Принимает уже нормализованное сообщение; обычная строка нормализуется здесь же.
         """
-        rule_based_intent = self._get_intent_by_rule(query)
+        message = query if isinstance(query, NormalizedMessage) else normalize_message(query)
+        rule_based_intent = self._get_intent_by_rule(message)
         if rule_based_intent:
             return rule_based_intent
             
-        return self._get_intent_by_semantic(query)
+        return self._get_intent_by_semantic(message.folded)
 
 # Создаем единый экземпляр сервиса для всего приложения
 intent_recognizer_service = IntentRecognizer(keywords_path="config/keywords.yaml")
\ No newline at end of file
@@ -0,0 +1,116 @@
+# app/services/teacher_directory.py
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+from app.config import TEACHER_IDS, TEACHER_DIRECTORY_PATH, TEACHER_DIRECTORY_REFRESH_SECONDS
+from app.services.b24_client import background_priority
+
+# Загрузчик: список id преподавателей -> {id: {'name': ..., 'section_id': ...}} для тех, кто ответил
+DirectoryFetcher = Callable[[List[int]], Awaitable[Dict[int, dict]]]
+
+
+class TeacherDirectory:
+    """
+    Справочник преподавателей: имя и ID календаря (секции) по id пользователя Битрикс24.
+    Эти данные почти не меняются, поэтому бронирование берет их отсюда, а не запрашивает
+    user.get и calendar.section.get каждый раз. Справочник хранится в JSON-файле и переживает
+    перезапуск; при старте и затем раз в refresh_interval секунд обновляется из Битрикс24.
+    Функцию загрузки передает вызывающий код (bitrix_service.fetch_teacher_directory).
+    """
+    def __init__(self, path: str, refresh_interval: float = 21600):
+        self.path = Path(path)
+        self.refresh_interval = refresh_interval
+        self._teachers: Dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+    def get(self, teacher_id: int) -> dict | None:
+        """Имя и секция преподавателя или None, если его еще нет в справочнике."""
+        teacher = self._teachers.get(teacher_id)
+        self.stats["hits" if teacher else "misses"] += 1
+        return teacher
+
+    def update(self, teacher_id: int, name: str, section_id: int):
+        """Запоминает данные, полученные в обход справочника (например, при бронировании)."""
+        current = self._teachers.get(teacher_id)
+        if current and current.get("name") == name and current.get("section_id") == section_id:
+            return
+        self._teachers[teacher_id] = {"name": name, "section_id": section_id, "updated_at": _now()}
+        self._save()
+
+    def load(self) -> int:
+        """Читает справочник из файла. Возвращает число преподавателей."""
+        if not self.path.exists():
+            return 0
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._teachers = {int(teacher_id): teacher for teacher_id, teacher in data.items()}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось прочитать справочник преподавателей {self.path}: {e}")
+        return len(self._teachers)
+
+    async def refresh(self, fetcher: DirectoryFetcher, teacher_ids: List[int]) -> int:
+        """
+        Обновляет справочник из Битрикс24. Преподаватели, по которым запрос не удался,
+        остаются со старыми данными. Возвращает число обновленных записей.
+        """
+        fetched = await fetcher(teacher_ids)
+        now = _now()
+        for teacher_id, teacher in fetched.items():
+            self._teachers[teacher_id] = {**teacher, "updated_at": now}
+        self.stats["refreshes"] += 1
+        if fetched:
+            self._save()
+        missing = [teacher_id for teacher_id in teacher_ids if teacher_id not in fetched]
+        if missing:
+            logging.warning(f"Справочник преподавателей: нет данных из Битрикс24 для {missing}, используются сохраненные.")
+        return len(fetched)
+
+    async def start(self, fetcher: DirectoryFetcher, teacher_ids: List[int] | None = None):
+        """Загружает справочник из файла, обновляет его и запускает периодическое обновление."""
+        teacher_ids = list(teacher_ids if teacher_ids is not None else TEACHER_IDS)
+        loaded = self.load()
+        try:
+            refreshed = await self.refresh(fetcher, teacher_ids)
+            logging.info(f"Справочник преподавателей: из файла {loaded}, обновлено из Битрикс24 {refreshed}.")
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении справочника преподавателей: {e}", exc_info=True)
+        self._task = asyncio.create_task(self._run(fetcher, teacher_ids))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, fetcher: DirectoryFetcher, teacher_ids: List[int]):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                # Плановое обновление уступает очередь запросам пользователей
+                with background_priority():
+                    await self.refresh(fetcher, teacher_ids)
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении справочника преподавателей: {e}", exc_info=True)
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(json.dumps(self._teachers, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить справочник преподавателей {self.path}: {e}")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Единый справочник преподавателей для всего приложения
+teacher_directory = TeacherDirectory(TEACHER_DIRECTORY_PATH, refresh_interval=TEACHER_DIRECTORY_REFRESH_SECONDS)
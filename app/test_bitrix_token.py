@@ -1,6 +1,6 @@
 # import requests
 
-# webhook_url = 'https://b24-aq3cu2.bitrix24.ru/rest/1/cuq4un14clczb58j/calendar.event.delete.json'
+# webhook_url = os.getenv('BITRIX24_WEBHOOK_URL') + 'calendar.event.delete.json'
 
 # data = {'id': 2}
 
@@ -14,10 +14,12 @@
 import asyncio
 import aiohttp
 import logging
+import os
 
 # --- КОНФИГУРАЦИЯ ---
-# URL вашего входящего вебхука. Должен заканчиваться на слэш "/"
-BITRIX24_WEBHOOK_URL = "https://b24-aq3cu2.bitrix24.ru/rest/1/cuq4un14clczb58j/"
+# URL входящего вебхука берется из окружения, как в боте. Для прогона без портала
+# запустите python -m benchmarks.fake_bitrix24 и укажите выведенный им адрес.
+BITRIX24_WEBHOOK_URL = (os.getenv("BITRIX24_WEBHOOK_URL") or "").rstrip("/") + "/"
 # ID пользователя, чьи события календаря нужно удалить
 USER_ID = 1
 # Пауза между запросами на удаление, чтобы не превысить лимиты API
@@ -108,6 +110,9 @@ async def delete_items_by_id(session, method, id_key, ids, extra_params=None):
 
 async def main():
     """Основная функция для сбора и удаления данных."""
+    if BITRIX24_WEBHOOK_URL == "/":
+        logging.error("Не задан BITRIX24_WEBHOOK_URL. Укажите вебхук портала или адрес benchmarks.fake_bitrix24.")
+        return
     async with aiohttp.ClientSession() as session:
         logging.info("--- Начинаем сбор ID задач ---")
         task_ids = await fetch_all_ids(session, 'tasks.task.list')
@@ -1,7 +1,6 @@
 # app/utils/formatters.py
 
 import logging
-import re
 from datetime import datetime
 
 # Словарь для склонения названий месяцев в родительном падеже
@@ -23,39 +22,22 @@ except ImportError:
     MORPHOLOGY_ENABLED = False
     def inflect_name(name: str, _: str) -> str: return name
 
+from app.utils.template_compiler import compile_template
+
 def format_response_with_inflection(template: str, data: dict) -> str:
     """
-    Надежно форматирует строку: сначала склоняет имена, а затем подставляет остальные данные.
-    Ищет плейсхолдеры вида {child_name:datv} и простые {parent_name}.
+    Надежно форматирует строку: склоняет имена и подставляет остальные данные.
+    Понимает плейсхолдеры вида {child_name:datv} и простые {parent_name}.
+    Шаблон разбирается один раз (кэш по тексту), дальше рендеринг — простая склейка сегментов.
     """
     if not template: return ""
 
-    processed_template = template
-
-    if MORPHOLOGY_ENABLED:
-        # Шаг 1: Найти все плейсхолдеры для склонения (например, {child_name:datv})
-        inflection_placeholders = re.findall(r'\{(\w+):(\w+)\}', template)
-        
-        for var_name, case in inflection_placeholders:
-            placeholder_to_replace = f"{{{var_name}:{case}}}"
-            
-            # Получаем оригинальное значение (например, "Татьяна")
-            original_value = data.get(var_name, "")
-            
-            # Склоняем его (например, в "Татьяне")
-            inflected_value = inflect_name(str(original_value), case)
-            
-            # Заменяем в шаблоне
-            processed_template = processed_template.replace(placeholder_to_replace, inflected_value)
-
-    # Шаг 2: Форматируем оставшиеся простые плейсхолдеры (например, {parent_name})
-    try:
-        # Используем стандартный .format() с исходными данными
-        return processed_template.format(**data)
-    except KeyError as e:
-        logging.warning(f"В шаблоне не хватило данных для ключа: {e}. Шаблон: '{processed_template}'")
-        # Возвращаем частично отформатированный шаблон, чтобы не падать с ошибкой
-        return processed_template
+    compiled = compile_template(template)
+    missing = [field for field in compiled.plain_fields if field not in data]
+    if missing:
+        logging.warning(f"В шаблоне не хватило данных для ключей: {missing}. Шаблон: '{template}'")
+    # Отсутствующие простые плейсхолдеры остаются в тексте как есть, чтобы не падать с ошибкой
+    return compiled.render(data, keep_missing=True, inflect=MORPHOLOGY_ENABLED)
 
 def format_date_russian(dt: datetime, mode: str = 'full') -> str:
     """
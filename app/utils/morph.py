@@ -0,0 +1,52 @@
+# app/utils/morph.py
+
+import logging
+import threading
+import time
+import tracemalloc
+
+from pymorphy3 import MorphAnalyzer
+
+# Единственный экземпляр анализатора на весь процесс. Словари pymorphy3 занимают
+# заметный объем памяти, поэтому создаем его лениво — при первом обращении.
+_morph: MorphAnalyzer | None = None
+_lock = threading.Lock()
+_stats = {"loaded": False, "load_seconds": 0.0, "memory_mb": 0.0}
+
+
+def get_morph() -> MorphAnalyzer:
+    """Возвращает общий MorphAnalyzer, загружая словари при первом вызове."""
+    global _morph
+    if _morph is None:
+        with _lock:
+            if _morph is None:
+                _morph = _load()
+    return _morph
+
+
+def _load() -> MorphAnalyzer:
+    # Память считаем через tracemalloc, только если его не включил кто-то еще
+    own_tracing = not tracemalloc.is_tracing()
+    if own_tracing:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started_at = time.perf_counter()
+
+    analyzer = MorphAnalyzer()
+
+    _stats["load_seconds"] = time.perf_counter() - started_at
+    _stats["memory_mb"] = (tracemalloc.get_traced_memory()[0] - memory_before) / (1024 * 1024)
+    _stats["loaded"] = True
+    if own_tracing:
+        tracemalloc.stop()
+
+    logging.debug(
+        f"Морфологический анализатор загружен за {_stats['load_seconds']:.2f} с, "
+        f"память: ~{_stats['memory_mb']:.1f} МБ."
+    )
+    return analyzer
+
+
+def morph_stats() -> dict:
+    """Статистика загрузки анализатора для стартовой диагностики."""
+    return dict(_stats)
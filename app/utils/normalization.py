@@ -0,0 +1,127 @@
+# app/utils/normalization.py
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from app.utils.morph import get_morph
+from app.utils.text_tools import correct_keyboard_layout, lemmatize, contains_lemmas, WORD_PATTERN
+
+# Эмодзи, пиктограммы и служебные символы, из которых они собираются
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0001F1E6-\U0001F1FF\U0000FE0F\U0000200D\U000020E3]+"
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+CYRILLIC_PATTERN = re.compile(r"[а-яА-ЯёЁ]")
+LATIN_PATTERN = re.compile(r"[a-zA-Z]")
+
+
+@dataclass(frozen=True)
+class NormalizedMessage:
+    """
+    Результат нормализации входящего сообщения. Вычисляется один раз на апдейт,
+    дальше его используют все проверки: правила интентов, шаблоны, семантика, LLM.
+
+    Атрибуты:
+        original (str): Исходный текст без пробелов по краям.
+        text (str): Текст с исправленной раскладкой (или исходный, если исправлять нечего).
+        folded (str): Текст для сравнения: нижний регистр, 'ё' -> 'е', без эмодзи и лишних пробелов.
+        lemmas (Tuple[str, ...]): Леммы слов в исходном порядке.
+        layout_corrected (bool): Была ли исправлена раскладка.
+    """
+    original: str
+    text: str
+    folded: str
+    lemmas: Tuple[str, ...]
+    layout_corrected: bool = False
+
+
+def fold_text(text: str) -> str:
+    """Приводит текст к виду для сравнения: нижний регистр, 'ё' -> 'е', без эмодзи и лишних пробелов."""
+    if not text:
+        return ""
+    text = EMOJI_PATTERN.sub(" ", text.lower().replace('ё', 'е'))
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def _known_words(text: str) -> int:
+    morph = get_morph()
+    return sum(1 for word in WORD_PATTERN.findall(text.lower()) if morph.word_is_known(word))
+
+
+def _fix_layout(text: str) -> str | None:
+    """
+    Исправляет раскладку, только если сообщение целиком набрано латиницей
+    и после перевода в нем становится больше слов из русского словаря.
+    Так "ghbdtn" превращается в "привет", а "python" или "hello" остаются как есть.
+    """
+    if CYRILLIC_PATTERN.search(text) or not LATIN_PATTERN.search(text):
+        return None
+    corrected = correct_keyboard_layout(text)
+    if corrected and _known_words(corrected) > _known_words(text):
+        return corrected
+    return None
+
+
+@lru_cache(maxsize=2048)
+def normalize_message(text: str) -> NormalizedMessage:
+    """
+    Нормализует текст сообщения. Результат кэшируется по тексту:
+    короткие фразы ("привет", "спасибо") повторяются очень часто.
+    """
+    original = (text or "").strip()
+    corrected = _fix_layout(original)
+    working_text = corrected or original
+    folded = fold_text(working_text)
+    return NormalizedMessage(
+        original=original,
+        text=working_text,
+        folded=folded,
+        lemmas=lemmatize(folded),
+        layout_corrected=corrected is not None,
+    )
+
+
+# Подготовленная ключевая фраза: (исходная фраза, нормализованная фраза)
+Keyword = Tuple[str, str]
+
+
+def prepare_keywords(phrases: Iterable[str]) -> List[Keyword]:
+    """
+    Нормализует ключевые фразы один раз — при загрузке конфигурации. Леммы фраз здесь
+    не считаются: это загрузило бы словари морфологии уже при импорте модулей.
+    """
+    return [(phrase, fold_text(str(phrase))) for phrase in phrases or []]
+
+
+@lru_cache(maxsize=4096)
+def keyword_lemmas(folded: str) -> Tuple[str, ...]:
+    """Леммы ключевой фразы: считаются при первом сравнении по леммам и затем берутся из кэша."""
+    return lemmatize(folded)
+
+
+def matches_keyword_exactly(message: NormalizedMessage, keyword: Keyword) -> bool:
+    """Нормализованная фраза целиком входит в нормализованный текст."""
+    _phrase, folded = keyword
+    return bool(folded) and folded in message.folded
+
+
+def matches_keyword_by_lemmas(message: NormalizedMessage, keyword: Keyword) -> bool:
+    """Леммы фразы идут в тексте подряд: "записали ребёнка" совпадает с "записать ребенка"."""
+    _phrase, folded = keyword
+    return bool(folded) and contains_lemmas(message.lemmas, keyword_lemmas(folded))
+
+
+def find_keyword_intent(message: NormalizedMessage, keywords_by_intent: Dict[str, List[Keyword]]) -> Tuple[str, str] | None:
+    """
+    Ищет интент по ключевым фразам в два прохода: сначала точное вхождение по всем интентам,
+    затем совпадение по леммам. Так точная фраза более позднего интента не проигрывает
+    совпадению по леммам у более раннего. Возвращает (интент, исходная фраза) или None.
+    """
+    for matches in (matches_keyword_exactly, matches_keyword_by_lemmas):
+        for intent, keywords in keywords_by_intent.items():
+            for keyword in keywords:
+                if matches(message, keyword):
+                    return intent, keyword[0]
+    return None
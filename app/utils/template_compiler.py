@@ -0,0 +1,106 @@
+# app/utils/template_compiler.py
+
+import logging
+from functools import lru_cache
+from string import Formatter
+from typing import Iterable, List, Tuple
+
+from app.utils.text_tools import inflect_name
+
+_formatter = Formatter()
+
+# Сегмент шаблона: (литерал, имя переменной, падеж, ключ готовых форм имени).
+# Для литерала имя переменной равно None, для плейсхолдера литерал равен None.
+Segment = Tuple[str | None, str | None, str | None, str | None]
+
+
+class CompiledTemplate:
+    """
+    Шаблон, заранее разобранный на литералы и плейсхолдеры вида {var} и {var:case}.
+    Рендеринг — это одна склейка списка, без регулярных выражений и str.format.
+    """
+    __slots__ = ("source", "segments", "plain_fields")
+
+    def __init__(self, source: str, segments: List[Segment]):
+        self.source = source
+        self.segments = segments
+        # Переменные без падежа: только их отсутствие делало str.format невозможным
+        self.plain_fields = tuple(field for literal, field, case, _ in segments if field is not None and not case)
+
+    def render(self, data: dict, defaults: dict | None = None, keep_missing: bool = False, inflect: bool = True) -> str:
+        """
+        Подставляет данные в шаблон.
+
+        Args:
+            data (dict): Значения переменных.
+            defaults (dict | None): Значения, которые используются, если переменная пустая.
+            keep_missing (bool): Оставлять ли отсутствующий простой плейсхолдер как есть ({var}),
+                                 вместо подстановки пустой строки.
+            inflect (bool): Склонять ли значения для плейсхолдеров с падежом.
+        """
+        parts = []
+        for literal, field, case, forms_key in self.segments:
+            if field is None:
+                parts.append(literal)
+                continue
+
+            value = data.get(field)
+            if not value and defaults and field in defaults:
+                value = defaults[field]
+
+            if case:
+                # Падежные формы, посчитанные при сохранении анкеты, берем без обращения к морфологии
+                forms = data.get(forms_key)
+                if inflect and forms and case in forms:
+                    parts.append(forms[case])
+                else:
+                    parts.append(inflect_name(str(value), case) if inflect and value else ("" if value is None else str(value)))
+            elif value is None and field not in data:
+                parts.append(f"{{{field}}}" if keep_missing else "")
+            else:
+                parts.append(str(value))
+        return "".join(parts)
+
+
+def _parse(source: str) -> List[Segment]:
+    segments: List[Segment] = []
+    for literal, field, case, _conversion in _formatter.parse(source):
+        if literal:
+            segments.append((literal, None, None, None))
+        if field is not None:
+            segments.append((None, field, case or None, f"{field}_forms"))
+    return segments
+
+
+@lru_cache(maxsize=1024)
+def compile_template(source: str) -> CompiledTemplate:
+    """
+    Разбирает строку шаблона на сегменты. Результат кэшируется по тексту шаблона,
+    поэтому каждый шаблон разбирается ровно один раз за время жизни процесса.
+    """
+    try:
+        segments = _parse(source)
+    except ValueError as e:
+        # Непарные фигурные скобки: считаем весь текст литералом, чтобы не падать
+        logging.warning(f"Не удалось разобрать шаблон, он будет выводиться как есть: {e}. Шаблон: '{source}'")
+        segments = [(source, None, None, None)]
+    return CompiledTemplate(source, segments)
+
+
+def precompile(templates: Iterable) -> int:
+    """
+    Заранее компилирует все строки из вложенной структуры шаблонов
+    (словари, списки, строки). Возвращает количество скомпилированных строк.
+    """
+    count = 0
+    stack = [templates]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            compile_template(item)
+            count += 1
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return count
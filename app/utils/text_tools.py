@@ -1,20 +1,55 @@
 import re
-from pymorphy3 import MorphAnalyzer
+from functools import lru_cache
+from typing import Sequence, Tuple
 
-morph = MorphAnalyzer()
+from app.utils.morph import get_morph
+
+# Слова для лемматизации: кириллица, латиница и цифры
+WORD_PATTERN = re.compile(r"[а-яёa-z0-9]+")
+
+# Таблица перевода английской раскладки в русскую строится один раз при импорте
+_ENG_LAYOUT = "`" + "qwertyuiop[]asdfghjkl;'zxcvbnm,./" + '~' + 'QWERTYUIOP{}ASDFGHJKL:"ZXCVBNM<>' + '?'
+_RUS_LAYOUT = "ё" + "йцукенгшщзхъфывапролджэячсмитьбю." + 'Ё' + 'ЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭЯЧСМИТЬБЮ,'
+LAYOUT_MAP = str.maketrans(_ENG_LAYOUT, _RUS_LAYOUT)
 
 def correct_keyboard_layout(text: str) -> str | None:
     """
     Переключает текст с английской раскладки на русскую.
     """
-    eng = "`" + "qwertyuiop[]asdfghjkl;'zxcvbnm,./" + '~' + 'QWERTYUIOP{}ASDFGHJKL:"ZXCVBNM<>' + '?'
-    rus = "ё" + "йцукенгшщзхъфывапролджэячсмитьбю." + 'Ё' + 'ЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭЯЧСМИТЬБЮ,'
-    layout_map = str.maketrans(eng, rus)
-    corrected_text = text.translate(layout_map)
+    corrected_text = text.translate(LAYOUT_MAP)
     if corrected_text == text or not re.search(r'[а-яА-ЯёЁ]', corrected_text):
         return None
     return corrected_text
 
+@lru_cache(maxsize=20000)
+def lemmatize_word(word: str) -> str:
+    """
+    Возвращает начальную форму слова (лемму). Буква 'ё' заменяется на 'е',
+    чтобы "придём" и "придем" давали одну и ту же лемму.
+    Результат кэшируется: одни и те же слова встречаются в сообщениях постоянно.
+    """
+    return get_morph().parse(word)[0].normal_form.replace('ё', 'е')
+
+def lemmatize(text: str) -> Tuple[str, ...]:
+    """Разбивает текст на слова и возвращает кортеж их лемм в исходном порядке."""
+    if not text:
+        return ()
+    return tuple(lemmatize_word(word) for word in WORD_PATTERN.findall(text.lower()))
+
+def contains_lemmas(text_lemmas: Sequence[str], phrase_lemmas: Sequence[str]) -> bool:
+    """
+    Проверяет, что леммы фразы идут в тексте подряд и в том же порядке.
+    Так "записали ребёнка" совпадает с ключевой фразой "записать ребенка".
+    """
+    phrase_len = len(phrase_lemmas)
+    if not phrase_len or phrase_len > len(text_lemmas):
+        return False
+    first = phrase_lemmas[0]
+    for i in range(len(text_lemmas) - phrase_len + 1):
+        if text_lemmas[i] == first and tuple(text_lemmas[i:i + phrase_len]) == tuple(phrase_lemmas):
+            return True
+    return False
+
 def is_plausible_name(name: str) -> bool:
     """Проверяет, является ли строка похожей на реальное имя."""
     name = name.strip()
@@ -24,21 +59,28 @@ def is_plausible_name(name: str) -> bool:
     if name.lower() in stop_words: return False
     return True
 
+# Падежи, которые заранее вычисляются для имен при сохранении анкеты
+NAME_CASES = ('nomn', 'gent', 'datv', 'accs', 'ablt', 'loct')
+
 def inflect_name(name: str, case: str) -> str:
     """
     Склоняет имя (или ФИО) в нужный падеж, сохраняя правильную капитализацию.
     Теперь функция защищена от None на входе.
+    Результаты кэшируются: одно и то же имя склоняется на каждом сообщении.
     """
     # --- КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: Защита от пустого значения ---
     if not name or not isinstance(name, str):
         return ""
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+    return _inflect_name_cached(name, case)
 
+@lru_cache(maxsize=4096)
+def _inflect_name_cached(name: str, case: str) -> str:
     try:
         words = name.split()
         inflected_parts = []
         for word in words:
-            parses = morph.parse(word)
+            parses = get_morph().parse(word)
             name_parse = next((p for p in parses if 'Name' in p.tag or 'Surn' in p.tag or 'Patr' in p.tag), parses[0])
             inflected_word_obj = name_parse.inflect({case})
             inflected_parts.append(inflected_word_obj.word if inflected_word_obj else word)
@@ -46,3 +88,35 @@ def inflect_name(name: str, case: str) -> str:
     except Exception:
         return " ".join(part.capitalize() for part in name.split())
 
+def inflect_cache_info():
+    """Статистика кэша склонений (попадания, промахи, размер)."""
+    return _inflect_name_cached.cache_info()
+
+def name_paradigm(name: str) -> dict:
+    """Возвращает все падежные формы имени: {'nomn': 'Миша', 'datv': 'Мише', ...}."""
+    if not name or not isinstance(name, str):
+        return {}
+    return {case: inflect_name(name, case) for case in NAME_CASES}
+
+def add_name_forms(data: dict, keys: tuple = ('parent_name', 'child_name')) -> dict:
+    """
+    Добавляет в анкету готовые падежные формы имен (ключи вида 'child_name_forms'),
+    чтобы при выводе сообщений склонение сводилось к поиску в словаре.
+    """
+    result = dict(data)
+    for key in keys:
+        forms = name_paradigm(result.get(key))
+        if forms:
+            result[f"{key}_forms"] = forms
+        else:
+            result.pop(f"{key}_forms", None)
+    return result
+
+def get_name_form(data: dict, key: str, case: str) -> str:
+    """Берет готовую форму имени из анкеты, а если ее нет — склоняет на лету."""
+    if not data:
+        return ""
+    forms = data.get(f"{key}_forms")
+    if forms and case in forms:
+        return forms[case]
+    return inflect_name(data.get(key), case)
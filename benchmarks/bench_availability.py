@@ -0,0 +1,132 @@
+# benchmarks/bench_availability.py
+#
+# Замер движка расписания app/services/availability.py: время расчета для 50 преподавателей
+# на 30 дней. Прежний алгоритм (каждый часовой слот сравнивается со всеми занятыми интервалами
+# всех преподавателей сразу, поэтому любое занятие любого преподавателя закрывает слот для всех),
+# его исправленный вариант с перебором по каждому преподавателю и проход по отсортированным интервалам.
+# Корректность движка проверяют тесты tests/test_availability.py.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_availability [--teachers 50] [--days 30] [--events 6]
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+
+from app.services.availability import AvailabilityEngine, WorkingHours
+
+TZ = ZoneInfo("Europe/Moscow")
+
+
+def random_calendars(teachers: int, days: int, events_per_day: int, start: datetime) -> dict:
+    """Занятость со случайными длительностями и пересечениями, в том числе вне рабочего времени."""
+    calendars = {}
+    for teacher_id in range(1, teachers + 1):
+        intervals = []
+        for day in range(days + 1):
+            base = start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=day)
+            for _ in range(random.randint(0, events_per_day)):
+                busy_start = base + timedelta(minutes=random.randrange(7 * 60, 21 * 60, 5))
+                intervals.append((busy_start, busy_start + timedelta(minutes=random.choice((15, 30, 45, 60, 90, 150)))))
+        random.shuffle(intervals)
+        calendars[teacher_id] = intervals
+    return calendars
+
+
+def brute_force(engine: AvailabilityEngine, busy, from_date, to_date, duration_minutes, now) -> list:
+    """Перебор «в лоб»: каждый слот сетки сравнивается со всеми интервалами преподавателя."""
+    duration = timedelta(minutes=duration_minutes)
+    slots = []
+    for window_start, window_end in engine.working_hours.windows(from_date, to_date):
+        slot = window_start
+        while slot + duration <= window_end:
+            overlaps = any(
+                slot < busy_end + engine.buffer and busy_start - engine.buffer < slot + duration
+                for busy_start, busy_end in busy
+            )
+            if not overlaps and (now is None or slot >= now):
+                slots.append(slot)
+            slot += engine.step
+    return slots
+
+
+def legacy_free_slots(calendars: dict, from_date: datetime, to_date: datetime, lesson_duration: int, now: datetime) -> dict:
+    """Прежний get_free_slots: занятость всех преподавателей сваливалась в один список."""
+    final_slots = {}
+    all_busy = [interval for intervals in calendars.values() for interval in intervals]
+    for day_offset in range((to_date - from_date).days + 1):
+        check_day = (from_date + timedelta(days=day_offset)).replace(hour=0, minute=0, second=0, microsecond=0)
+        if check_day.weekday() >= 5:
+            continue
+        for hour in range(10, 18):
+            slot_start = check_day.replace(hour=hour, minute=0)
+            slot_end = slot_start + timedelta(minutes=lesson_duration)
+            if slot_end.hour > 18 or slot_start < now:
+                continue
+            if any(slot_start < busy_end and busy_start < slot_end for busy_start, busy_end in all_busy):
+                continue
+            final_slots.setdefault(slot_start.strftime('%Y-%m-%d'), []).append(
+                {'time': slot_start.strftime('%H:%M'), 'user_ids': list(calendars)}
+            )
+    return final_slots
+
+
+def brute_force_by_date(engine: AvailabilityEngine, calendars: dict, from_date, to_date, duration_minutes, now) -> dict:
+    """Те же слоты в формате бота, но каждый слот сравнивается со всеми интервалами преподавателя."""
+    teachers_by_start = {}
+    for teacher_id, busy in calendars.items():
+        for start in brute_force(engine, busy, from_date, to_date, duration_minutes, now):
+            teachers_by_start.setdefault(start, []).append(teacher_id)
+    slots = {}
+    for start in sorted(teachers_by_start):
+        slots.setdefault(start.strftime('%Y-%m-%d'), []).append(
+            {'time': start.strftime('%H:%M'), 'user_ids': teachers_by_start[start]}
+        )
+    return slots
+
+
+def measure(func, runs: int) -> tuple[float, dict]:
+    timings, result = [], None
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер движка свободных слотов")
+    parser.add_argument("--teachers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--events", type=int, default=6, help="максимум занятых интервалов в день у преподавателя")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    engine = AvailabilityEngine(WorkingHours(dt_time(10), dt_time(18)), step_minutes=60)
+    from_date = datetime(2025, 3, 3, 9, 0, tzinfo=TZ)
+    to_date = from_date + timedelta(days=args.days)
+    calendars = random_calendars(args.teachers, args.days, args.events, from_date)
+    busy_total = sum(len(intervals) for intervals in calendars.values())
+
+    legacy_ms, legacy = measure(lambda: legacy_free_slots(calendars, from_date, to_date, 60, from_date), args.runs)
+    per_teacher_ms, per_teacher = measure(lambda: brute_force_by_date(engine, calendars, from_date, to_date, 60, from_date), args.runs)
+    engine_ms, slots = measure(lambda: engine.slots_by_date(calendars, from_date, to_date, 60, now=from_date), args.runs)
+
+    print(f"\n{args.teachers} преподавателей, {args.days} дней, {busy_total} занятых интервалов, медиана по {args.runs} запускам")
+    print(f"{'алгоритм':26} {'время, мс':>10} {'слотов':>8} {'пар слот-преподаватель':>24}")
+    rows = (("прежний", legacy_ms, legacy), ("перебор по преподавателям", per_teacher_ms, per_teacher),
+            ("проход по интервалам", engine_ms, slots))
+    for name, elapsed, result in rows:
+        count = sum(len(day) for day in result.values())
+        pairs = sum(len(slot['user_ids']) for day in result.values() for slot in day)
+        print(f"{name:26} {elapsed:>10.2f} {count:>8} {pairs:>24}")
+    print(f"Ускорение относительно перебора по преподавателям: {per_teacher_ms / engine_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
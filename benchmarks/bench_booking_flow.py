@@ -0,0 +1,190 @@
+# benchmarks/bench_booking_flow.py
+#
+# Нагрузочный прогон сценариев записи без портала: настоящие функции bitrix_service
+# (get_available_slots, book_lesson, cancel_booking, reschedule_booking) работают против
+# benchmarks/fake_bitrix24.py. Каждый виртуальный пользователь смотрит свободные слоты,
+# записывается (перебирая свободных в этот слот преподавателей, как обработчик бота),
+# затем часть пользователей отменяет или переносит урок.
+# Печатает задержки по операциям, число вызовов каждого метода Битрикс24, статистику
+# ограничителя запросов и кэша слотов, а в конце проверяет, нет ли двойных бронирований.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_booking_flow [--users 200] [--concurrency 20] [--teachers 5] [--latency-ms 100]
+#     python -m benchmarks.bench_booking_flow --rate-limit 2 --client-rate 2   # лимит портала и клиента
+#     python -m benchmarks.bench_booking_flow --http   # через локальный HTTP-сервер вместо MockTransport
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from app.services import bitrix_service
+from app.services.availability_cache import availability_cache
+from app.services.b24_client import b24_client
+from app.services.teacher_directory import teacher_directory
+from benchmarks.fake_bitrix24 import FakeBitrix24
+
+TZ = ZoneInfo("Europe/Moscow")
+CLIENT = {"username": "bench", "parent_name": "Родитель", "child_name": "Петя", "child_age": 11}
+
+
+class FlowStats:
+    def __init__(self):
+        self.timings: dict[str, list] = {}
+        self.failures: dict[str, int] = {}
+
+    async def measure(self, name: str, coro):
+        started_at = time.perf_counter()
+        result = await coro
+        self.timings.setdefault(name, []).append(time.perf_counter() - started_at)
+        return result
+
+    def fail(self, name: str):
+        self.failures[name] = self.failures.get(name, 0) + 1
+
+    def report(self):
+        print(f"{'операция':22} {'вызовов':>8} {'неудач':>7} {'медиана, мс':>12} {'p95, мс':>10}")
+        for name, timings in self.timings.items():
+            p95 = statistics.quantiles(timings, n=20)[18] if len(timings) >= 20 else max(timings)
+            print(f"{name:22} {len(timings):>8} {self.failures.get(name, 0):>7} "
+                  f"{statistics.median(timings) * 1000:>12.1f} {p95 * 1000:>10.1f}")
+
+
+def seed_calendars(fake: FakeBitrix24, teacher_ids: list[int], days: int, busy_per_day: int):
+    """Каждому преподавателю — несколько занятых часов в рабочее время."""
+    today = datetime.now(TZ).replace(minute=0, second=0, microsecond=0)
+    for teacher_id in teacher_ids:
+        fake.add_teacher(teacher_id, "Преподаватель", str(teacher_id))
+        for day in range(days + 1):
+            for hour in random.sample(range(10, 18), k=min(busy_per_day, 8)):
+                start = (today + timedelta(days=day)).replace(hour=hour)
+                fake.add_busy(teacher_id, start, start + timedelta(hours=1))
+
+
+def pick_slot(slots: dict) -> tuple[datetime, list[int]] | None:
+    if not slots:
+        return None
+    day = random.choice(sorted(slots))
+    slot = random.choice(slots[day])
+    return datetime.fromisoformat(f"{day}T{slot['time']}").replace(tzinfo=TZ), list(slot["user_ids"])
+
+
+async def user_flow(stats: FlowStats, teacher_ids: list[int], cancel_share: float, reschedule_share: float):
+    slots = await stats.measure("get_available_slots", bitrix_service.get_available_slots(teacher_ids, TZ, days=7))
+    picked = pick_slot(slots)
+    if picked is None:
+        stats.fail("get_available_slots")
+        return
+    start_time, candidates = picked
+
+    booked = None
+    for teacher_id in candidates:
+        task_id, event_id, _ = await stats.measure(
+            "book_lesson", bitrix_service.book_lesson(teacher_id, start_time, 60, dict(CLIENT))
+        )
+        if task_id and event_id:
+            booked = (int(task_id), int(event_id), teacher_id)
+            break
+        stats.fail("book_lesson")
+    if booked is None:
+        return
+    task_id, event_id, teacher_id = booked
+
+    roll = random.random()
+    if roll < cancel_share:
+        ok = await stats.measure("cancel_booking", bitrix_service.cancel_booking(task_id, event_id, teacher_id, "нагрузочный тест"))
+        if not ok:
+            stats.fail("cancel_booking")
+    elif roll < cancel_share + reschedule_share:
+        teacher_slots = await stats.measure(
+            "get_available_slots", bitrix_service.get_available_slots([teacher_id], TZ, days=7)
+        )
+        new_slot = pick_slot(teacher_slots)
+        if new_slot is None:
+            return
+        ok = await stats.measure("reschedule_booking", bitrix_service.reschedule_booking(
+            task_id, event_id, start_time, new_slot[0], teacher_id, dict(CLIENT)
+        ))
+        if not ok:
+            stats.fail("reschedule_booking")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон записи, отмены и переноса на фейковом Битрикс24")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--teachers", type=int, default=5)
+    parser.add_argument("--busy-per-day", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--rate-limit", type=float, default=0, help="лимит портала, запросов в секунду (0 — без лимита)")
+    parser.add_argument("--limit-error-rate", type=float, default=0.0, help="доля случайных QUERY_LIMIT_EXCEEDED")
+    parser.add_argument("--client-rate", type=float, default=0, help="ограничитель b24_client, запросов в секунду (0 — выкл.)")
+    parser.add_argument("--cancel-share", type=float, default=0.2)
+    parser.add_argument("--reschedule-share", type=float, default=0.2)
+    parser.add_argument("--http", action="store_true", help="поднять локальный HTTP-сервер вместо MockTransport")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    fake = FakeBitrix24(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_limit=args.rate_limit,
+                        burst=max(1, int(args.rate_limit * 2)) if args.rate_limit else 50,
+                        limit_error_rate=args.limit_error_rate)
+    teacher_ids = list(range(1, args.teachers + 1))
+    seed_calendars(fake, teacher_ids, days=8, busy_per_day=args.busy_per_day)
+
+    server = None
+    if args.http:
+        server = await fake.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        b24_client.webhook_url = f"http://127.0.0.1:{port}/rest/1/bench"
+        b24_client.start()
+    else:
+        b24_client.webhook_url = "https://bitrix.invalid/rest/1/bench"
+        b24_client.start(transport=fake.transport())
+    bitrix_service.BITRIX24_WEBHOOK_URL = b24_client.webhook_url
+    b24_client.limiter.rate = args.client_rate
+
+    # Справочник преподавателей во временном файле, чтобы не трогать рабочий
+    tmp_dir = tempfile.TemporaryDirectory()
+    teacher_directory.path = Path(tmp_dir.name) / "teacher_directory.json"
+    await teacher_directory.refresh(bitrix_service.fetch_teacher_directory, teacher_ids)
+
+    stats = FlowStats()
+    remaining = iter(range(args.users))
+
+    async def worker():
+        for _ in remaining:
+            await user_flow(stats, teacher_ids, args.cancel_share, args.reschedule_share)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    print(f"\n{args.users} пользователей, параллельность {args.concurrency}, {args.teachers} преподавателей, "
+          f"задержка {args.latency_ms:.0f}±{args.jitter_ms:.0f} мс, {'HTTP' if args.http else 'MockTransport'}")
+    print(f"Всего {elapsed:.1f} с, {args.users / elapsed:.1f} сценариев/с\n")
+    stats.report()
+    print(f"\nHTTP-запросов к Битрикс24: {fake.stats['requests']}, ошибок лимита: {fake.stats['limit_errors']}")
+    print(f"Вызовы методов: {dict(sorted(fake.stats['methods'].items()))}")
+    print(f"Клиент: {b24_client.connection_stats()}")
+    print(f"Ограничитель клиента: {b24_client.limiter.snapshot()}")
+    print(f"Кэш свободных слотов: {availability_cache.stats}")
+    print(f"Справочник преподавателей: {teacher_directory.stats}")
+    overlaps = fake.overlapping_events()
+    print(f"Пересекающихся событий (двойных бронирований): {len(overlaps)}" + (f", например {overlaps[:3]}" if overlaps else ""))
+
+    await b24_client.close()
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+# benchmarks/bench_free_slots.py
+#
+# Время get_free_slots для 1, 5 и 20 преподавателей: последовательные запросы календарей
+# (как было) против параллельных с ограничением B24_CALENDAR_CONCURRENCY.
+# Битрикс24 заменен httpx.MockTransport с искусственной задержкой ответа;
+# --fail-rate задает долю календарей, которые отвечают ошибкой (проверка деградации).
+# Ограничитель частоты запросов b24_client по умолчанию выключен, чтобы мерить именно
+# параллельность; --rate-limit 2 показывает время с лимитом Битрикс24.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_free_slots [--latency-ms 150] [--concurrency 5] [--fail-rate 0.1] [--rate-limit 2]
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from app.services import bitrix_service
+from app.services.b24_client import b24_client
+
+TEACHER_COUNTS = (1, 5, 20)
+
+
+def fake_calendar(latency_ms: float, fail_rate: float):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        params = json.loads(request.content)
+        if random.random() < fail_rate:
+            return httpx.Response(200, json={"error": "INTERNAL_SERVER_ERROR", "error_description": "fake failure"})
+        # У каждого преподавателя по одному занятому часу в день
+        start = datetime.fromisoformat(params["from"])
+        hour = 10 + int(params["ownerId"]) % 8
+        events = [
+            {
+                "ID": str(day),
+                "DATE_FROM": (start + timedelta(days=day)).replace(hour=hour, minute=0).strftime("%d.%m.%Y %H:%M:%S"),
+                "DATE_TO": (start + timedelta(days=day)).replace(hour=hour + 1, minute=0).strftime("%d.%m.%Y %H:%M:%S"),
+            }
+            for day in range(8)
+        ]
+        return httpx.Response(200, json={"result": events})
+    return handler
+
+
+async def measure(teachers: int, concurrency: int, runs: int) -> tuple[float, int]:
+    bitrix_service.B24_CALENDAR_CONCURRENCY = concurrency
+    now = datetime.now(ZoneInfo("Europe/Moscow"))
+    timings, days = [], 0
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        slots = await bitrix_service.get_free_slots(now, now + timedelta(days=7), list(range(1, teachers + 1)))
+        timings.append(time.perf_counter() - started_at)
+        days = len(slots)
+    return statistics.median(timings) * 1000, days
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Параллельная загрузка календарей в get_free_slots")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rate-limit", type=float, default=0, help="запросов в секунду (0 — без ограничения)")
+    args = parser.parse_args()
+
+    b24_client.webhook_url = "https://bitrix.invalid/rest/1/bench"
+    b24_client.limiter.rate = args.rate_limit
+    b24_client.start(transport=httpx.MockTransport(fake_calendar(args.latency_ms, args.fail_rate)))
+    print(f"Задержка ответа {args.latency_ms:.0f} мс, доля ошибок {args.fail_rate:.0%}, медиана по {args.runs} запускам")
+    print(f"{'преподавателей':>15} {'последовательно, мс':>20} {'параллельно, мс':>16} {'ускорение':>10}")
+    for teachers in TEACHER_COUNTS:
+        sequential, _ = await measure(teachers, 1, args.runs)
+        concurrent, days = await measure(teachers, args.concurrency, args.runs)
+        print(f"{teachers:>15} {sequential:>20.0f} {concurrent:>16.0f} {sequential / concurrent:>9.1f}x  (дней со слотами: {days})")
+    await b24_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+# benchmarks/bench_history_indexes.py
+#
+# Запросы load_history и get_all_active_lessons на большой таблице истории
+# (по умолчанию миллион сообщений) без составных индексов и с ними.
+# Заодно печатает планы запросов и проверяет, что индексы действительно используются.
+# Работает на временном SQLite-файле через синхронный драйвер.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_history_indexes [--rows 1000000] [--users 5000]
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+from app.db.models import Base, DialogHistory, TrialLesson
+from app.db.query_plans import check_query_plans, query_plans
+from app.db.queries import history_query, active_lessons_query
+
+COMPOSITE_INDEXES = [
+    index for table in (DialogHistory.__table__, TrialLesson.__table__)
+    for index in table.indexes if len(index.expressions) > 1
+]
+STATUSES = ("PLANNED", "COMPLETED", "CANCELLED")
+
+
+def seed(engine, rows: int, users: int):
+    started_at = time.perf_counter()
+    start = datetime(2024, 1, 1)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.executemany(
+            "INSERT INTO users (id, telegram_id, onboarding_completed, is_enrolled, is_blocked, irrelevant_count) "
+            "VALUES (?, ?, 1, 0, 0, 0)",
+            ((i, 10_000 + i) for i in range(1, users + 1)),
+        )
+        chunk = 50_000
+        for offset in range(0, rows, chunk):
+            cursor.executemany(
+                "INSERT INTO dialog_history (user_id, role, message, created_at) VALUES (?, ?, ?, ?)",
+                (
+                    (random.randint(1, users), "user" if i % 2 else "assistant", f"сообщение {i}",
+                     (start + timedelta(seconds=i * 7)).isoformat(sep=" "))
+                    for i in range(offset, min(offset + chunk, rows))
+                ),
+            )
+        cursor.executemany(
+            "INSERT INTO trial_lessons (user_id, status, scheduled_at) VALUES (?, ?, ?)",
+            (
+                (random.randint(1, users), random.choice(STATUSES),
+                 (start + timedelta(hours=i)).isoformat(sep=" "))
+                for i in range(users * 3)
+            ),
+        )
+        raw.commit()
+    finally:
+        raw.close()
+    print(f"Заполнено: {rows} сообщений, {users} пользователей, {users * 3} уроков за {time.perf_counter() - started_at:.1f} с")
+
+
+def time_queries(engine, users: int, samples: int) -> dict:
+    user_ids = [random.randint(1, users) for _ in range(samples)]
+    results = {}
+    with engine.connect() as conn:
+        for name, build in (("load_history", lambda uid: history_query(uid, 10)),
+                            ("get_all_active_lessons", active_lessons_query)):
+            timings = []
+            for user_id in user_ids:
+                started_at = time.perf_counter()
+                conn.execute(build(user_id)).fetchall()
+                timings.append(time.perf_counter() - started_at)
+            results[name] = (statistics.median(timings) * 1000, statistics.quantiles(timings, n=20)[18] * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк составных индексов истории и уроков")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+        # Состояние до миграции 0002: составных индексов нет
+        for index in COMPOSITE_INDEXES:
+            index.drop(engine)
+        seed(engine, args.rows, args.users)
+
+        before = time_queries(engine, args.users, args.samples)
+        with engine.connect() as conn:
+            plans_before = query_plans(conn)
+
+        started_at = time.perf_counter()
+        for index in COMPOSITE_INDEXES:
+            index.create(engine)
+        print(f"Создание индексов: {time.perf_counter() - started_at:.1f} с")
+
+        after = time_queries(engine, args.users, args.samples)
+        with engine.connect() as conn:
+            plans_after = query_plans(conn)
+            indexes_used = check_query_plans(conn)
+        engine.dispose()
+
+    for name in before:
+        print(f"{name}:")
+        print(f"  план без индекса: {' | '.join(plans_before[name].splitlines())}")
+        print(f"  план с индексом:  {' | '.join(plans_after[name].splitlines())}")
+        print(f"  без индекса: медиана {before[name][0]:.3f} мс, p95 {before[name][1]:.3f} мс")
+        print(f"  с индексом:  медиана {after[name][0]:.3f} мс, p95 {after[name][1]:.3f} мс")
+        print(f"  ускорение медианы: {before[name][0] / after[name][0]:.0f}x")
+    assert indexes_used, "Запросы не используют составные индексы — см. планы выше"
+    print("Проверка планов: оба запроса используют составные индексы.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/bench_sqlite_writers.py
+#
+# Конкурентные писатели истории диалога на SQLite: профиль "default"
+# (журнал отката, synchronous=FULL) против "performance" (WAL, synchronous=NORMAL,
+# mmap, кэш, busy_timeout), а также "performance" с отложенной пакетной записью
+# через HistoryWriteBuffer. Параллельно работают читатели load_history.
+# Каждый вариант проверяется на отдельном временном файле.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_sqlite_writers [--writers 20] [--messages 50] [--readers 5]
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import desc, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import (
+    SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+)
+from app.db.history_buffer import HistoryWriteBuffer
+from app.db.models import Base, DialogHistory, User
+from app.db.sqlite_tuning import build_pragmas, install_sqlite_pragmas
+
+
+async def writer(session_factory, user_id: int, messages: int, latencies: list, errors: list,
+                 buffer: HistoryWriteBuffer | None = None):
+    for i in range(messages):
+        started_at = time.perf_counter()
+        if buffer is not None:
+            buffer.add(user_id, "user", f"сообщение {i}")
+            latencies.append(time.perf_counter() - started_at)
+            # Как и в боте, между сообщениями обработчик отдает управление циклу событий
+            await asyncio.sleep(0)
+            continue
+        try:
+            async with session_factory() as session:
+                session.add(DialogHistory(user_id=user_id, role="user", message=f"сообщение {i}"))
+                await session.commit()
+        except OperationalError as e:
+            errors.append(str(e.orig))
+            continue
+        latencies.append(time.perf_counter() - started_at)
+
+
+async def reader(session_factory, user_id: int, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        async with session_factory() as session:
+            await session.execute(
+                select(DialogHistory).where(DialogHistory.user_id == user_id)
+                .order_by(desc(DialogHistory.created_at)).limit(10)
+            )
+        counter[0] += 1
+        await asyncio.sleep(0)
+
+
+async def run_profile(profile: str, args, buffered: bool = False) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{Path(tmp_dir) / 'bench.db'}",
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+        )
+        install_sqlite_pragmas(
+            engine, build_pragmas(profile, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS)
+        )
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_factory() as session:
+            session.add_all([User(id=i + 1, telegram_id=1000 + i) for i in range(args.writers)])
+            await session.commit()
+
+        buffer = None
+        if buffered:
+            buffer = HistoryWriteBuffer(flush_interval_ms=args.flush_ms, max_rows=args.flush_rows)
+            buffer.start(session_factory)
+
+        latencies, errors, reads = [], [], [0]
+        stop = asyncio.Event()
+        readers = [asyncio.create_task(reader(session_factory, i % args.writers + 1, stop, reads))
+                   for i in range(args.readers)]
+        started_at = time.perf_counter()
+        await asyncio.gather(*(writer(session_factory, i + 1, args.messages, latencies, errors, buffer)
+                               for i in range(args.writers)))
+        if buffer is not None:
+            # Время считаем до фактической записи последней строки
+            await buffer.stop()
+            errors.extend(["ошибка записи пакета"] * buffer.stats["errors"])
+        elapsed = time.perf_counter() - started_at
+        stop.set()
+        await asyncio.gather(*readers)
+        await engine.dispose()
+
+    p95 = statistics.quantiles(latencies, n=20)[18] * 1000 if len(latencies) >= 20 else float("nan")
+    print(f"Профиль '{profile}'{' + буфер записи' if buffered else ''}:")
+    print(f"  записей: {len(latencies)} за {elapsed:.2f} с ({len(latencies) / elapsed:.0f} в секунду)")
+    print(f"  задержка записи: медиана {statistics.median(latencies) * 1000:.1f} мс, p95 {p95:.1f} мс")
+    print(f"  чтений за то же время: {reads[0]}")
+    print(f"  ошибок 'database is locked' и других: {len(errors)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Конкурентные записи в SQLite по профилям PRAGMA")
+    parser.add_argument("--writers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=5)
+    parser.add_argument("--flush-ms", type=int, default=200)
+    parser.add_argument("--flush-rows", type=int, default=100)
+    args = parser.parse_args()
+    for profile in ("default", "performance"):
+        await run_profile(profile, args)
+    await run_profile("performance", args, buffered=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
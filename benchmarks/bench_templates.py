@@ -0,0 +1,118 @@
+# benchmarks/bench_templates.py
+#
+# Сравнение старого рендеринга шаблонов (re.sub / re.findall + str.format
+# с вызовом pymorphy3 на каждый плейсхолдер) и предкомпилированных шаблонов.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_templates [--iterations 20000]
+
+import argparse
+import json
+import re
+import timeit
+from pathlib import Path
+
+from app.knowledge_base.documents.templates import TEMPLATES
+from app.utils.template_compiler import compile_template, precompile
+from app.utils.text_tools import add_name_forms, inflect_cache_info, inflect_name
+
+FSM_SCENARIO_PATH = Path(__file__).parent.parent / "app" / "knowledge_base" / "scenarios" / "fsm_scenario.json"
+USER_DATA = {
+    "parent_name": "Татьяна",
+    "child_name": "Михаил",
+    "child_age": 12,
+    "child_hobbies": "майнкрафт",
+    "parent_contact": "+7 900 000-00-00",
+}
+
+
+# --- Реализации до компиляции шаблонов (эталон для сравнения) ---
+
+def legacy_build_template(text: str, user_data: dict) -> str:
+    def replace_placeholder(match):
+        parts = match.group(1).split(':')
+        var_name = parts[0]
+        case = parts[1] if len(parts) > 1 else None
+        if var_name == 'parent_name' and not user_data.get(var_name):
+            value = "Уважаемый родитель"
+        else:
+            value = user_data.get(var_name, '')
+        if case and value:
+            return inflect_name(value, case)
+        return str(value)
+    return re.sub(r'\{([^}]+)\}', replace_placeholder, text)
+
+
+def legacy_format_with_inflection(template: str, data: dict) -> str:
+    processed_template = template
+    for var_name, case in re.findall(r'\{(\w+):(\w+)\}', template):
+        inflected_value = inflect_name(str(data.get(var_name, "")), case)
+        processed_template = processed_template.replace(f"{{{var_name}:{case}}}", inflected_value)
+    try:
+        return processed_template.format(**data)
+    except KeyError:
+        return processed_template
+
+
+def _collect_strings(item) -> list[str]:
+    if isinstance(item, str):
+        return [item]
+    if isinstance(item, dict):
+        return [s for value in item.values() for s in _collect_strings(value)]
+    if isinstance(item, (list, tuple)):
+        return [s for value in item for s in _collect_strings(value)]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рендеринга шаблонов")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(FSM_SCENARIO_PATH, 'r', encoding='utf-8') as f:
+        fsm_config = json.load(f)
+    fsm_questions = [step["question"] for step in fsm_config["states"].values() if step.get("question")]
+    template_strings = [s for s in _collect_strings(TEMPLATES) if "{" in s]
+
+    precompile(TEMPLATES)
+    precompile(fsm_questions)
+
+    # Проверяем, что новый рендеринг дает тот же текст, что и старый
+    for text in template_strings:
+        assert legacy_build_template(text, USER_DATA) == compile_template(text).render(
+            USER_DATA, defaults={"parent_name": "Уважаемый родитель"}), text
+    for text in fsm_questions:
+        assert legacy_format_with_inflection(text, USER_DATA) == compile_template(text).render(USER_DATA, keep_missing=True), text
+
+    cases = {
+        "TEMPLATES (build_template_response)": (
+            lambda: [legacy_build_template(t, USER_DATA) for t in template_strings],
+            lambda: [compile_template(t).render(USER_DATA, defaults={"parent_name": "Уважаемый родитель"}) for t in template_strings],
+        ),
+        "fsm_scenario.json (format_response_with_inflection)": (
+            lambda: [legacy_format_with_inflection(t, USER_DATA) for t in fsm_questions],
+            lambda: [compile_template(t).render(USER_DATA, keep_missing=True) for t in fsm_questions],
+        ),
+    }
+
+    iterations = max(1, args.iterations // max(1, len(template_strings)))
+    print(f"Строк с плейсхолдерами: TEMPLATES={len(template_strings)}, сценарий={len(fsm_questions)}; повторов: {iterations}")
+    for title, (legacy, compiled) in cases.items():
+        legacy_time = timeit.timeit(legacy, number=iterations)
+        compiled_time = timeit.timeit(compiled, number=iterations)
+        print(f"{title}:")
+        print(f"  старый рендеринг:        {legacy_time * 1e6 / iterations:9.1f} мкс за проход")
+        print(f"  предкомпилированный:     {compiled_time * 1e6 / iterations:9.1f} мкс за проход")
+        print(f"  ускорение:               {legacy_time / compiled_time:9.1f}x")
+    # Анкета с заранее посчитанными падежами (как после онбординга): склонение — поиск в словаре
+    user_data_with_forms = add_name_forms(USER_DATA)
+    forms_time = timeit.timeit(
+        lambda: [compile_template(t).render(user_data_with_forms, keep_missing=True) for t in fsm_questions],
+        number=iterations,
+    )
+    print(f"fsm_scenario.json с готовыми формами имен: {forms_time * 1e6 / iterations:9.1f} мкс за проход")
+    print(f"Кэш склонений: {inflect_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
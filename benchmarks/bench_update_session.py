@@ -0,0 +1,85 @@
+# benchmarks/bench_update_session.py
+#
+# Сколько SQL-запросов и коммитов уходит на одно текстовое сообщение:
+# отдельная сессия на каждую функцию БД (как было) против коротких единиц работы
+# (DbSessionMiddleware + unit_of_work в handle_any_text). Работает на временной SQLite-базе.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_update_session [--updates 200]
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.database import (
+    async_session_factory, get_or_create_user, load_history, save_history, increment_irrelevant_count,
+    unit_of_work,
+)
+from app.db.models import Base
+from app.db.stats import install_query_counter, track_queries
+
+TELEGRAM_ID = 424242
+
+
+async def per_call_sessions():
+    """Старый путь handle_any_text: каждая функция открывает свою сессию и коммитит."""
+    user = await get_or_create_user(TELEGRAM_ID, "bench")
+    await load_history(user.id)
+    await save_history(user.id, "user", "сколько стоит обучение?")
+    await increment_irrelevant_count(user.id)
+
+
+async def short_units_of_work():
+    """
+    Новый путь: пользователь находится в сессии middleware, история читается и пишется одной
+    единицей работы, счетчик увеличивается своей короткой сессией (между ними — сетевые вызовы).
+    """
+    async with unit_of_work() as session:
+        user = await get_or_create_user(TELEGRAM_ID, "bench", session=session)
+    async with unit_of_work() as session:
+        await load_history(user.id, session=session)
+        await save_history(user.id, "user", "сколько стоит обучение?", session=session)
+    await increment_irrelevant_count(user.id)
+
+
+async def run(title: str, scenario, updates: int):
+    queries = commits = 0
+    started_at = time.perf_counter()
+    for _ in range(updates):
+        with track_queries() as stats:
+            await scenario()
+        queries += stats.queries
+        commits += stats.commits
+    elapsed = time.perf_counter() - started_at
+    print(f"{title}:")
+    print(f"  запросов на апдейт: {queries / updates:.1f}, коммитов на апдейт: {commits / updates:.1f}")
+    print(f"  среднее время апдейта: {elapsed * 1000 / updates:.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Запросы и коммиты на один апдейт")
+    parser.add_argument("--updates", type=int, default=200)
+    args = parser.parse_args()
+
+    # Рабочую базу не трогаем: фабрику сессий переключаем на временный файл
+    tmp_dir = tempfile.TemporaryDirectory()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp_dir.name) / 'bench.db'}")
+    install_query_counter(engine)
+    async_session_factory.configure(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Пользователь уже существует: типичный апдейт от знакомого клиента
+    await get_or_create_user(TELEGRAM_ID, "bench")
+
+    await run("Отдельная сессия на каждую функцию", per_call_sessions, args.updates)
+    await run("Короткие единицы работы", short_units_of_work, args.updates)
+    await engine.dispose()
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,465 @@
+# benchmarks/fake_bitrix24.py
+#
+# Локальная замена REST API Битрикс24 для интеграционных и нагрузочных прогонов без портала.
+# Календари, задачи и комментарии хранятся в памяти. Реализованы все методы, которые вызывает
+# bitrix_service (app.info, user.get, calendar.section.get, calendar.event.get/add/update/delete,
+# tasks.task.add/update/delete/complete, task.commentitem.add), а также tasks.task.list с
+# постраничной выдачей через start/next и batch с подстановкой $result[...] и halt.
+# Задержка ответа и ошибки QUERY_LIMIT_EXCEEDED (по лимиту запросов в секунду и/или случайно)
+# настраиваются.
+#
+# Подключение к b24_client без сети:
+#     fake = FakeBitrix24(latency_ms=100); fake.add_teacher(1, "Анна", "Иванова")
+#     b24_client.start(transport=fake.transport())
+# Отдельный HTTP-сервер (например, для app/test_bitrix_token.py):
+#     python -m benchmarks.fake_bitrix24 --port 8024 --teachers 1,2,3 [--latency-ms 100] [--rate-limit 2]
+#     BITRIX24_WEBHOOK_URL=http://127.0.0.1:8024/rest/1/fake/
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+from zoneinfo import ZoneInfo
+
+import httpx
+
+B24_DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+RESULT_REF = re.compile(r"\$result\[([^\]]+)\]((?:\[[^\]]*\])*)")
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+class FakeB24Error(Exception):
+    def __init__(self, code: str, description: str, status: int = 400):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.status = status
+
+
+def parse_php_query(query: str) -> dict:
+    """Разбирает строку в формате PHP http_build_query: fields[TITLE]=...&ID[0]=... -> вложенный словарь."""
+    params: dict = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        parts = re.findall(r"[^\[\]]+", key)
+        if not parts:
+            continue
+        node = params
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return params
+
+
+class FakeBitrix24:
+    """
+    Портал Битрикс24 в памяти. Ответы повторяют формат настоящего REST API
+    ({"result": ...} или {"error": ..., "error_description": ...}), чтобы bitrix_service
+    работал с ним без изменений. stats считает HTTP-запросы, вызовы методов и ошибки лимита.
+    """
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, rate_limit: float = 0, burst: int = 50,
+                 limit_error_rate: float = 0.0, page_size: int = 50, tz: str = "Europe/Moscow"):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.limit_error_rate = limit_error_rate
+        self.page_size = page_size
+        self.tz = ZoneInfo(tz)
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._ids = {"event": 0, "task": 0, "comment": 0, "section": 0}
+        self.users: dict[int, dict] = {}
+        self.sections: dict[int, list] = {}
+        self.events: dict[int, dict] = {}
+        self.tasks: dict[int, dict] = {}
+        self.comments: dict[int, dict] = {}
+        self.stats = {"requests": 0, "limit_errors": 0, "connections": 0, "methods": {}}
+        self.methods = {
+            "app.info": self.app_info,
+            "user.get": self.user_get,
+            "calendar.section.get": self.section_get,
+            "calendar.event.get": self.event_get,
+            "calendar.event.add": self.event_add,
+            "calendar.event.update": self.event_update,
+            "calendar.event.delete": self.event_delete,
+            "tasks.task.add": self.task_add,
+            "tasks.task.update": self.task_update,
+            "tasks.task.delete": self.task_delete,
+            "tasks.task.complete": self.task_complete,
+            "tasks.task.list": self.task_list,
+            "task.commentitem.add": self.comment_add,
+        }
+
+    # --- Наполнение ---
+
+    def add_teacher(self, user_id: int, name: str = "", last_name: str = ""):
+        self.users[user_id] = {"ID": str(user_id), "NAME": name or f"Преподаватель {user_id}", "LAST_NAME": last_name}
+        self._section_for(user_id)
+
+    def add_busy(self, owner_id: int, start: datetime, end: datetime, name: str = "Занято") -> int:
+        return self.event_add({"type": "user", "ownerId": owner_id, "name": name,
+                               "from": start.isoformat(), "to": end.isoformat()})
+
+    def overlapping_events(self) -> list[tuple[int, int, int]]:
+        """Пары пересекающихся событий одного владельца: (владелец, событие, событие)."""
+        by_owner: dict[int, list] = {}
+        for event in self.events.values():
+            by_owner.setdefault(event["_owner"], []).append(event)
+        overlaps = []
+        for owner_id, events in by_owner.items():
+            events.sort(key=lambda event: event["_from"])
+            for previous, current in zip(events, events[1:]):
+                if current["_from"] < previous["_to"]:
+                    overlaps.append((owner_id, int(previous["ID"]), int(current["ID"])))
+        return overlaps
+
+    # --- Транспорт ---
+
+    async def handle(self, method: str, params: dict) -> tuple[int, dict]:
+        """Один HTTP-вызов REST API: задержка, проверка лимита, выполнение метода."""
+        self.stats["requests"] += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if not self._take_token() or random.random() < self.limit_error_rate:
+            self.stats["limit_errors"] += 1
+            return 503, {"error": "QUERY_LIMIT_EXCEEDED", "error_description": "Too many requests"}
+        try:
+            if method == "batch":
+                return 200, self.batch(params)
+            return 200, self._call(method, params)
+        except FakeB24Error as e:
+            return e.status, {"error": e.code, "error_description": e.description}
+
+    def transport(self) -> httpx.MockTransport:
+        """Транспорт httpx для b24_client.start(transport=...): сеть не используется."""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            method = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+            params = self._request_params(request.url.query.decode(), request.headers.get("content-type", ""), request.content)
+            status, payload = await self.handle(method.removesuffix(".json"), params)
+            return httpx.Response(status, json=payload)
+        return httpx.MockTransport(handler)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8024) -> asyncio.AbstractServer:
+        """Простой HTTP/1.1-сервер с keep-alive; адрес вебхука: http://host:port/rest/1/<любой токен>/"""
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                url = urlsplit(target)
+                method = url.path.rstrip("/").rsplit("/", 1)[-1].removesuffix(".json")
+                params = self._request_params(url.query, headers.get("content-type", ""), body)
+                status, payload = await self.handle(method, params)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _request_params(query: str, content_type: str, body: bytes) -> dict:
+        params = parse_php_query(query) if query else {}
+        if body:
+            if "json" in content_type or body.lstrip().startswith(b"{"):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_php_query(body.decode("utf-8")))
+        return params
+
+    def _take_token(self) -> bool:
+        if self.rate_limit <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate_limit)
+        self._updated_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _call(self, method: str, params: dict) -> dict:
+        handler = self.methods.get(method)
+        if handler is None:
+            raise FakeB24Error("ERROR_METHOD_NOT_FOUND", "Method not found!", status=404)
+        self.stats["methods"][method] = self.stats["methods"].get(method, 0) + 1
+        result = handler(params)
+        # Списочные методы возвращают (страница, next, total)
+        if isinstance(result, tuple):
+            items, next_start, total = result
+            response = {"result": items, "total": total}
+            if next_start is not None:
+                response["next"] = next_start
+            return response
+        return {"result": result}
+
+    # --- batch ---
+
+    def batch(self, params: dict) -> dict:
+        commands = params.get("cmd") or {}
+        if len(commands) > 50:
+            raise FakeB24Error("ERROR_BATCH_LENGTH_EXCEEDED", "Max batch length exceeded")
+        halt = str(params.get("halt", 0)) not in ("0", "", "False", "false")
+        results, errors, totals, nexts = {}, {}, {}, {}
+        for name, command in commands.items():
+            method, _, query = command.partition("?")
+            command_params = self._substitute(parse_php_query(query), results)
+            try:
+                response = self._call(method, command_params)
+            except FakeB24Error as e:
+                errors[name] = {"error": e.code, "error_description": e.description}
+                if halt:
+                    break
+                continue
+            results[name] = response["result"]
+            if "total" in response:
+                totals[name] = response["total"]
+            if "next" in response:
+                nexts[name] = response["next"]
+        return {"result": {
+            "result": results or [], "result_error": errors or [],
+            "result_total": totals or [], "result_next": nexts or [], "result_time": [],
+        }}
+
+    def _substitute(self, value, results: dict):
+        """Раскрывает ссылки $result[команда][ключ]... на результаты уже выполненных команд."""
+        if isinstance(value, dict):
+            return {key: self._substitute(item, results) for key, item in value.items()}
+        if not isinstance(value, str) or "$result" not in value:
+            return value
+
+        def resolve(match: re.Match) -> str:
+            node = results.get(match.group(1))
+            for key in re.findall(r"\[([^\]]*)\]", match.group(2)):
+                if isinstance(node, dict):
+                    node = node.get(key)
+                elif isinstance(node, list) and key.isdigit() and int(key) < len(node):
+                    node = node[int(key)]
+                else:
+                    node = None
+            return "" if node is None else str(node)
+        return RESULT_REF.sub(resolve, value)
+
+    # --- Методы ---
+
+    def app_info(self, params: dict) -> dict:
+        return {"ID": 1, "CODE": "fake.bitrix24", "VERSION": 1, "STATUS": "L", "INSTALLED": True}
+
+    def user_get(self, params: dict):
+        user_ids = params.get("ID") or (params.get("FILTER") or params.get("filter") or {}).get("ID")
+        if isinstance(user_ids, dict):
+            user_ids = list(user_ids.values())
+        if user_ids is None:
+            users = [self.users[user_id] for user_id in sorted(self.users)]
+        else:
+            wanted = {int(user_id) for user_id in (user_ids if isinstance(user_ids, list) else [user_ids])}
+            users = [self.users[user_id] for user_id in sorted(wanted) if user_id in self.users]
+        return self._page(users, params)
+
+    def section_get(self, params: dict) -> list:
+        self._require(params, "type", "ownerId")
+        return list(self._section_for(int(params["ownerId"])))
+
+    def event_get(self, params: dict) -> list:
+        self._require(params, "type", "ownerId")
+        owner_id = int(params["ownerId"])
+        date_from = self._parse_date(params["from"]) if params.get("from") else None
+        date_to = self._parse_date(params["to"]) if params.get("to") else None
+        events = [
+            event for event in self.events.values()
+            if event["_owner"] == owner_id
+            and (date_to is None or event["_from"] < date_to)
+            and (date_from is None or event["_to"] > date_from)
+        ]
+        return [self._public(event) for event in sorted(events, key=lambda event: event["_from"])]
+
+    def event_add(self, params: dict) -> int:
+        self._require(params, "type", "ownerId", "name", "from", "to")
+        owner_id = int(params["ownerId"])
+        start, end = self._parse_date(params["from"]), self._parse_date(params["to"])
+        if end < start:
+            raise FakeB24Error("ERROR_CORE", "Дата окончания события раньше даты начала")
+        self._ids["event"] += 1
+        event_id = self._ids["event"]
+        section_id = params.get("section") or self._section_for(owner_id)[0]["ID"]
+        self.events[event_id] = {
+            "ID": str(event_id), "NAME": params["name"], "DESCRIPTION": params.get("description", ""),
+            "OWNER_ID": str(owner_id), "SECTION_ID": str(section_id),
+            "ACCESSIBILITY": params.get("accessibility", "busy"),
+            "_owner": owner_id, "_from": start, "_to": end,
+        }
+        self._set_dates(self.events[event_id])
+        return event_id
+
+    def event_update(self, params: dict) -> int:
+        self._require(params, "id", "type", "ownerId")
+        event = self._event(params["id"])
+        if params.get("from"):
+            event["_from"] = self._parse_date(params["from"])
+        if params.get("to"):
+            event["_to"] = self._parse_date(params["to"])
+        for field, key in (("name", "NAME"), ("description", "DESCRIPTION"), ("accessibility", "ACCESSIBILITY")):
+            if field in params:
+                event[key] = params[field]
+        self._set_dates(event)
+        return int(event["ID"])
+
+    def event_delete(self, params: dict) -> bool:
+        self._require(params, "id")
+        event = self._event(params["id"])
+        del self.events[int(event["ID"])]
+        return True
+
+    def task_add(self, params: dict) -> dict:
+        fields = params.get("fields") or {}
+        if not fields.get("TITLE"):
+            raise FakeB24Error("ERROR_CORE", "Не указано название задачи")
+        self._ids["task"] += 1
+        task_id = self._ids["task"]
+        self.tasks[task_id] = {
+            "id": str(task_id), "title": fields["TITLE"], "description": fields.get("DESCRIPTION", ""),
+            "responsibleId": str(fields.get("RESPONSIBLE_ID", 1)), "groupId": str(fields.get("GROUP_ID", 0)),
+            "deadline": fields.get("DEADLINE"), "status": "2",
+        }
+        return {"task": dict(self.tasks[task_id])}
+
+    def task_update(self, params: dict) -> dict:
+        task = self._task(params.get("taskId"))
+        fields = params.get("fields") or {}
+        for field, key in (("TITLE", "title"), ("DESCRIPTION", "description"), ("DEADLINE", "deadline"),
+                           ("RESPONSIBLE_ID", "responsibleId")):
+            if field in fields:
+                task[key] = fields[field]
+        return {"task": dict(task)}
+
+    def task_delete(self, params: dict) -> dict:
+        task = self._task(params.get("taskId"))
+        del self.tasks[int(task["id"])]
+        return {"task": True}
+
+    def task_complete(self, params: dict) -> dict:
+        task = self._task(params.get("taskId"))
+        task["status"] = "5"
+        return {"task": dict(task)}
+
+    def task_list(self, params: dict):
+        tasks, next_start, total = self._page([dict(self.tasks[task_id]) for task_id in sorted(self.tasks)], params)
+        return {"tasks": tasks}, next_start, total
+
+    def comment_add(self, params: dict) -> int:
+        task = self._task(params.get("TASKID") or params.get("taskId"))
+        message = (params.get("FIELDS") or {}).get("POST_MESSAGE")
+        if not message:
+            raise FakeB24Error("ERROR_CORE", "Пустой комментарий")
+        self._ids["comment"] += 1
+        comment_id = self._ids["comment"]
+        self.comments[comment_id] = {"ID": str(comment_id), "TASK_ID": task["id"], "POST_MESSAGE": message}
+        return comment_id
+
+    # --- Вспомогательные ---
+
+    def _page(self, items: list, params: dict):
+        start = int(params.get("start") or 0)
+        page = items[start:start + self.page_size]
+        next_start = start + self.page_size if start + self.page_size < len(items) else None
+        return page, next_start, len(items)
+
+    def _section_for(self, owner_id: int) -> list:
+        if owner_id not in self.sections:
+            self._ids["section"] += 1
+            self.sections[owner_id] = [{"ID": str(self._ids["section"]), "NAME": "Мой календарь",
+                                        "OWNER_ID": str(owner_id), "CAL_TYPE": "user"}]
+        return self.sections[owner_id]
+
+    def _event(self, event_id) -> dict:
+        event = self.events.get(int(event_id)) if str(event_id).isdigit() else None
+        if event is None:
+            raise FakeB24Error("ERROR_CORE", f"Событие {event_id} не найдено")
+        return event
+
+    def _task(self, task_id) -> dict:
+        task = self.tasks.get(int(task_id)) if str(task_id).isdigit() else None
+        if task is None:
+            raise FakeB24Error("ERROR_TASK_NOT_FOUND", f"Задача {task_id} не найдена")
+        return task
+
+    @staticmethod
+    def _require(params: dict, *names: str):
+        missing = [name for name in names if params.get(name) in (None, "")]
+        if missing:
+            raise FakeB24Error("ERROR_ARGUMENT", f"Не заданы обязательные параметры: {', '.join(missing)}")
+
+    def _parse_date(self, value: str) -> datetime:
+        try:
+            parsed = datetime.strptime(value, B24_DATE_FORMAT)
+        except ValueError:
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                raise FakeB24Error("ERROR_ARGUMENT", f"Неверный формат даты: {value}")
+        return parsed.replace(tzinfo=self.tz) if parsed.tzinfo is None else parsed.astimezone(self.tz)
+
+    @staticmethod
+    def _set_dates(event: dict):
+        event["DATE_FROM"] = event["_from"].strftime(B24_DATE_FORMAT)
+        event["DATE_TO"] = event["_to"].strftime(B24_DATE_FORMAT)
+
+    @staticmethod
+    def _public(event: dict) -> dict:
+        return {key: value for key, value in event.items() if not key.startswith("_")}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер, имитирующий REST API Битрикс24")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8024)
+    parser.add_argument("--teachers", default="1", help="id преподавателей через запятую")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="запросов в секунду (0 — без лимита)")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--limit-error-rate", type=float, default=0.0, help="доля случайных QUERY_LIMIT_EXCEEDED")
+    args = parser.parse_args()
+
+    fake = FakeBitrix24(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_limit=args.rate_limit,
+                        burst=args.burst, limit_error_rate=args.limit_error_rate)
+    for teacher_id in args.teachers.split(","):
+        if teacher_id.strip().isdigit():
+            fake.add_teacher(int(teacher_id))
+    server = await fake.serve(args.host, args.port)
+    print(f"Фейковый Битрикс24 слушает: BITRIX24_WEBHOOK_URL=http://{args.host}:{args.port}/rest/1/fake/")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Статистика: {fake.stats}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,118 @@
+# tests/test_availability.py
+#
+# Свойства движка расписания app/services/availability.py на случайных календарях
+# (время расчета замеряет benchmarks/bench_availability.py).
+
+import random
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from app.services.availability import AvailabilityEngine, WorkingHours, free_slot_starts, merge_intervals
+
+TZ = ZoneInfo("Europe/Moscow")
+
+
+def random_busy(rng: random.Random, start: datetime, days: int, events_per_day: int) -> list:
+    """Занятость со случайными длительностями и пересечениями, в том числе вне рабочего времени."""
+    intervals = []
+    for day in range(days + 1):
+        base = start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=day)
+        for _ in range(rng.randint(0, events_per_day)):
+            busy_start = base + timedelta(minutes=rng.randrange(7 * 60, 21 * 60, 5))
+            intervals.append((busy_start, busy_start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90, 150)))))
+    rng.shuffle(intervals)
+    return intervals
+
+
+def brute_force(engine: AvailabilityEngine, busy, from_date, to_date, duration_minutes, now) -> list:
+    """Оракул: перебирает каждый слот сетки и сравнивает его со всеми интервалами."""
+    duration = timedelta(minutes=duration_minutes)
+    slots = []
+    for window_start, window_end in engine.working_hours.windows(from_date, to_date):
+        slot = window_start
+        while slot + duration <= window_end:
+            overlaps = any(
+                slot < busy_end + engine.buffer and busy_start - engine.buffer < slot + duration
+                for busy_start, busy_end in busy
+            )
+            if not overlaps and (now is None or slot >= now):
+                slots.append(slot)
+            slot += engine.step
+    return slots
+
+
+def test_merge_intervals_sorts_and_joins_overlapping_and_touching():
+    t = datetime(2025, 3, 3, 10, tzinfo=TZ)
+    h = timedelta(hours=1)
+    merged = merge_intervals([(t + 3 * h, t + 4 * h), (t, t + h), (t + h, t + 2 * h), (t + h / 2, t + h / 2)])
+    assert merged == [(t, t + 2 * h), (t + 3 * h, t + 4 * h)]
+
+
+def test_merge_intervals_padding_joins_close_intervals():
+    t = datetime(2025, 3, 3, 10, tzinfo=TZ)
+    m = timedelta(minutes=1)
+    merged = merge_intervals([(t, t + 60 * m), (t + 80 * m, t + 120 * m)], padding=10 * m)
+    assert merged == [(t - 10 * m, t + 130 * m)]
+
+
+def test_free_slot_starts_respects_busy_and_not_before():
+    day = datetime(2025, 3, 3, tzinfo=TZ)
+    windows = [(day.replace(hour=10), day.replace(hour=14))]
+    busy = [(day.replace(hour=11, minute=30), day.replace(hour=12))]
+    starts = free_slot_starts(busy, windows, timedelta(hours=1), timedelta(minutes=30),
+                              not_before=day.replace(hour=10, minute=10))
+    assert [s.strftime("%H:%M") for s in starts] == ["10:30", "12:00", "12:30", "13:00"]
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_teacher_slots_properties(seed):
+    rng = random.Random(seed)
+    working_hours = WorkingHours(
+        time(rng.choice((8, 9, 10)), rng.choice((0, 30))),
+        time(rng.choice((17, 18, 20)), rng.choice((0, 30))),
+        rng.sample(range(7), k=rng.randint(1, 7)),
+    )
+    engine = AvailabilityEngine(
+        working_hours,
+        step_minutes=rng.choice((15, 30, 60)),
+        buffer_minutes=rng.choice((0, 10, 15)),
+    )
+    from_date = datetime(2025, 3, 3, rng.randint(0, 23), rng.choice((0, 7, 30)), tzinfo=TZ)
+    to_date = from_date + timedelta(days=rng.randint(1, 10))
+    now = from_date + timedelta(minutes=rng.randint(0, 600)) if rng.random() < 0.5 else None
+    duration = rng.choice((30, 45, 60, 90))
+    busy = random_busy(rng, from_date, 10, 5)
+
+    slots = engine.teacher_slots(busy, from_date, to_date, duration, now)
+
+    for slot in slots:
+        slot_end = slot + timedelta(minutes=duration)
+        assert not any(slot < end + engine.buffer and start - engine.buffer < slot_end for start, end in busy)
+        window_start = slot.replace(hour=working_hours.start.hour, minute=working_hours.start.minute)
+        window_end = slot.replace(hour=working_hours.end.hour, minute=working_hours.end.minute)
+        assert slot.weekday() in working_hours.weekdays
+        assert window_start <= slot and slot_end <= window_end
+        assert (slot - window_start) % engine.step == timedelta(0)
+    assert slots == brute_force(engine, busy, from_date, to_date, duration, now)
+
+
+def test_slots_by_date_lists_only_free_teachers():
+    rng = random.Random(1)
+    engine = AvailabilityEngine(WorkingHours(time(10), time(18)), step_minutes=60)
+    from_date = datetime(2025, 3, 3, 9, 0, tzinfo=TZ)
+    to_date = from_date + timedelta(days=7)
+    calendars = {teacher_id: random_busy(rng, from_date, 7, 6) for teacher_id in range(1, 6)}
+
+    expected = {}
+    for teacher_id, busy in calendars.items():
+        for start in brute_force(engine, busy, from_date, to_date, 60, from_date):
+            expected.setdefault(start, []).append(teacher_id)
+
+    slots = engine.slots_by_date(calendars, from_date, to_date, 60, now=from_date)
+    actual = {
+        datetime.fromisoformat(f"{day}T{slot['time']}").replace(tzinfo=TZ): slot["user_ids"]
+        for day, day_slots in slots.items() for slot in day_slots
+    }
+    assert actual == expected
@@ -0,0 +1,62 @@
+# tests/test_availability_cache.py
+
+import asyncio
+import time
+
+from app.services import b24_client as b24
+from app.services.availability_cache import AvailabilityCache, _Entry
+
+
+def test_user_joining_background_refresh_promotes_it():
+    async def scenario():
+        limiter = b24.RateLimiter(rate=20, burst=1)
+        await limiter.acquire()  # запас исчерпан: дальше все ждут в очереди
+        order = []
+
+        async def call(name):
+            await limiter.acquire(b24._priority.get())
+            order.append(name)
+
+        cache = AvailabilityCache(ttl_seconds=0, stale_seconds=60)
+        cache._entries["slots"] = _Entry({"old": 1}, time.monotonic())
+
+        async def fetch_slots():
+            await call("refresh")
+            return {"new": 1}
+
+        # Устаревшая запись: отдается сразу, обновление уходит в фон с низким приоритетом
+        assert await cache.get("slots", fetch_slots) == {"old": 1}
+        await asyncio.sleep(0)
+        # Другой пользователь уже ждет токен с высоким приоритетом
+        other = asyncio.create_task(call("other_user"))
+        await asyncio.sleep(0)
+        # Запись вышла за пределы stale: пользователь промахивается и присоединяется к обновлению
+        cache._entries.clear()
+        assert await cache.get("slots", fetch_slots) == {"new": 1}
+        await other
+        return order
+
+    # Без повышения обновление (LOW) ушло бы после запроса другого пользователя (HIGH);
+    # с повышением приоритеты равны и порядок — по времени постановки в очередь
+    assert asyncio.run(scenario()) == ["refresh", "other_user"]
+
+
+def test_background_refresh_stays_low_without_user_waiting():
+    async def scenario():
+        limiter = b24.RateLimiter(rate=20, burst=1)
+        await limiter.acquire()
+        order = []
+
+        async def call(name):
+            await limiter.acquire(b24._priority.get())
+            order.append(name)
+
+        shared = b24.SharedPriority()
+        with b24.background_priority(shared):
+            background = asyncio.create_task(call("refresh"))
+        await asyncio.sleep(0)
+        user = asyncio.create_task(call("user"))
+        await asyncio.gather(background, user)
+        return order
+
+    assert asyncio.run(scenario()) == ["user", "refresh"]
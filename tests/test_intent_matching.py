@@ -0,0 +1,30 @@
+# tests/test_intent_matching.py
+#
+# Запуск из корня проекта:
+#     python -m pytest tests
+
+from app.utils.normalization import find_keyword_intent, normalize_message, prepare_keywords
+
+
+def test_exact_match_of_later_intent_beats_lemma_match_of_earlier():
+    # "записали" по лемме совпадает с "записать" первого интента,
+    # но у второго интента есть точная фраза — она и должна победить
+    keywords = {
+        "booking": prepare_keywords(["записать"]),
+        "already_enrolled": prepare_keywords(["записали"]),
+    }
+    assert find_keyword_intent(normalize_message("Нас уже записали"), keywords) == ("already_enrolled", "записали")
+
+
+def test_lemma_match_is_used_when_no_exact_match():
+    keywords = {
+        "booking": prepare_keywords(["записать ребенка"]),
+        "cancel": prepare_keywords(["отменить урок"]),
+    }
+    assert find_keyword_intent(normalize_message("Хочу записать ребёнка"), keywords) == ("booking", "записать ребенка")
+    assert find_keyword_intent(normalize_message("Мы отменили урок"), keywords) == ("cancel", "отменить урок")
+
+
+def test_no_match():
+    keywords = {"booking": prepare_keywords(["записать"])}
+    assert find_keyword_intent(normalize_message("Сколько стоит?"), keywords) is None
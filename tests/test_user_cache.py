@@ -0,0 +1,53 @@
+# tests/test_user_cache.py
+
+from app.db.models import TrialLesson, TrialLessonStatus, User
+from app.db.user_cache import UserCache
+
+
+def test_returned_user_is_a_copy():
+    cache = UserCache()
+    cache.put_user(User(id=1, telegram_id=10, user_data={"child_name": "Петя"}, is_blocked=True))
+
+    user = cache.get_user(10)
+    user.user_data["child_name"] = "Вася"
+    user.is_blocked = False
+
+    assert cache.get_user(10).user_data == {"child_name": "Петя"}
+    assert cache.is_blocked(10)
+
+
+def test_put_after_invalidation_is_ignored():
+    # Читатель загрузил строку до коммита, сбросившего кэш, а положить ее пытается после
+    cache = UserCache()
+    cache.put_user(User(id=1, telegram_id=10, is_blocked=False))
+    generation = cache.generation()
+    cache.invalidate(user_id=1)
+    cache.put_user(User(id=1, telegram_id=10, is_blocked=False), generation)
+    assert cache.get_user(10) is None
+
+    # Сброс по внутреннему id, когда пользователя в кэше еще не было
+    generation = cache.generation()
+    cache.invalidate(user_id=2)
+    cache.put_user(User(id=2, telegram_id=20), generation)
+    assert cache.get_user(20) is None
+
+    cache.put_user(User(id=2, telegram_id=20), cache.generation())
+    assert cache.get_user(20).id == 2
+
+
+def test_lessons_are_stored_as_copies_and_respect_generation():
+    cache = UserCache()
+    cache.put_user(User(id=1, telegram_id=10))
+    lesson = TrialLesson(id=7, user_id=1, status=TrialLessonStatus.PLANNED)
+    lesson.user = User(id=1, telegram_id=10, user_data={"child_name": "Петя"})
+
+    generation = cache.generation()
+    cache.put_lessons(1, [lesson], generation)
+    cached = cache.get_lessons(1)
+    cached[0].user.user_data["child_name"] = "Вася"
+    assert cache.get_lessons(1)[0].user.user_data == {"child_name": "Петя"}
+
+    cache.invalidate(user_id=1)
+    cache.put_user(User(id=1, telegram_id=10))
+    cache.put_lessons(1, [lesson], generation)
+    assert cache.get_lessons(1) is None